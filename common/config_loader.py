@@ -1,8 +1,15 @@
 import yaml
 import os
+import copy
+import logging
+import tempfile
+import threading
+
+logger = logging.getLogger(__name__)
 
 # root所有のファイルを読み取る
-with open("/etc/nvr/install_paths", "r") as f:
+# （NVR_INSTALL_PATHS で別の設定ツリーを指定できる。web/backend/bench_load.py などの検証用）
+with open(os.environ.get("NVR_INSTALL_PATHS", "/etc/nvr/install_paths"), "r") as f:
     _paths = yaml.safe_load(f)
 
 # 定数として定義
@@ -69,15 +76,162 @@ RECORDS_DIR_BASE = _get_required_config("common.records_dir_base")
 EVENTS_DIR_BASE = _get_required_config("common.events_dir_base")
 MOTION_TMP_BASE = _get_required_config("common.motion_tmp_base")
 
-def load_camera_config(cam):
-    public_path = os.path.join(NVR_CONFIG_CAM_DIR,f"{cam}.yaml")
-    secret_path = os.path.join(NVR_CONFIG_CAM_SECRET_DIR,f"{cam}.yaml")
+# Event metadata index (SQLite). Defaults to a file next to the event tree.
+EVENT_INDEX_DB = get_config_value(_main_config, "common.event_index_db",
+                                  os.path.join(EVENTS_DIR_BASE, "events.sqlite3"))
+
+# ffprobe result cache (SQLite), shared by all API workers.
+MEDIA_CACHE_DB = get_config_value(_main_config, "common.media_cache_db",
+                                  os.path.join(RECORDS_DIR_BASE, "media_cache.sqlite3"))
+
+# Event thumbnail / contact sheet cache directory.
+THUMB_CACHE_DIR = get_config_value(_main_config, "common.thumb_cache_dir",
+                                   os.path.join(EVENTS_DIR_BASE, ".thumb_cache"))
+
+# Playback MP4s remuxed from closed recording segments.
+REMUX_CACHE_DIR = get_config_value(_main_config, "common.remux_cache_dir",
+                                   os.path.join(RECORDS_DIR_BASE, ".remux_cache"))
+REMUX_CACHE_MAX_MB = int(get_config_value(_main_config, "common.remux_cache_max_mb", 4096))
+
+# ffmpeg / ffprobe jobs started by the Web API (see common/media_jobs.py).
+MEDIA_JOBS_MAX_CONCURRENT = int(get_config_value(_main_config, "common.media_jobs.max_concurrent", 2))
+MEDIA_JOBS_QUEUE_TIMEOUT = float(get_config_value(_main_config, "common.media_jobs.queue_timeout_sec", 15))
+
+# Web API worker threads (see web/backend/api/blocking.py).
+#   threads: default threadpool size; concurrency: per-pool limits for blocking work.
+WEB_THREADS = int(get_config_value(_main_config, "common.web.threads", 40))
+WEB_CONCURRENCY = {
+    "listing": 4,   # event / frame / camera listings (SQLite, directory walks)
+    "files": 8,     # single-file reads and writes, deletions
+    "media": 4,     # thumbnails, contact sheets, mosaic, remux
+    "jobs": 16,     # requests waiting for an ffmpeg slot (media_jobs)
+    "system": 2,    # systemctl, disk usage
+}
+WEB_CONCURRENCY.update(get_config_value(_main_config, "common.web.concurrency", {}))
+
+# Camera list status (see web/backend/api/camera_status.py).
+CAMERA_STATUS_CACHE_TTL = float(get_config_value(_main_config, "common.camera_status.cache_ttl_sec", 3))
+CAMERA_STATUS_STALE_FRAME_SEC = float(get_config_value(_main_config, "common.camera_status.stale_frame_sec", 30))
+CAMERA_STATUS_STALE_SEGMENT_SEC = float(get_config_value(_main_config, "common.camera_status.stale_segment_sec", 120))
+
+# Prometheus metrics (see common/metrics.py). Detector / event handler processes
+# publish snapshots to METRICS_DIR every METRICS_INTERVAL seconds.
+METRICS_ENABLED = bool(get_config_value(_main_config, "common.metrics.enabled", True))
+METRICS_INTERVAL = float(get_config_value(_main_config, "common.metrics.interval_sec", 5))
+METRICS_DIR = get_config_value(_main_config, "common.metrics.dir", os.path.join(MOTION_TMP_BASE, "metrics"))
+
+# ---------------------------------------------------------
+# カメラ設定のキャッシュ
+#   公開 / secret YAML の (mtime, inode, size) が変わらない限り再パースしない。
+#   パースや検証に失敗した場合（書き込み途中・記述ミス）は直前の正常な
+#   スナップショットを使い続ける。呼び出し側には毎回コピーを返す。
+# ---------------------------------------------------------
+# 数値でなければならない motion 設定
+_NUMERIC_MOTION_KEYS = ("threshold", "min_area", "blur", "noise_v_kernel_height", "max_aspect_ratio",
+                        "scale", "gate_threshold", "bg_update_interval")
+
+_camera_cache = {}      # cam -> (signature, config)
+_camera_cache_lock = threading.Lock()
+
+
+def _file_signature(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_ino, st.st_size
+
+
+def _camera_config_paths(cam):
+    return (os.path.join(NVR_CONFIG_CAM_DIR, f"{cam}.yaml"),
+            os.path.join(NVR_CONFIG_CAM_SECRET_DIR, f"{cam}.yaml"))
+
+
+def camera_config_signature(cam):
+    """
+    Signature of every file a camera's effective configuration depends on
+    (camera YAML + secret, main.yaml + secret). Changes whenever one of them
+    is rewritten.
+    """
+    public_path, secret_path = _camera_config_paths(cam)
+    return tuple(_file_signature(p) for p in
+                 (public_path, secret_path, NVR_CONFIG_MAIN_FILE, NVR_CONFIG_MAIN_SECRET_FILE))
+
+
+def validate_camera_config(config):
+    """
+    Raise ValueError if a parsed camera configuration has the wrong shape.
+    """
+    if not isinstance(config, dict):
+        raise ValueError("camera configuration must be a mapping")
+    motion = config.get("motion", {})
+    if not isinstance(motion, dict):
+        raise ValueError("motion must be a mapping")
+    for key in _NUMERIC_MOTION_KEYS:
+        val = motion.get(key)
+        if val is not None and (isinstance(val, bool) or not isinstance(val, (int, float))):
+            raise ValueError(f"motion.{key} must be a number, got {val!r}")
 
+
+def _read_camera_config(public_path, secret_path):
     with open(public_path, "r") as f:
         config = yaml.safe_load(f) or {}
-        
+
     if os.path.exists(secret_path):
         with open(secret_path, "r") as f:
             secrets = yaml.safe_load(f) or {}
             _deep_update(config, secrets)
-    return config
\ No newline at end of file
+    validate_camera_config(config)
+    return config
+
+
+def load_camera_config(cam):
+    public_path, secret_path = _camera_config_paths(cam)
+    # 読む前に stat する（読み込み中に更新されても次回の呼び出しで読み直される）
+    signature = (_file_signature(public_path), _file_signature(secret_path))
+
+    with _camera_cache_lock:
+        cached = _camera_cache.get(cam)
+    if cached is not None and cached[0] == signature:
+        return copy.deepcopy(cached[1])
+
+    try:
+        config = _read_camera_config(public_path, secret_path)
+    except FileNotFoundError:
+        with _camera_cache_lock:
+            _camera_cache.pop(cam, None)
+        raise
+    except (yaml.YAMLError, ValueError) as e:
+        if cached is None:
+            raise
+        logger.warning(f"Invalid configuration for {cam}, keeping the previous one: {e}")
+        return copy.deepcopy(cached[1])
+
+    with _camera_cache_lock:
+        _camera_cache[cam] = (signature, config)
+    return copy.deepcopy(config)
+
+
+def write_camera_config(cam, data):
+    """
+    Atomically replace the public YAML of a camera (temp file + rename), so
+    readers never see a partially written file.
+    """
+    validate_camera_config(data)
+    public_path, _ = _camera_config_paths(cam)
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{cam}.", suffix=".yaml.tmp", dir=os.path.dirname(public_path))
+    try:
+        with os.fdopen(fd, "w") as stream:
+            yaml.safe_dump(data, stream, default_flow_style=False)
+            stream.flush()
+            os.fsync(stream.fileno())
+        if os.path.exists(public_path):
+            st = os.stat(public_path)
+            os.chmod(tmp_path, st.st_mode & 0o7777)
+        os.replace(tmp_path, public_path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
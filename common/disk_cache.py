@@ -0,0 +1,107 @@
+import os
+import time
+import logging
+import threading
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------
+# disk_cache.py
+#   生成物（サムネイル・再生用 MP4 など）をディレクトリに置くキャッシュの共通部分
+#
+#   - 参照時刻はファイルの mtime で管理する（noatime でも動くように）
+#   - 合計サイズが上限を超えたら mtime の古いものから削除する（LRU）
+# ---------------------------------------------------------
+
+# 参照時刻（mtime）を更新する間隔（ヒットのたびに書き込まないように）
+TOUCH_INTERVAL = 3600.0
+# 容量チェックの最小間隔（秒）
+EVICT_INTERVAL = 60.0
+
+
+class DiskCache:
+    def __init__(self, cache_dir: str, max_bytes: int, name: str = "cache"):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.name = name
+        self._lock = threading.Lock()
+        self._last_evict = 0.0
+
+    def lookup(self, path: str) -> Optional[str]:
+        """
+        Return path if it exists, refreshing its LRU timestamp.
+        """
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        if time.time() - st.st_mtime > TOUCH_INTERVAL:
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+        return path
+
+    def tmp_path(self, path: str) -> str:
+        """
+        Per-writer temporary name next to path (renamed into place by commit()).
+        """
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        root, ext = os.path.splitext(path)
+        return f"{root}.{os.getpid()}.{threading.get_ident()}.tmp{ext}"
+
+    def commit(self, tmp: str, path: str) -> str:
+        os.replace(tmp, path)
+        self.maybe_evict()
+        return path
+
+    def store(self, path: str, data: bytes) -> str:
+        tmp = self.tmp_path(path)
+        with open(tmp, "wb") as f:
+            f.write(data)
+        return self.commit(tmp, path)
+
+    def maybe_evict(self):
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_evict < EVICT_INTERVAL:
+                return
+            self._last_evict = now
+        self.evict()
+
+    def evict(self) -> int:
+        """
+        Delete least recently used files until the cache fits in max_bytes.
+        Returns the number of files removed.
+        """
+        entries: List[Tuple[float, int, str]] = []
+        total = 0
+        for root, _dirs, files in os.walk(self.cache_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+        if total <= self.max_bytes:
+            return 0
+
+        removed = 0
+        for _mtime, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            total -= size
+            removed += 1
+            try:
+                os.rmdir(os.path.dirname(path))
+            except OSError:
+                pass
+        logger.info(f"{self.name}: evicted {removed} files")
+        return removed
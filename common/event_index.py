@@ -0,0 +1,537 @@
+import os
+import sys
+import json
+import base64
+import binascii
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Optional, List, Dict, Any, Sequence, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+# The event tree (<events_dir_base>/<cam>/<YYYY>/<MM>/<event_id>/event.json)
+# stays the source of truth. This index only mirrors it so that the Web API
+# can filter events without walking directories and opening every event.json.
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    camera   TEXT NOT NULL,
+    event_id TEXT NOT NULL,
+    year     TEXT NOT NULL,
+    month    TEXT NOT NULL,
+    ev_date  TEXT NOT NULL,
+    ev_time  TEXT NOT NULL,
+    ts       REAL NOT NULL,
+    ts_end   REAL,
+    meta     TEXT NOT NULL,
+    PRIMARY KEY (camera, event_id)
+);
+-- 一覧の並び順（ts, camera, event_id）そのままの索引。カーソルの続きから読める
+DROP INDEX IF EXISTS idx_events_ts;
+DROP INDEX IF EXISTS idx_events_cam_ts;
+CREATE INDEX IF NOT EXISTS idx_events_order ON events (ts, camera, event_id);
+CREATE INDEX IF NOT EXISTS idx_events_cam_order ON events (camera, ts, event_id);
+CREATE INDEX IF NOT EXISTS idx_events_date ON events (ev_date, ev_time);
+CREATE TABLE IF NOT EXISTS index_info (
+    key   TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS activity (
+    camera     TEXT NOT NULL,
+    minute     INTEGER NOT NULL,
+    events     INTEGER NOT NULL,
+    motion_sec REAL NOT NULL,
+    PRIMARY KEY (camera, minute)
+) WITHOUT ROWID;
+"""
+
+# Activity aggregates: per camera and minute (epoch seconds of the minute
+# start), the number of events that started in it and the seconds of event
+# time that fall into it. Only non-empty minutes are stored; they are
+# adjusted in the same transaction as every upsert / delete of an event.
+ACTIVITY_BUCKET_SEC = 60
+# Bump when the way activity is derived from an event changes
+ACTIVITY_VERSION = "1"
+
+
+def _parse_event_id(event_id: str) -> Optional[datetime]:
+    """
+    Parse the start time encoded in an event_id (YYYYMMDD_HHMMSS).
+    """
+    try:
+        return datetime.strptime(event_id[:15], "%Y%m%d_%H%M%S")
+    except ValueError:
+        return None
+
+
+def _to_epoch(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def _activity_of(ts: float, ts_end: Optional[float], duration: Optional[float]) -> Dict[int, List[float]]:
+    """
+    {minute: [events, motion_sec]} contributed by one event. The event
+    counts in the minute it started; once it is closed, its duration
+    (start to last kept frame) is spread over the minutes it covers.
+    """
+    first = int(ts // ACTIVITY_BUCKET_SEC) * ACTIVITY_BUCKET_SEC
+    result = {first: [1, 0.0]}
+    if ts_end is None or not duration or duration <= 0:
+        return result
+    end = ts + duration
+    minute = first
+    while minute < end:
+        overlap = min(end, minute + ACTIVITY_BUCKET_SEC) - max(ts, minute)
+        if overlap > 0:
+            result.setdefault(minute, [0, 0.0])[1] += overlap
+        minute += ACTIVITY_BUCKET_SEC
+    return result
+
+
+def encode_cursor(ts: float, camera: str, event_id: str) -> str:
+    """
+    Opaque page cursor: the sort key of the last event of a page.
+    """
+    raw = json.dumps([ts, camera, event_id], ensure_ascii=False, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[float, str, str]:
+    """
+    (ts, camera, event_id) of a cursor; ValueError if it is malformed.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        ts, camera, event_id = json.loads(raw)
+        return float(ts), str(camera), str(event_id)
+    except (TypeError, ValueError, UnicodeDecodeError, binascii.Error) as e:
+        raise ValueError(f"invalid cursor: {cursor!r}") from e
+
+
+def split_event_dir(event_dir: str) -> tuple[str, str, str, str]:
+    """
+    Split <...>/<cam>/<YYYY>/<MM>/<event_id> into (cam, YYYY, MM, event_id).
+    """
+    event_dir = os.path.normpath(event_dir)
+    month_dir, event_id = os.path.split(event_dir)
+    year_dir, month = os.path.split(month_dir)
+    cam_dir, year = os.path.split(year_dir)
+    camera = os.path.basename(cam_dir)
+    return camera, year, month, event_id
+
+
+class EventIndex:
+    """
+    SQLite-backed index of event.json metadata.
+
+    One connection is kept per thread; WAL mode lets the event handlers
+    write while API workers read.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            return conn
+
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=10000")
+
+        with self._init_lock:
+            if not self._initialized:
+                conn.executescript(_SCHEMA)
+                # 集計テーブルの追加前に作られたインデックスは既存のイベントから作り直す
+                row = conn.execute("SELECT value FROM index_info WHERE key = 'activity_version'").fetchone()
+                if row is None or row[0] != ACTIVITY_VERSION:
+                    self._rebuild_activity(conn)
+                self._initialized = True
+
+        self._local.conn = conn
+        return conn
+
+    # -----------------------------------------------------
+    # 書き込み
+    # -----------------------------------------------------
+    def _row_for(self, camera: str, year: str, month: str, event_id: str, meta: Dict[str, Any]) -> tuple:
+        start = _parse_event_id(event_id)
+        ts = _to_epoch(meta.get("timestamp"))
+        if ts is None:
+            ts = start.timestamp() if start else 0.0
+        ev_date = event_id[:8] if start else ""
+        ev_time = event_id[9:15] if start else ""
+        return (
+            camera, event_id, year, month, ev_date, ev_time,
+            ts, _to_epoch(meta.get("timestamp_end")),
+            json.dumps(meta, ensure_ascii=False),
+        )
+
+    @contextmanager
+    def _transaction(self, conn: sqlite3.Connection):
+        # rebuild() already holds a transaction around its upserts
+        if conn.in_transaction:
+            yield
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    @staticmethod
+    def _add_activity(conn: sqlite3.Connection, camera: str, activity: Dict[int, List[float]], sign: int):
+        for minute, (events, motion) in activity.items():
+            conn.execute(
+                "INSERT INTO activity (camera, minute, events, motion_sec) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (camera, minute) DO UPDATE SET "
+                "events = events + excluded.events, motion_sec = motion_sec + excluded.motion_sec",
+                (camera, minute, sign * events, sign * motion),
+            )
+        if sign < 0:
+            # 丸め誤差で残った空の分を消す
+            conn.execute(
+                f"DELETE FROM activity WHERE camera = ? AND minute IN ({','.join('?' * len(activity))}) "
+                "AND events <= 0 AND motion_sec < 0.001",
+                (camera, *activity),
+            )
+
+    def _stored_activity(self, conn: sqlite3.Connection, camera: str, event_id: str) -> Optional[Dict[int, List[float]]]:
+        row = conn.execute(
+            "SELECT ts, ts_end, json_extract(meta, '$.duration_sec') AS duration "
+            "FROM events WHERE camera = ? AND event_id = ?",
+            (camera, event_id),
+        ).fetchone()
+        return _activity_of(row["ts"], row["ts_end"], row["duration"]) if row else None
+
+    def upsert(self, camera: str, year: str, month: str, event_id: str, meta: Dict[str, Any]):
+        """
+        Insert or replace the metadata of a single event (and move its
+        contribution to the activity aggregates).
+        """
+        row = self._row_for(camera, year, month, event_id, meta)
+        conn = self._connect()
+        with self._transaction(conn):
+            old = self._stored_activity(conn, camera, event_id)
+            if old:
+                self._add_activity(conn, camera, old, -1)
+            conn.execute(
+                "INSERT OR REPLACE INTO events "
+                "(camera, event_id, year, month, ev_date, ev_time, ts, ts_end, meta) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                row,
+            )
+            self._add_activity(conn, camera, _activity_of(row[6], row[7], meta.get("duration_sec")), 1)
+
+    def upsert_from_dir(self, event_dir: str) -> bool:
+        """
+        (Re)index an event directory from its event.json.
+        """
+        json_path = os.path.join(event_dir, "event.json")
+        try:
+            with open(json_path, "r") as f:
+                meta = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"Failed to read {json_path}: {e}")
+            return False
+
+        camera, year, month, event_id = split_event_dir(event_dir)
+        self.upsert(camera, year, month, event_id, meta)
+        return True
+
+    def delete(self, camera: str, event_id: str) -> bool:
+        conn = self._connect()
+        with self._transaction(conn):
+            old = self._stored_activity(conn, camera, event_id)
+            if old is None:
+                return False
+            self._add_activity(conn, camera, old, -1)
+            conn.execute(
+                "DELETE FROM events WHERE camera = ? AND event_id = ?",
+                (camera, event_id),
+            )
+        return True
+
+    # -----------------------------------------------------
+    # 参照
+    # -----------------------------------------------------
+    @staticmethod
+    def _row_to_meta(row: sqlite3.Row) -> Dict[str, Any]:
+        meta = json.loads(row["meta"])
+        meta["event_id"] = row["event_id"]
+        meta["year"] = row["year"]
+        meta["month"] = row["month"]
+        meta.setdefault("camera", row["camera"])
+        return meta
+
+    def get(self, camera: str, event_id: str) -> Optional[Dict[str, Any]]:
+        row = self._connect().execute(
+            "SELECT * FROM events WHERE camera = ? AND event_id = ?",
+            (camera, event_id),
+        ).fetchone()
+        return self._row_to_meta(row) if row else None
+
+    def query_page(
+        self,
+        camera: Union[str, Sequence[str], None] = None,
+        date: Optional[str] = None,
+        start_time: Optional[str] = None,
+        end_time: Optional[str] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        cursor: Optional[str] = None,
+        limit: int = 60,
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        One page of events newest first (ordered by timestamp, camera,
+        event_id) and the cursor of the next page (None on the last page).
+
+        camera is one name or several (merged in time order). date is
+        YYYYMMDD, start_time / end_time are HHMMSS (both required for the
+        time filter, matching the previous directory walk). since / until
+        are epoch seconds, [since, until). cursor is a next-page cursor
+        from a previous call with the same filters; the page continues
+        strictly after it through the (ts, camera, event_id) index, so
+        every page costs the same however deep it is.
+        """
+        where = []
+        params: list = []
+        cameras = [camera] if isinstance(camera, str) else list(camera or [])
+        if len(cameras) == 1:
+            where.append("camera = ?")
+            params.append(cameras[0])
+        elif cameras:
+            # 複数カメラは時刻順の索引を逆順にたどって絞る（"+" でカメラ側の索引を使わせない。
+            # カメラ別に集めて並べ替えると、ページの深さに比例して遅くなる）
+            where.append(f"+camera IN ({','.join('?' * len(cameras))})")
+            params.extend(cameras)
+        if date:
+            where.append("ev_date = ?")
+            params.append(date)
+        if start_time and end_time:
+            where.append("ev_time BETWEEN ? AND ?")
+            params.extend([start_time, end_time])
+        if since is not None:
+            where.append("ts >= ?")
+            params.append(since)
+        if until is not None:
+            where.append("ts < ?")
+            params.append(until)
+        if cursor:
+            where.append("(ts, camera, event_id) < (?, ?, ?)")
+            params.extend(decode_cursor(cursor))
+
+        sql = "SELECT * FROM events"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY ts DESC, camera DESC, event_id DESC LIMIT ?"
+        # 1 件多く読んで次のページがあるかを判定する
+        params.append(limit + 1)
+
+        rows = self._connect().execute(sql, params).fetchall()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            next_cursor = encode_cursor(last["ts"], last["camera"], last["event_id"])
+        return [self._row_to_meta(r) for r in rows], next_cursor
+
+    def query(self, *args, **kwargs) -> List[Dict[str, Any]]:
+        """
+        Events newest first (the first page of query_page()).
+        """
+        return self.query_page(*args, **kwargs)[0]
+
+    def summaries(self, camera: str) -> List[Dict[str, Any]]:
+        """
+        Oldest first: event_id, year, month, ts, ts_end and size (the
+        event's total_size_bytes, None if unknown) of every event of a
+        camera. Used for retention accounting without reading event.json.
+        """
+        rows = self._connect().execute(
+            "SELECT event_id, year, month, ts, ts_end, "
+            "json_extract(meta, '$.total_size_bytes') AS size "
+            "FROM events WHERE camera = ? ORDER BY ts, event_id",
+            (camera,),
+        ).fetchall()
+        return [dict(r) for r in rows]
+
+    def activity(self, start: float, end: float, camera: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Non-empty activity minutes in [start, end), oldest first:
+        camera, minute (epoch seconds), events, motion_sec.
+        """
+        sql = "SELECT camera, minute, events, motion_sec FROM activity WHERE minute >= ? AND minute < ?"
+        params: list = [int(start // ACTIVITY_BUCKET_SEC) * ACTIVITY_BUCKET_SEC, end]
+        if camera:
+            sql = ("SELECT camera, minute, events, motion_sec FROM activity "
+                   "WHERE camera = ? AND minute >= ? AND minute < ?")
+            params.insert(0, camera)
+        rows = self._connect().execute(sql + " ORDER BY minute", params).fetchall()
+        return [dict(r) for r in rows]
+
+    def count(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM events").fetchone()[0]
+
+    def get_info(self, key: str) -> Optional[str]:
+        row = self._connect().execute(
+            "SELECT value FROM index_info WHERE key = ?", (key,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def set_info(self, key: str, value: str):
+        self._connect().execute(
+            "INSERT OR REPLACE INTO index_info (key, value) VALUES (?, ?)", (key, value)
+        )
+
+    # -----------------------------------------------------
+    # 再構築
+    # -----------------------------------------------------
+    @staticmethod
+    def _rebuild_activity(conn: sqlite3.Connection):
+        """
+        Recompute the activity aggregates from the indexed events.
+        """
+        totals: Dict[tuple, List[float]] = {}
+        # 集計中に届いた upsert を取りこぼさないよう、読み取りから書き込みまでを 1 トランザクションで行う
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                "SELECT camera, ts, ts_end, json_extract(meta, '$.duration_sec') AS duration FROM events"
+            ).fetchall()
+            for r in rows:
+                for minute, (events, motion) in _activity_of(r["ts"], r["ts_end"], r["duration"]).items():
+                    acc = totals.setdefault((r["camera"], minute), [0, 0.0])
+                    acc[0] += events
+                    acc[1] += motion
+            conn.execute("DELETE FROM activity")
+            conn.executemany(
+                "INSERT INTO activity (camera, minute, events, motion_sec) VALUES (?, ?, ?, ?)",
+                [(cam, minute, events, motion) for (cam, minute), (events, motion) in totals.items()],
+            )
+            conn.execute("INSERT OR REPLACE INTO index_info (key, value) VALUES ('activity_version', ?)",
+                         (ACTIVITY_VERSION,))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        logger.info(f"Activity aggregates rebuilt from {len(rows)} events")
+
+    def rebuild(self, events_dir_base: str) -> int:
+        """
+        Rebuild the whole index from the event tree.
+        Entries whose directory no longer exists are dropped.
+        """
+        conn = self._connect()
+        seen = set()
+        count = 0
+
+        for cam in sorted(os.listdir(events_dir_base)):
+            cam_dir = os.path.join(events_dir_base, cam)
+            if not os.path.isdir(cam_dir):
+                continue
+            for year in sorted(y for y in os.listdir(cam_dir) if y.isdigit()):
+                year_dir = os.path.join(cam_dir, year)
+                for month in sorted(m for m in os.listdir(year_dir) if m.isdigit()):
+                    month_dir = os.path.join(year_dir, month)
+                    conn.execute("BEGIN")
+                    try:
+                        for eid in os.listdir(month_dir):
+                            event_dir = os.path.join(month_dir, eid)
+                            if not os.path.isdir(event_dir):
+                                continue
+                            if self.upsert_from_dir(event_dir):
+                                seen.add((cam, eid))
+                                count += 1
+                        conn.execute("COMMIT")
+                    except Exception:
+                        conn.execute("ROLLBACK")
+                        raise
+
+        # 走査中に handler が upsert した行（新しいイベント）は seen に入らないため、
+        # ディレクトリが実際に無くなっているものだけを消す
+        stale = [
+            (r["camera"], r["event_id"])
+            for r in conn.execute("SELECT camera, year, month, event_id FROM events").fetchall()
+            if (r["camera"], r["event_id"]) not in seen
+            and not os.path.isdir(os.path.join(events_dir_base, r["camera"], r["year"], r["month"], r["event_id"]))
+        ]
+        for cam, eid in stale:
+            self.delete(cam, eid)
+
+        # 途中で失敗した更新などのずれを残さないよう、集計は全件から作り直す
+        self._rebuild_activity(conn)
+        self.set_info("rebuilt_at", datetime.now().isoformat(timespec="seconds"))
+        logger.info(f"Event index rebuilt: {count} events, {len(stale)} stale entries removed")
+        return count
+
+
+_default_index: Optional[EventIndex] = None
+
+
+def get_default_db_path() -> str:
+    from common.config_loader import EVENT_INDEX_DB
+    return EVENT_INDEX_DB
+
+
+def get_event_index() -> EventIndex:
+    """
+    Return the process-wide EventIndex for the configured database.
+    """
+    global _default_index
+    if _default_index is None:
+        _default_index = EventIndex(get_default_db_path())
+    return _default_index
+
+
+# ----------------------------------------
+# CLI
+#   python3 -m common.event_index upsert <event_dir>
+#   python3 -m common.event_index delete <event_dir>
+#   python3 -m common.event_index rebuild
+# ----------------------------------------
+def main(argv: List[str]) -> int:
+    usage = "Usage: event_index.py {upsert|delete} <event_dir> | rebuild"
+    if not argv:
+        print(usage, file=sys.stderr)
+        return 1
+
+    cmd = argv[0]
+    index = get_event_index()
+
+    if cmd == "rebuild":
+        from common.config_loader import EVENTS_DIR_BASE
+        print(f"[event_index] indexed {index.rebuild(EVENTS_DIR_BASE)} events")
+        return 0
+
+    if cmd in ("upsert", "delete") and len(argv) == 2:
+        event_dir = argv[1]
+        if cmd == "upsert":
+            return 0 if index.upsert_from_dir(event_dir) else 1
+        camera, _, _, event_id = split_event_dir(event_dir)
+        index.delete(camera, event_id)
+        return 0
+
+    print(usage, file=sys.stderr)
+    return 1
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,280 @@
+import os
+import json
+import shutil
+import logging
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from common.disk_cache import DiskCache
+from common.event_index import split_event_dir
+from common.frame_pack import list_frames, read_frame, read_frames
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------
+# event_thumbs.py
+#   イベントの縮小サムネイルとコンタクトシート（全フレームを並べた 1 枚画像）
+#
+#   <thumb_cache_dir>/<camera>/<event_id>/thumb_<w>.<ext>
+#   <thumb_cache_dir>/<camera>/<event_id>/sheet_<w>x<cols>_<frames>.<ext>
+#
+#   - イベント終了時（handler）またはリクエスト時に生成してディスクに保存
+#   - 合計サイズが上限を超えたら最終参照の古いものから削除
+#   - cv2 が無い環境では生成せず、呼び出し側が元の JPEG を返す
+# ---------------------------------------------------------
+
+# event.json に trigger_frame のない古いイベントでサムネイルに使うフレームの優先順
+# （0001 は検知前のことが多いため 0002 から）
+LEGACY_THUMB_FRAMES = ("0002.jpg", "0001.jpg")
+# コンタクトシートに含める最大フレーム数
+SHEET_MAX_FRAMES = 600
+
+MEDIA_TYPES = {"jpeg": "image/jpeg", "webp": "image/webp"}
+_EXTENSIONS = {"jpeg": ".jpg", "webp": ".webp"}
+
+
+@dataclass
+class ThumbSettings:
+    width: int = 320
+    format: str = "jpeg"          # jpeg / webp
+    quality: int = 75
+    sheet_width: int = 160        # コンタクトシートの 1 コマの幅
+    sheet_columns: int = 10
+    cache_max_mb: int = 256
+    prerender: bool = True        # イベント終了時にサムネイルを作る
+
+
+def load_thumb_settings(main_cfg: Dict[str, Any]) -> ThumbSettings:
+    cfg = (main_cfg.get("common", {}) or {}).get("event_thumbnails", {}) or {}
+    s = ThumbSettings()
+    fmt = str(cfg.get("format", s.format)).lower()
+    return ThumbSettings(
+        width=int(cfg.get("width", s.width)),
+        format=fmt if fmt in MEDIA_TYPES else s.format,
+        quality=int(cfg.get("quality", s.quality)),
+        sheet_width=int(cfg.get("sheet_width", s.sheet_width)),
+        sheet_columns=int(cfg.get("sheet_columns", s.sheet_columns)),
+        cache_max_mb=int(cfg.get("cache_max_mb", s.cache_max_mb)),
+        prerender=bool(cfg.get("prerender", s.prerender)),
+    )
+
+
+def thumb_frames(event_dir: str) -> List[str]:
+    """
+    Frame names to try for the event's thumbnail, best first: the trigger
+    frame recorded in event.json (frames before it are pre-roll), then the
+    legacy fixed names.
+    """
+    try:
+        with open(os.path.join(event_dir, "event.json")) as f:
+            trigger = json.load(f).get("trigger_frame")
+    except (OSError, ValueError, AttributeError):
+        trigger = None
+    if trigger:
+        return [trigger] + [name for name in LEGACY_THUMB_FRAMES if name != trigger]
+    return list(LEGACY_THUMB_FRAMES)
+
+
+def _cv2():
+    try:
+        import cv2
+        return cv2
+    except ImportError:
+        return None
+
+
+def jpeg_width(data: bytes) -> Optional[int]:
+    """
+    Image width from the JPEG SOFn header, without decoding.
+    """
+    pos = 2
+    while pos + 9 <= len(data):
+        if data[pos] != 0xFF:
+            return None
+        marker = data[pos + 1]
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            pos += 2
+            continue
+        length = int.from_bytes(data[pos + 2:pos + 4], "big")
+        # SOF0-15（DHT=C4, JPG=C8, DAC=CC を除く）
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            return int.from_bytes(data[pos + 7:pos + 9], "big")
+        pos += 2 + length
+    return None
+
+
+def decode_for_width(cv2, data: bytes, target_width: int):
+    """
+    Decode a JPEG no larger than needed: libjpeg's DCT scaling
+    (IMREAD_REDUCED_COLOR_N) skips most of the work for small outputs.
+    """
+    import numpy as np
+    arr = np.frombuffer(data, np.uint8)
+    flag = cv2.IMREAD_COLOR
+    src_width = jpeg_width(data)
+    if src_width:
+        for factor, reduced in ((8, cv2.IMREAD_REDUCED_COLOR_8),
+                                (4, cv2.IMREAD_REDUCED_COLOR_4),
+                                (2, cv2.IMREAD_REDUCED_COLOR_2)):
+            if src_width // factor >= target_width:
+                flag = reduced
+                break
+    return cv2.imdecode(arr, flag)
+
+
+def _resize(cv2, img, width: int):
+    h, w = img.shape[:2]
+    if w == width:
+        return img
+    height = max(1, round(h * width / w))
+    return cv2.resize(img, (width, height), interpolation=cv2.INTER_AREA)
+
+
+class ThumbCache:
+    def __init__(self, cache_dir: str, settings: ThumbSettings):
+        self.cache_dir = cache_dir
+        self.settings = settings
+        self.disk = DiskCache(cache_dir, settings.cache_max_mb * 1024 * 1024, "thumbnail cache")
+
+    @property
+    def media_type(self) -> str:
+        return MEDIA_TYPES[self.settings.format]
+
+    def _event_cache_dir(self, event_dir: str) -> str:
+        camera, _year, _month, event_id = split_event_dir(event_dir)
+        return os.path.join(self.cache_dir, camera, event_id)
+
+    def _encode(self, cv2, img) -> Optional[bytes]:
+        if self.settings.format == "webp":
+            params = [cv2.IMWRITE_WEBP_QUALITY, self.settings.quality]
+        else:
+            params = [cv2.IMWRITE_JPEG_QUALITY, self.settings.quality]
+        ok, buf = cv2.imencode(_EXTENSIONS[self.settings.format], img, params)
+        return buf.tobytes() if ok else None
+
+    # ----------------------------------------
+    # サムネイル
+    # ----------------------------------------
+    def thumbnail(self, event_dir: str, width: Optional[int] = None,
+                  refresh: bool = False) -> Optional[str]:
+        """
+        Path of the cached thumbnail for an event, rendering it if needed.
+        None if the event has no frames or cv2 is unavailable.
+        """
+        width = width or self.settings.width
+        ext = _EXTENSIONS[self.settings.format]
+        path = os.path.join(self._event_cache_dir(event_dir), f"thumb_{width}{ext}")
+        if not refresh and self.disk.lookup(path):
+            return path
+
+        cv2 = _cv2()
+        if cv2 is None:
+            return None
+        data = None
+        for name in thumb_frames(event_dir):
+            data = read_frame(event_dir, name)
+            if data is not None:
+                break
+        if data is None:
+            frames = list_frames(event_dir)
+            data = read_frame(event_dir, frames[0]) if frames else None
+        if data is None:
+            return None
+
+        img = decode_for_width(cv2, data, width)
+        if img is None:
+            return None
+        encoded = self._encode(cv2, _resize(cv2, img, min(width, img.shape[1])))
+        return self.disk.store(path, encoded) if encoded else None
+
+    # ----------------------------------------
+    # コンタクトシート
+    # ----------------------------------------
+    def contact_sheet(self, event_dir: str, columns: Optional[int] = None,
+                      width: Optional[int] = None) -> Optional[Tuple[str, int, int]]:
+        """
+        Render every frame of an event (up to SHEET_MAX_FRAMES) as one tiled
+        image, row-major in frame order. Returns (path, frames, columns).
+        """
+        frames = list_frames(event_dir)[:SHEET_MAX_FRAMES]
+        if not frames:
+            return None
+        columns = max(1, min(columns or self.settings.sheet_columns, len(frames)))
+        width = width or self.settings.sheet_width
+        ext = _EXTENSIONS[self.settings.format]
+        # フレーム数をキーに含め、進行中のイベントの古いシートを使わないようにする
+        path = os.path.join(self._event_cache_dir(event_dir),
+                            f"sheet_{width}x{columns}_{len(frames)}{ext}")
+        if self.disk.lookup(path):
+            return path, len(frames), columns
+
+        cv2 = _cv2()
+        if cv2 is None:
+            return None
+        import numpy as np
+
+        sheet = None
+        tile_h = 0
+        rows = (len(frames) + columns - 1) // columns
+        for i, data in enumerate(read_frames(event_dir, frames)):
+            img = decode_for_width(cv2, data, width) if data else None
+            if img is None:
+                continue
+            if sheet is None:
+                tile_h = max(1, round(img.shape[0] * width / img.shape[1]))
+                sheet = np.zeros((tile_h * rows, width * columns, 3), np.uint8)
+            tile = cv2.resize(img, (width, tile_h), interpolation=cv2.INTER_AREA)
+            r, c = divmod(i, columns)
+            sheet[r * tile_h:(r + 1) * tile_h, c * width:(c + 1) * width] = tile
+        if sheet is None:
+            return None
+
+        encoded = self._encode(cv2, sheet)
+        if not encoded:
+            return None
+        return self.disk.store(path, encoded), len(frames), columns
+
+    def prerender(self, event_dir: str):
+        """
+        Called when an event ends: drop the contact sheets rendered while it
+        was recording and pre-render the final thumbnail.
+        """
+        self.forget_sheets(event_dir)
+        if not self.settings.prerender:
+            return
+        try:
+            # 進行中に別のフレームから作られていた場合に備えて作り直す
+            self.thumbnail(event_dir, refresh=True)
+        except Exception as e:
+            logger.error(f"Failed to render thumbnail for {event_dir}: {e}")
+
+    # ----------------------------------------
+    # 削除・容量管理
+    # ----------------------------------------
+    def forget_sheets(self, event_dir: str):
+        # 記録中はフレーム数ごとに別のシートができる。終了後は二度と使われない
+        cache_dir = self._event_cache_dir(event_dir)
+        try:
+            names = os.listdir(cache_dir)
+        except FileNotFoundError:
+            return
+        for name in names:
+            if name.startswith("sheet_") and ".tmp" not in name:
+                try:
+                    os.remove(os.path.join(cache_dir, name))
+                except FileNotFoundError:
+                    pass
+
+    def forget(self, camera: str, event_id: str):
+        shutil.rmtree(os.path.join(self.cache_dir, camera, event_id), ignore_errors=True)
+
+
+_thumb_cache: Optional[ThumbCache] = None
+
+
+def get_thumb_cache() -> ThumbCache:
+    global _thumb_cache
+    if _thumb_cache is None:
+        from common.config_loader import THUMB_CACHE_DIR, _main_config
+        _thumb_cache = ThumbCache(THUMB_CACHE_DIR, load_thumb_settings(_main_config))
+    return _thumb_cache
@@ -0,0 +1,320 @@
+import os
+import sys
+import json
+import glob
+import struct
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+# ---------------------------------------------------------
+# frame_pack.py
+#   イベントの JPEG を 1 ファイルにまとめて保存する形式
+#
+#   <event_dir>/frames.pack : JPEG を追記していくだけのデータファイル
+#   <event_dir>/frames.idx  : 1 フレーム 24 バイトの固定長インデックス
+#                             (offset u64, length u32, number u32, timestamp f64)
+#
+#   - フレーム名は従来どおり "%04d.jpg"（number から生成）
+#   - 読み出しはインデックスで位置を引いて pread 1 回
+#   - 従来の連番 JPEG（0001.jpg ...）のイベントもそのまま扱える
+# ---------------------------------------------------------
+
+PACK_FILE = "frames.pack"
+INDEX_FILE = "frames.idx"
+
+_RECORD = struct.Struct("<QIId")    # offset, length, number, timestamp
+
+
+def frame_name(number: int) -> str:
+    return f"{number:04d}.jpg"
+
+
+def parse_frame_name(name: str) -> Optional[int]:
+    stem, ext = os.path.splitext(name)
+    if ext.lower() != ".jpg" or not stem.isdigit():
+        return None
+    return int(stem)
+
+
+def is_packed(event_dir: str) -> bool:
+    return os.path.exists(os.path.join(event_dir, INDEX_FILE))
+
+
+def _write_all(fd: int, chunks: List[bytes]):
+    total = sum(len(c) for c in chunks)
+    written = os.writev(fd, chunks)
+    if written < total:
+        rest = memoryview(b"".join(chunks))[written:]
+        while rest:
+            rest = rest[os.write(fd, rest):]
+
+
+class FramePackWriter:
+    """
+    Append frames to an event's frames.pack / frames.idx.
+    """
+
+    def __init__(self, event_dir: str):
+        self.event_dir = event_dir
+        self.pack_path = os.path.join(event_dir, PACK_FILE)
+        self.index_path = os.path.join(event_dir, INDEX_FILE)
+        self._pack = os.open(self.pack_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o666)
+        self._index = os.open(self.index_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o666)
+        self.offset = os.fstat(self._pack).st_size
+
+    def append_many(self, frames: Iterable[Tuple[int, bytes, float]]):
+        """
+        Append (number, jpeg_bytes, timestamp) frames with one write to
+        each file.
+        """
+        records = []
+        datas = []
+        offset = self.offset
+        for number, data, ts in frames:
+            records.append(_RECORD.pack(offset, len(data), number, ts))
+            datas.append(data)
+            offset += len(data)
+        if not datas:
+            return
+        # データを先に書く（インデックスが未書き込みのデータを指さないように）
+        _write_all(self._pack, datas)
+        _write_all(self._index, records)
+        self.offset = offset
+
+    def append(self, number: int, data: bytes, ts: float):
+        self.append_many([(number, data, ts)])
+
+    def keep(self, numbers: Iterable[int]):
+        """
+        Drop every frame whose number is not in `numbers` (post-motion
+        trimming). Trailing data is truncated away.
+        """
+        keep = set(numbers)
+        records = [r for r in read_index(self.index_path) if r[2] in keep]
+        end = max((off + length for off, length, _n, _ts in records), default=0)
+
+        tmp = f"{self.index_path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(b"".join(_RECORD.pack(*r) for r in records))
+        os.replace(tmp, self.index_path)
+        os.close(self._index)
+        self._index = os.open(self.index_path, os.O_WRONLY | os.O_APPEND)
+
+        os.ftruncate(self._pack, end)
+        self.offset = end
+
+    def close(self):
+        for fd in (self._pack, self._index):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+        self._pack = self._index = -1
+
+
+def read_index(index_path: str) -> List[Tuple[int, int, int, float]]:
+    with open(index_path, "rb") as f:
+        buf = f.read()
+    # 書き込み途中の末尾レコードは無視する
+    usable = len(buf) - len(buf) % _RECORD.size
+    return [_RECORD.unpack_from(buf, pos) for pos in range(0, usable, _RECORD.size)]
+
+
+class FramePack:
+    """
+    Read-only view of a packed event.
+    """
+
+    def __init__(self, event_dir: str):
+        self.event_dir = event_dir
+        self.pack_path = os.path.join(event_dir, PACK_FILE)
+        self.records = read_index(os.path.join(event_dir, INDEX_FILE))
+        self._by_name: Dict[str, Tuple[int, int]] = {
+            frame_name(number): (offset, length) for offset, length, number, _ts in self.records
+        }
+
+    def names(self) -> List[str]:
+        return sorted(self._by_name)
+
+    def locate(self, name: str) -> Optional[Tuple[int, int]]:
+        """
+        (offset, length) of a frame in frames.pack.
+        """
+        return self._by_name.get(name)
+
+    def read(self, name: str) -> Optional[bytes]:
+        loc = self.locate(name)
+        if loc is None:
+            return None
+        offset, length = loc
+        fd = os.open(self.pack_path, os.O_RDONLY)
+        try:
+            return os.pread(fd, length, offset)
+        finally:
+            os.close(fd)
+
+    def read_many(self, names: Iterable[str]) -> Iterator[Optional[bytes]]:
+        """
+        Frames in the given order (None for unknown names), sharing one
+        open of frames.pack.
+        """
+        fd = os.open(self.pack_path, os.O_RDONLY)
+        try:
+            for name in names:
+                loc = self.locate(name)
+                yield os.pread(fd, loc[1], loc[0]) if loc is not None else None
+        finally:
+            os.close(fd)
+
+
+# ----------------------------------------
+# 形式を問わないフレームアクセス（Web API 用）
+# ----------------------------------------
+def list_frames(event_dir: str) -> List[str]:
+    if is_packed(event_dir):
+        return FramePack(event_dir).names()
+    try:
+        return sorted(f for f in os.listdir(event_dir) if f.lower().endswith(".jpg"))
+    except FileNotFoundError:
+        return []
+
+
+def read_frames(event_dir: str, names: Iterable[str]) -> Iterator[Optional[bytes]]:
+    """
+    Several frames of one event; frames.idx is parsed once for all of them.
+    """
+    if is_packed(event_dir):
+        yield from FramePack(event_dir).read_many(names)
+        return
+    for name in names:
+        yield read_frame(event_dir, name)
+
+
+def read_frame(event_dir: str, name: str) -> Optional[bytes]:
+    if is_packed(event_dir):
+        return FramePack(event_dir).read(name)
+    path = os.path.join(event_dir, os.path.basename(name))
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+# ----------------------------------------
+# 移行（連番 JPEG → frames.pack）
+# ----------------------------------------
+def pack_event(event_dir: str, remove_loose: bool = True) -> int:
+    """
+    Pack the loose JPEG frames of an event. Returns the number of frames
+    packed (0 if there was nothing to do).
+    """
+    if is_packed(event_dir):
+        return 0
+    loose = []
+    for path in glob.glob(os.path.join(event_dir, "*.jpg")):
+        number = parse_frame_name(os.path.basename(path))
+        if number is not None:
+            loose.append((number, path))
+    if not loose:
+        return 0
+    loose.sort()
+
+    # 一時ファイルに書き出し、完成してからインデックスを置く
+    tmp_pack = os.path.join(event_dir, f"{PACK_FILE}.tmp")
+    tmp_index = os.path.join(event_dir, f"{INDEX_FILE}.tmp")
+    offset = 0
+    records = []
+    with open(tmp_pack, "wb") as pf:
+        for number, path in loose:
+            with open(path, "rb") as f:
+                data = f.read()
+            pf.write(data)
+            records.append(_RECORD.pack(offset, len(data), number, os.path.getmtime(path)))
+            offset += len(data)
+        pf.flush()
+        os.fsync(pf.fileno())
+    with open(tmp_index, "wb") as xf:
+        xf.write(b"".join(records))
+        xf.flush()
+        os.fsync(xf.fileno())
+
+    os.replace(tmp_pack, os.path.join(event_dir, PACK_FILE))
+    os.replace(tmp_index, os.path.join(event_dir, INDEX_FILE))
+
+    if remove_loose:
+        for _number, path in loose:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+    return len(loose)
+
+
+def _event_finished(event_dir: str) -> bool:
+    """
+    True if event.json has its end time, i.e. the handler is no longer
+    writing frames into the directory.
+    """
+    try:
+        with open(os.path.join(event_dir, "event.json")) as f:
+            return bool(json.load(f).get("timestamp_end"))
+    except (OSError, ValueError, AttributeError):
+        return False
+
+
+# ----------------------------------------
+# CLI
+#   python3 -m common.frame_pack migrate [--keep] [<event_dir> ...]
+#       （event_dir 省略時は events_dir_base 以下の全イベント。記録中のイベントは飛ばす）
+#   python3 -m common.frame_pack extract <event_dir> <frame> <output>
+# ----------------------------------------
+def main(argv: List[str]) -> int:
+    usage = ("Usage: frame_pack.py migrate [--keep] [<event_dir> ...] | "
+             "extract <event_dir> <frame> <output>")
+    if not argv:
+        print(usage, file=sys.stderr)
+        return 1
+
+    cmd = argv[0]
+    if cmd == "migrate":
+        args = argv[1:]
+        keep = "--keep" in args
+        dirs = [a for a in args if a != "--keep"]
+        if not dirs:
+            from common.config_loader import EVENTS_DIR_BASE
+            dirs = sorted(glob.glob(os.path.join(EVENTS_DIR_BASE, "*", "*", "*", "*")))
+        events = frames = active = 0
+        for d in dirs:
+            if not os.path.isdir(d):
+                continue
+            # 記録中（files 形式）のイベントはフレームの追加・末尾削除と競合する
+            if not _event_finished(d):
+                active += 1
+                continue
+            try:
+                n = pack_event(d, remove_loose=not keep)
+            except OSError as e:
+                print(f"[frame_pack] {d}: {e}", file=sys.stderr)
+                continue
+            if n:
+                events += 1
+                frames += n
+        print(f"[frame_pack] packed {frames} frames in {events} events"
+              + (f" (skipped {active} events still recording)" if active else ""))
+        return 0
+
+    if cmd == "extract" and len(argv) == 4:
+        data = read_frame(argv[1], argv[2])
+        if data is None:
+            print(f"[frame_pack] frame not found: {argv[2]}", file=sys.stderr)
+            return 1
+        with open(argv[3], "wb") as f:
+            f.write(data)
+        return 0
+
+    print(usage, file=sys.stderr)
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,241 @@
+import os
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+import logging
+from typing import Dict, Hashable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------
+# inotify (ctypes, 追加依存なし)
+# ---------------------------------------------------------
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+
+IN_CLOEXEC = 0o2000000
+IN_NONBLOCK = 0o4000
+
+_EVENT_HEADER = struct.Struct("iIII")
+
+_libc = None
+
+
+def _get_libc():
+    global _libc
+    if _libc is None:
+        _libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    return _libc
+
+
+class Inotify:
+    """
+    Minimal inotify wrapper. read_events() returns (wd, mask, cookie, name).
+    """
+
+    def __init__(self):
+        libc = _get_libc()
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self.fd = fd
+
+    def fileno(self) -> int:
+        return self.fd
+
+    def add_watch(self, path: str, mask: int) -> int:
+        wd = _get_libc().inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), path)
+        return wd
+
+    def rm_watch(self, wd: int):
+        _get_libc().inotify_rm_watch(self.fd, wd)
+
+    def read_events(self) -> List[Tuple[int, int, int, str]]:
+        try:
+            buf = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        pos = 0
+        while pos + _EVENT_HEADER.size <= len(buf):
+            wd, mask, cookie, length = _EVENT_HEADER.unpack_from(buf, pos)
+            pos += _EVENT_HEADER.size
+            name = buf[pos:pos + length].rstrip(b"\0").decode(errors="replace")
+            pos += length
+            events.append((wd, mask, cookie, name))
+        return events
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+def inotify_available() -> bool:
+    try:
+        Inotify().close()
+        return True
+    except Exception:
+        return False
+
+
+# ---------------------------------------------------------
+# FrameWatcher
+#   latest.jpg のような「置き換えで更新されるファイル」の到着を待つ。
+#   ffmpeg の -atomic_writing は一時ファイル → rename なので IN_MOVED_TO、
+#   直接書き込みの場合は IN_CLOSE_WRITE で検知する。
+#   inotify が使えない場合は stat によるポーリングにフォールバックする。
+# ---------------------------------------------------------
+FRAME_EVENTS = IN_MOVED_TO | IN_CLOSE_WRITE
+
+
+def file_signature(path: str) -> Optional[Tuple[int, int, int]]:
+    """
+    (st_mtime_ns, st_ino, st_size) of a file, or None if it does not exist.
+    An atomic rename always changes the inode, so back-to-back writes within
+    the filesystem timestamp resolution are still distinguished.
+    """
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_ino, st.st_size
+
+
+class FrameWatcher:
+    """
+    Wait for new versions of a file (default latest.jpg) in one or more
+    directories, each registered under a key (e.g. camera name).
+    """
+
+    def __init__(self, filename: str = "latest.jpg", poll_interval: float = 0.2,
+                 use_inotify: bool = True):
+        self.filename = filename
+        self.poll_interval = poll_interval
+        self._dirs: Dict[Hashable, str] = {}
+        self._wds: Dict[int, Hashable] = {}
+        self._unwatched: Set[Hashable] = set()
+        self._signatures: Dict[Hashable, Optional[Tuple[int, int, int]]] = {}
+        self._ready: Set[Hashable] = set()
+        self._last_retry = 0.0
+
+        self.inotify: Optional[Inotify] = None
+        if use_inotify:
+            try:
+                self.inotify = Inotify()
+            except Exception as e:
+                logger.warning(f"inotify unavailable, falling back to polling: {e}")
+
+    @property
+    def mode(self) -> str:
+        return "inotify" if self.inotify else "poll"
+
+    def fileno(self) -> int:
+        return self.inotify.fileno() if self.inotify else -1
+
+    def add(self, key: Hashable, directory: str):
+        self._dirs[key] = directory
+        self._signatures[key] = None
+        if self.inotify:
+            self._watch(key)
+        # 既にファイルがあれば最初の 1 枚として扱う
+        path = os.path.join(directory, self.filename)
+        self._signatures[key] = file_signature(path)
+        if self._signatures[key] is not None:
+            self._ready.add(key)
+
+    def _watch(self, key: Hashable) -> bool:
+        try:
+            wd = self.inotify.add_watch(self._dirs[key], FRAME_EVENTS | IN_ONLYDIR)
+        except OSError as e:
+            if e.errno not in (errno.ENOENT, errno.ENOTDIR):
+                logger.warning(f"inotify watch failed for {self._dirs[key]}: {e}")
+            self._unwatched.add(key)
+            return False
+        self._wds[wd] = key
+        self._unwatched.discard(key)
+        return True
+
+    def _retry_unwatched(self):
+        # ディレクトリがまだ無い（ffmpeg 起動前）・作り直された場合の再登録
+        now = time.monotonic()
+        if not self._unwatched or now - self._last_retry < 1.0:
+            return
+        self._last_retry = now
+        for key in list(self._unwatched):
+            if self._watch(key):
+                sig = file_signature(os.path.join(self._dirs[key], self.filename))
+                if sig is not None and sig != self._signatures[key]:
+                    self._signatures[key] = sig
+                    self._ready.add(key)
+
+    def _drain_inotify(self):
+        for wd, mask, _cookie, name in self.inotify.read_events():
+            if mask & IN_Q_OVERFLOW:
+                # イベント溢れ：全キーを再確認させる
+                self._ready.update(self._dirs.keys())
+                continue
+            key = self._wds.get(wd)
+            if key is None:
+                continue
+            if mask & IN_IGNORED:
+                del self._wds[wd]
+                self._unwatched.add(key)
+                continue
+            if name == self.filename and mask & FRAME_EVENTS:
+                self._ready.add(key)
+
+    def _poll_changes(self):
+        for key, directory in self._dirs.items():
+            sig = file_signature(os.path.join(directory, self.filename))
+            if sig is not None and sig != self._signatures[key]:
+                self._signatures[key] = sig
+                self._ready.add(key)
+
+    def wait(self, timeout: Optional[float] = None) -> Set[Hashable]:
+        """
+        Block until at least one watched file was replaced or timeout expires.
+        Returns the keys with a new frame (empty set on timeout).
+        """
+        if not self._ready:
+            if self.inotify:
+                self._retry_unwatched()
+                wait_for = timeout
+                if self._unwatched:
+                    wait_for = 1.0 if timeout is None else min(timeout, 1.0)
+                r, _, _ = select.select([self.inotify], [], [], wait_for)
+                if r:
+                    self._drain_inotify()
+            else:
+                deadline = None if timeout is None else time.monotonic() + timeout
+                while True:
+                    self._poll_changes()
+                    if self._ready:
+                        break
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        break
+                    time.sleep(self.poll_interval if remaining is None else min(self.poll_interval, remaining))
+
+        ready, self._ready = self._ready, set()
+        return ready
+
+    def close(self):
+        if self.inotify:
+            self.inotify.close()
+            self.inotify = None
@@ -0,0 +1,213 @@
+import time
+import logging
+import threading
+import itertools
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------
+# media_jobs.py
+#   Web API から起動する ffmpeg / ffprobe の実行枠を管理するスケジューラ
+#
+#   - 同時実行数の上限（録画・動体検知と CPU を取り合わないように）
+#   - 優先度: 画面操作で待たせるもの（再生）> バックグラウンド処理（probe・変換）
+#   - 同じキーのジョブが実行中・待機中なら新しいプロセスは起動せず結果を共有する
+# ---------------------------------------------------------
+
+# 優先度（小さいほど先に実行）
+INTERACTIVE = 0
+BACKGROUND = 10
+
+# 待ち時間の移動平均の係数
+_WAIT_EWMA_ALPHA = 0.2
+
+
+class JobQueueTimeout(Exception):
+    """
+    No slot became free within the caller's timeout.
+    """
+
+
+@dataclass
+class Job:
+    id: int
+    kind: str                   # ffmpeg-stream / remux / ffprobe など
+    label: str
+    priority: int
+    key: Optional[Hashable] = None
+    submitted: float = field(default_factory=time.monotonic)
+    started: Optional[float] = None
+    waiters: int = 0            # 結果を共有している後続リクエスト数
+
+    def describe(self, now: float) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "label": self.label,
+            "priority": self.priority,
+            "waited_sec": round((self.started or now) - self.submitted, 3),
+            "running_sec": round(now - self.started, 3) if self.started else None,
+            "merged": self.waiters,
+        }
+
+
+class JobScheduler:
+    def __init__(self, max_concurrent: int):
+        self.max_concurrent = max(1, int(max_concurrent))
+        self._cond = threading.Condition()
+        self._seq = itertools.count(1)
+        self._waiting: List[Job] = []
+        self._running: Dict[int, Job] = {}
+        self._inflight: Dict[Hashable, "tuple[Job, Future]"] = {}
+        # 統計
+        self.completed = 0
+        self.completed_by_kind: Dict[str, int] = {}
+        self.merged = 0
+        self.timeouts = 0
+        self.wait_avg = 0.0
+        self.wait_max = 0.0
+
+    # ----------------------------------------
+    # 実行枠
+    # ----------------------------------------
+    def _next_locked(self) -> Optional[Job]:
+        if not self._waiting:
+            return None
+        return min(self._waiting, key=lambda j: (j.priority, j.id))
+
+    def _start(self, job: Job, timeout: Optional[float]):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._waiting.append(job)
+            try:
+                while not (len(self._running) < self.max_concurrent and self._next_locked() is job):
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        self.timeouts += 1
+                        raise JobQueueTimeout(f"{job.kind} {job.label}: no free slot in {timeout}s")
+                    self._cond.wait(remaining)
+            finally:
+                self._waiting.remove(job)
+                # 自分が抜けたことで次の待機ジョブが先頭になる
+                self._cond.notify_all()
+            job.started = time.monotonic()
+            self._running[job.id] = job
+            waited = job.started - job.submitted
+            self.wait_avg += _WAIT_EWMA_ALPHA * (waited - self.wait_avg)
+            self.wait_max = max(self.wait_max, waited)
+
+    def _finish(self, job: Job):
+        with self._cond:
+            self._running.pop(job.id, None)
+            self.completed += 1
+            self.completed_by_kind[job.kind] = self.completed_by_kind.get(job.kind, 0) + 1
+            self._cond.notify_all()
+
+    def acquire(self, kind: str, label: str, priority: int = INTERACTIVE,
+                timeout: Optional[float] = None) -> Job:
+        """
+        Block until a slot is free. The caller must release() the job.
+        Raises JobQueueTimeout if timeout expires first.
+        """
+        job = Job(next(self._seq), kind, label, priority)
+        self._start(job, timeout)
+        return job
+
+    def release(self, job: Job):
+        self._finish(job)
+
+    @contextmanager
+    def slot(self, kind: str, label: str, priority: int = INTERACTIVE,
+             timeout: Optional[float] = None):
+        job = self.acquire(kind, label, priority, timeout)
+        try:
+            yield job
+        finally:
+            self.release(job)
+
+    # ----------------------------------------
+    # 重複排除付きの実行
+    # ----------------------------------------
+    def run(self, kind: str, label: str, fn: Callable[[], Any], key: Optional[Hashable] = None,
+            priority: int = INTERACTIVE, timeout: Optional[float] = None) -> Any:
+        """
+        Run fn() in a slot and return its result. If a job with the same key
+        is already queued or running, wait for that job's result instead of
+        starting another process (a queued job is promoted to the higher
+        priority of the two).
+        """
+        if key is not None:
+            with self._cond:
+                entry = self._inflight.get(key)
+                if entry is not None:
+                    job, future = entry
+                    job.waiters += 1
+                    self.merged += 1
+                    if job.started is None and priority < job.priority:
+                        job.priority = priority
+                        self._cond.notify_all()
+            if entry is not None:
+                try:
+                    return future.result(timeout)
+                except FutureTimeout:
+                    with self._cond:
+                        self.timeouts += 1
+                    raise JobQueueTimeout(f"{kind} {label}: identical job not finished in {timeout}s")
+
+        job = Job(next(self._seq), kind, label, priority, key)
+        future: Future = Future()
+        if key is not None:
+            with self._cond:
+                self._inflight[key] = (job, future)
+        try:
+            self._start(job, timeout)
+            try:
+                result = fn()
+            finally:
+                self._finish(job)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            if key is not None:
+                with self._cond:
+                    self._inflight.pop(key, None)
+
+    # ----------------------------------------
+    # 状態
+    # ----------------------------------------
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self._cond:
+            waiting = sorted(self._waiting, key=lambda j: (j.priority, j.id))
+            return {
+                "max_concurrent": self.max_concurrent,
+                "running": [j.describe(now) for j in self._running.values()],
+                "queued": [j.describe(now) for j in waiting],
+                "queue_length": len(waiting),
+                "completed": self.completed,
+                "completed_by_kind": dict(self.completed_by_kind),
+                "merged": self.merged,
+                "timeouts": self.timeouts,
+                "wait_avg_sec": round(self.wait_avg, 3),
+                "wait_max_sec": round(self.wait_max, 3),
+            }
+
+
+_scheduler: Optional[JobScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_job_scheduler() -> JobScheduler:
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            from common.config_loader import MEDIA_JOBS_MAX_CONCURRENT
+            _scheduler = JobScheduler(MEDIA_JOBS_MAX_CONCURRENT)
+        return _scheduler
@@ -0,0 +1,360 @@
+import os
+import json
+import time
+import glob
+import bisect
+import logging
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------
+# metrics.py
+#   Prometheus テキスト形式のメトリクス（外部ライブラリなし）
+#
+#   - 各プロセスは MetricsRegistry に Counter / Gauge / Histogram を持つ
+#     （値の更新はロックなしの加算のみ。1 系列を同時に更新するのは 1 スレッド）
+#   - 検知器・イベントハンドラは MetricsPublisher がスナップショットを
+#     <motion_tmp_base>/metrics/<name>.json（/dev/shm）へ数秒ごとに書き出す
+#   - Web API はそれらと自プロセスの値をまとめて GET /system/metrics で返す
+# ---------------------------------------------------------
+
+# 秒単位のレイテンシ用バケット（0.5ms 〜 10s）
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# フレーム経過時間・イベント遅延用（10ms 〜 60s）
+LAG_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# この回数の公開間隔を過ぎても更新されないスナップショットは終了したプロセスとみなす
+STALE_INTERVALS = 3
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Counter:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def set(self, value: float):
+        # 他のコンポーネントが数えている累計をそのまま写す場合のみ
+        self.value = value
+
+
+class Gauge:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def set(self, value: float):
+        self.value = value
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)    # 最後は +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+_TYPES = {"counter": Counter, "gauge": Gauge, "histogram": Histogram}
+
+
+class _Family:
+    def __init__(self, name: str, kind: str, help: str, buckets: Optional[Tuple[float, ...]] = None):
+        self.name = name
+        self.kind = kind
+        self.help = help
+        self.buckets = buckets
+        self.series: Dict[Labels, Any] = {}
+
+
+class StageTimer:
+    """
+    Times consecutive stages of one pass through a pipeline: start(), then
+    lap(stage) after each stage observes the time since the previous mark
+    into the stage's histogram.
+    """
+
+    def __init__(self, histogram: Callable[[str], Histogram]):
+        self._histogram = histogram
+        self._stages: Dict[str, Histogram] = {}
+        self._mark = 0.0
+
+    def start(self):
+        self._mark = time.perf_counter()
+
+    def lap(self, stage: str):
+        now = time.perf_counter()
+        hist = self._stages.get(stage)
+        if hist is None:
+            hist = self._stages[stage] = self._histogram(stage)
+        hist.observe(now - self._mark)
+        self._mark = now
+
+
+class NullTimer:
+    """
+    StageTimer that measures nothing (metrics disabled, benchmarks).
+    """
+
+    def start(self):
+        pass
+
+    def lap(self, stage: str):
+        pass
+
+
+NULL_TIMER = NullTimer()
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._families: Dict[str, _Family] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, kind: str, name: str, help: str, labels: Dict[str, Any],
+             buckets: Optional[Tuple[float, ...]] = None):
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        with self._lock:
+            family = self._families.get(name)
+            if family is None:
+                family = self._families[name] = _Family(name, kind, help, buckets)
+            elif family.kind != kind:
+                raise ValueError(f"{name} is already registered as a {family.kind}")
+            metric = family.series.get(key)
+            if metric is None:
+                metric = family.series[key] = (Histogram(family.buckets) if kind == "histogram"
+                                               else _TYPES[kind]())
+            return metric
+
+    def counter(self, name: str, help: str, **labels) -> Counter:
+        return self._get("counter", name, help, labels)
+
+    def gauge(self, name: str, help: str, **labels) -> Gauge:
+        return self._get("gauge", name, help, labels)
+
+    def histogram(self, name: str, help: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS,
+                  **labels) -> Histogram:
+        return self._get("histogram", name, help, labels, tuple(buckets))
+
+    def stage_timer(self, name: str, help: str, **labels) -> StageTimer:
+        """
+        StageTimer observing into `name` with an extra `stage` label.
+        """
+        return StageTimer(lambda stage: self.histogram(name, help, stage=stage, **labels))
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """
+        JSON-serializable copy of every family (see render()).
+        """
+        with self._lock:
+            families = [(f, list(f.series.items())) for f in self._families.values()]
+        result = []
+        for family, series in families:
+            entries = []
+            for key, metric in series:
+                entry: Dict[str, Any] = {"labels": dict(key)}
+                if family.kind == "histogram":
+                    entry.update(counts=list(metric.counts), sum=metric.sum, count=metric.count)
+                else:
+                    entry["value"] = metric.value
+                entries.append(entry)
+            result.append({
+                "name": family.name, "type": family.kind, "help": family.help,
+                "buckets": list(family.buckets) if family.buckets else None,
+                "series": entries,
+            })
+        return result
+
+
+# ----------------------------------------
+# テキスト形式への変換
+# ----------------------------------------
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels_text(labels: Dict[str, str], extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(labels.items()) + ([extra] if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}"
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def render(snapshots: Iterable[List[Dict[str, Any]]]) -> str:
+    """
+    Prometheus text exposition (format 0.0.4) of one or more registry
+    snapshots. Families with the same name are merged; series with the
+    same labels from different processes are added up (gauges: last wins).
+    """
+    merged: Dict[str, Dict[str, Any]] = {}
+    for snapshot in snapshots:
+        for family in snapshot:
+            target = merged.setdefault(family["name"], {**family, "series": {}})
+            if target["type"] != family["type"] or target.get("buckets") != family.get("buckets"):
+                logger.warning(f"Conflicting definitions of metric {family['name']}, skipping one")
+                continue
+            for entry in family["series"]:
+                key = tuple(sorted(entry["labels"].items()))
+                prev = target["series"].get(key)
+                if prev is None or family["type"] == "gauge":
+                    target["series"][key] = entry
+                elif family["type"] == "histogram":
+                    target["series"][key] = {
+                        "labels": entry["labels"],
+                        "counts": [a + b for a, b in zip(prev["counts"], entry["counts"])],
+                        "sum": prev["sum"] + entry["sum"],
+                        "count": prev["count"] + entry["count"],
+                    }
+                else:
+                    target["series"][key] = {"labels": entry["labels"], "value": prev["value"] + entry["value"]}
+
+    lines = []
+    for name in sorted(merged):
+        family = merged[name]
+        lines.append(f"# HELP {name} {family['help']}")
+        lines.append(f"# TYPE {name} {family['type']}")
+        for key in sorted(family["series"]):
+            entry = family["series"][key]
+            labels = entry["labels"]
+            if family["type"] != "histogram":
+                lines.append(f"{name}{_labels_text(labels)} {_number(entry['value'])}")
+                continue
+            cumulative = 0
+            for bound, count in zip(list(family["buckets"]) + [float("inf")], entry["counts"]):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels_text(labels, ('le', _number(bound)))} {cumulative}")
+            lines.append(f"{name}_sum{_labels_text(labels)} {_number(entry['sum'])}")
+            lines.append(f"{name}_count{_labels_text(labels)} {entry['count']}")
+    return "\n".join(lines) + "\n"
+
+
+# ----------------------------------------
+# プロセス間の受け渡し（/dev/shm 上のスナップショット）
+# ----------------------------------------
+class MetricsPublisher:
+    """
+    Writes the registry snapshot of this process to <dir>/<name>.json every
+    `interval` seconds (temp file + rename) from a daemon thread.
+    """
+
+    def __init__(self, registry: MetricsRegistry, name: str, directory: str, interval: float):
+        self.registry = registry
+        self.path = os.path.join(directory, f"{name}.json")
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def publish(self):
+        data = {
+            "pid": os.getpid(),
+            "time": time.time(),
+            "interval": self.interval,
+            "families": self.registry.snapshot(),
+        }
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(tmp, self.path)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.publish()
+            except Exception as e:
+                logger.warning(f"Failed to publish metrics to {self.path}: {e}")
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="metrics", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def read_snapshots(directory: str, now: Optional[float] = None) -> List[List[Dict[str, Any]]]:
+    """
+    Snapshots published by running processes; files not refreshed within
+    STALE_INTERVALS publish intervals (exited process) are ignored.
+    """
+    now = now if now is not None else time.time()
+    result = []
+    for path in sorted(glob.glob(os.path.join(directory, "*.json"))):
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if now - data.get("time", 0) > STALE_INTERVALS * data.get("interval", 0):
+            continue
+        result.append(data.get("families", []))
+    return result
+
+
+# ----------------------------------------
+# プロセス共通のレジストリ
+# ----------------------------------------
+_registry: Optional[MetricsRegistry] = None
+_registry_lock = threading.Lock()
+_publisher: Optional[MetricsPublisher] = None
+
+
+def get_registry() -> MetricsRegistry:
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = MetricsRegistry()
+        return _registry
+
+
+def metrics_enabled() -> bool:
+    from common.config_loader import METRICS_ENABLED
+    return METRICS_ENABLED
+
+
+def start_publisher(name: str) -> Optional[MetricsPublisher]:
+    """
+    Publish this process's registry as `name` (no-op if metrics are disabled).
+    """
+    global _publisher
+    from common.config_loader import METRICS_ENABLED, METRICS_DIR, METRICS_INTERVAL
+    if not METRICS_ENABLED or _publisher is not None:
+        return _publisher
+    _publisher = MetricsPublisher(get_registry(), name, METRICS_DIR, METRICS_INTERVAL)
+    _publisher.start()
+    return _publisher
+
+
+def stop_publisher():
+    global _publisher
+    if _publisher is not None:
+        _publisher.stop()
+        _publisher = None
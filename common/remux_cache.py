@@ -0,0 +1,142 @@
+import os
+import time
+import queue
+import logging
+import subprocess
+import threading
+from typing import Optional, Tuple
+
+from common.disk_cache import DiskCache
+from common.media_jobs import BACKGROUND, INTERACTIVE, get_job_scheduler
+from common.video_utils import get_media_cache
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------
+# remux_cache.py
+#   書き込みが終わった録画セグメント（MKV）を再生用の MP4 に一度だけ変換して保存する
+#
+#   <remux_cache_dir>/<camera>/<stem>.<size>-<mtime_ns>.mp4
+#
+#   - H.264 はストリームコピー（数百 ms）。それ以外は libx264 で変換（バックグラウンド）
+#   - moov を先頭に置いた通常の MP4 なので、Range リクエストでそのままシークできる
+#   - 元ファイルのサイズ・mtime をファイル名に含め、書き換えられたら別物として扱う
+#   - ffmpeg は media_jobs のスケジューラ経由で起動し、同じセグメントの変換は 1 回にまとめる
+# ---------------------------------------------------------
+
+# ストリームコピーできるコーデック（ブラウザがそのまま再生できるもの）
+COPY_CODECS = {"h264"}
+
+
+class RemuxCache:
+    def __init__(self, cache_dir: str, max_bytes: int):
+        self.cache_dir = cache_dir
+        self.disk = DiskCache(cache_dir, max_bytes, "remux cache")
+        self._pending_lock = threading.Lock()
+        self._queue: "queue.Queue[Tuple[str, str]]" = queue.Queue()
+        self._pending = set()
+        self._thread = None
+
+    def cache_path(self, camera: str, src: str) -> Optional[str]:
+        try:
+            st = os.stat(src)
+        except FileNotFoundError:
+            return None
+        stem = os.path.splitext(os.path.basename(src))[0]
+        return os.path.join(self.cache_dir, camera, f"{stem}.{st.st_size:x}-{st.st_mtime_ns:x}.mp4")
+
+    def get(self, camera: str, src: str) -> Optional[str]:
+        path = self.cache_path(camera, src)
+        return self.disk.lookup(path) if path else None
+
+    @staticmethod
+    def can_copy(src: str, priority: int = INTERACTIVE, timeout: Optional[float] = None) -> bool:
+        cache = get_media_cache()
+        meta = cache.get(src) or cache.probe(src, priority, timeout)
+        return bool(meta) and meta.get("codec") in COPY_CODECS
+
+    def remux(self, camera: str, src: str, priority: int = INTERACTIVE,
+              timeout: Optional[float] = None) -> Optional[str]:
+        """
+        Build (or wait for) the cached MP4 of a closed segment. Blocking.
+        With a timeout (interactive playback), raises JobQueueTimeout if the
+        probe and the remux together cannot get a slot in time.
+        """
+        path = self.cache_path(camera, src)
+        if path is None:
+            return None
+        if self.disk.lookup(path):
+            return path
+        deadline = None if timeout is None else time.monotonic() + timeout
+        # probe は変換ジョブの外で行う（ジョブ内で別の実行枠を待つとデッドロックする）
+        copy = self.can_copy(src, priority, timeout)
+        remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+        return get_job_scheduler().run(
+            "remux", os.path.basename(src), lambda: self._remux(camera, src, path, copy),
+            key=("remux", path), priority=priority, timeout=remaining,
+        )
+
+    def _remux(self, camera: str, src: str, path: str, copy: bool) -> Optional[str]:
+        # 待っている間に別のジョブが作り終えていることがある
+        if self.disk.lookup(path):
+            return path
+        if copy:
+            codec = ["-c:v", "copy"]
+        else:
+            codec = ["-c:v", "libx264", "-preset", "veryfast", "-crf", "23"]
+        tmp = self.disk.tmp_path(path)
+        cmd = ["ffmpeg", "-hide_banner", "-loglevel", "error", "-y",
+               "-i", src, "-map", "0:v:0", *codec, "-an",
+               "-movflags", "+faststart", "-f", "mp4", tmp]
+        try:
+            subprocess.run(cmd, check=True, stdin=subprocess.DEVNULL,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        except (OSError, subprocess.CalledProcessError) as e:
+            detail = getattr(e, "stderr", b"") or b""
+            logger.error(f"Remux failed for {src}: {e} {detail.decode(errors='replace').strip()}")
+            try:
+                os.remove(tmp)
+            except FileNotFoundError:
+                pass
+            return None
+        # 変換中に書き換えられていたら保存しない
+        if self.cache_path(camera, src) != path:
+            os.remove(tmp)
+            return None
+        logger.info(f"Remuxed {src} -> {path}")
+        return self.disk.commit(tmp, path)
+
+    # ----------------------------------------
+    # バックグラウンド変換（変換が必要なセグメント用）
+    # ----------------------------------------
+    def submit(self, camera: str, src: str):
+        with self._pending_lock:
+            if src in self._pending:
+                return
+            self._pending.add(src)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="remux", daemon=True)
+                self._thread.start()
+        self._queue.put((camera, src))
+
+    def _run(self):
+        while True:
+            camera, src = self._queue.get()
+            try:
+                self.remux(camera, src, BACKGROUND)
+            except Exception as e:
+                logger.error(f"Background remux failed for {src}: {e}")
+            finally:
+                with self._pending_lock:
+                    self._pending.discard(src)
+
+
+_remux_cache: Optional[RemuxCache] = None
+
+
+def get_remux_cache() -> RemuxCache:
+    global _remux_cache
+    if _remux_cache is None:
+        from common.config_loader import REMUX_CACHE_DIR, REMUX_CACHE_MAX_MB
+        _remux_cache = RemuxCache(REMUX_CACHE_DIR, REMUX_CACHE_MAX_MB * 1024 * 1024)
+    return _remux_cache
@@ -0,0 +1,160 @@
+import os
+import time
+import bisect
+import logging
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional, List, Dict, Callable
+
+from common.video_utils import parse_recording_timestamp, get_cached_video_duration
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Segment:
+    name: str
+    path: str
+    start: datetime
+    end: Optional[datetime] = None      # wall-clock end (file mtime)
+    duration: Optional[float] = None    # media duration (ffprobe)
+    closed: bool = False
+
+
+class SegmentIndex:
+    """
+    Sorted in-memory index of the recording segments of one camera.
+
+    The directory is only re-listed when its mtime changes (a segment was
+    created, renamed or removed), and only the new file names are parsed.
+    Lookups are a bisect over the sorted start times.
+    """
+
+    def __init__(self, records_dir: str, check_interval: float = 1.0,
+                 on_closed: Optional[Callable[[str], None]] = None):
+        self.records_dir = records_dir
+        self.check_interval = check_interval
+        self.on_closed = on_closed
+        self._lock = threading.Lock()
+        self._starts: List[datetime] = []
+        self._segments: List[Segment] = []
+        self._by_name: Dict[str, Segment] = {}
+        self._dir_mtime_ns = None
+        self._last_check = 0.0
+
+    def _refresh_locked(self, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self._last_check < self.check_interval:
+            return
+        self._last_check = now
+
+        try:
+            mtime_ns = os.stat(self.records_dir).st_mtime_ns
+        except FileNotFoundError:
+            self._starts, self._segments, self._by_name = [], [], {}
+            self._dir_mtime_ns = None
+            return
+
+        if mtime_ns == self._dir_mtime_ns:
+            return
+        self._dir_mtime_ns = mtime_ns
+
+        names = {n for n in os.listdir(self.records_dir) if n.endswith(".mkv")}
+        removed = self._by_name.keys() - names
+        added = names - self._by_name.keys()
+
+        for name in removed:
+            del self._by_name[name]
+        for name in added:
+            ts = parse_recording_timestamp(name)
+            if ts is None:
+                continue
+            self._by_name[name] = Segment(name, os.path.join(self.records_dir, name), ts)
+
+        if removed or added:
+            self._segments = sorted(self._by_name.values(), key=lambda s: (s.start, s.name))
+            self._starts = [s.start for s in self._segments]
+            # 最新以外のセグメントは書き込みが終わっている
+            for seg in self._segments[:-1]:
+                if not seg.closed:
+                    seg.closed = True
+                    seg.end = None
+                    if self.on_closed:
+                        self.on_closed(seg.path)
+
+    def refresh(self, force: bool = False):
+        with self._lock:
+            self._refresh_locked(force)
+
+    def _ensure_end(self, seg: Segment) -> Optional[datetime]:
+        # 書き込み中の（最新）セグメントは毎回 mtime を確認する
+        if seg.end is None or not seg.closed:
+            try:
+                seg.end = datetime.fromtimestamp(os.path.getmtime(seg.path))
+            except OSError:
+                return None
+        return seg.end
+
+    def duration(self, seg: Segment) -> Optional[float]:
+        """
+        Media duration of a closed segment from the probe cache (never probes).
+        """
+        if seg.duration is None and seg.closed:
+            seg.duration = get_cached_video_duration(seg.path)
+        return seg.duration
+
+    def segments(self) -> List[Segment]:
+        with self._lock:
+            self._refresh_locked()
+            return list(self._segments)
+
+    def latest(self) -> Optional[Segment]:
+        with self._lock:
+            self._refresh_locked()
+            if not self._segments:
+                return None
+            seg = self._segments[-1]
+            self._ensure_end(seg)
+            return seg
+
+    def get(self, name: str) -> Optional[Segment]:
+        with self._lock:
+            self._refresh_locked()
+            return self._by_name.get(name)
+
+    def find(self, event_time: datetime) -> Optional[Segment]:
+        """
+        Return the segment that started last at or before event_time.
+        """
+        with self._lock:
+            self._refresh_locked()
+            idx = bisect.bisect_right(self._starts, event_time)
+            if idx == 0:
+                return None
+            seg = self._segments[idx - 1]
+            self._ensure_end(seg)
+            return seg
+
+    def first_start(self) -> Optional[datetime]:
+        with self._lock:
+            return self._starts[0] if self._starts else None
+
+
+_indexes: Dict[str, SegmentIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_segment_index(camera: str) -> SegmentIndex:
+    """
+    Return the process-wide SegmentIndex of a camera's records directory.
+    """
+    with _indexes_lock:
+        index = _indexes.get(camera)
+        if index is None:
+            from common.config_loader import RECORDS_DIR_BASE
+            from common.video_utils import get_duration_prober
+            index = SegmentIndex(os.path.join(RECORDS_DIR_BASE, camera),
+                                 on_closed=get_duration_prober().submit)
+            _indexes[camera] = index
+        return index
@@ -1,9 +1,15 @@
 import os
+import json
+import time
+import queue
+import sqlite3
 import subprocess
-import functools
 import logging
+import threading
 from datetime import datetime
-from typing import Optional
+from typing import Optional, Dict, Any
+
+from common.media_jobs import BACKGROUND, JobQueueTimeout, get_job_scheduler
 
 logger = logging.getLogger(__name__)
 
@@ -18,26 +24,237 @@ def parse_recording_timestamp(filename: str) -> Optional[datetime]:
     except Exception:
         return None
 
-@functools.lru_cache(maxsize=1024)
+def probe_video(file_path: str) -> Dict[str, Any]:
+    """
+    Run ffprobe once and return duration and video stream metadata.
+    """
+    cmd = [
+        "ffprobe", "-v", "error",
+        "-select_streams", "v:0",
+        "-show_entries", "format=duration:stream=codec_name,width,height",
+        "-of", "json",
+        file_path
+    ]
+    output = subprocess.check_output(cmd, stderr=subprocess.DEVNULL).decode()
+    data = json.loads(output or "{}")
+    stream = (data.get("streams") or [{}])[0]
+    try:
+        duration = float(data.get("format", {}).get("duration", 0.0))
+    except (TypeError, ValueError):
+        duration = 0.0
+    return {
+        "duration": duration,
+        "codec": stream.get("codec_name"),
+        "width": stream.get("width"),
+        "height": stream.get("height"),
+    }
+
+# ---------------------------------------------------------
+# Persistent probe cache
+#   Keyed by (path, size, mtime_ns) so a segment that is still being
+#   written never keeps a stale duration. Stored in SQLite so that all
+#   API workers share it and it survives restarts.
+# ---------------------------------------------------------
+_MEDIA_SCHEMA = """
+CREATE TABLE IF NOT EXISTS media (
+    path       TEXT PRIMARY KEY,
+    size       INTEGER NOT NULL,
+    mtime_ns   INTEGER NOT NULL,
+    duration   REAL,
+    meta       TEXT,
+    claimed_at REAL
+);
+"""
+
+# 他のワーカーが probe 中とみなす時間（秒）
+_CLAIM_TIMEOUT = 60.0
+
+
+class MediaCache:
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._local = threading.local()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_MEDIA_SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _key(file_path: str) -> Optional[tuple]:
+        try:
+            st = os.stat(file_path)
+        except OSError:
+            return None
+        return st.st_size, st.st_mtime_ns
+
+    def get(self, file_path: str) -> Optional[Dict[str, Any]]:
+        """
+        Return cached metadata if it is still valid for the file on disk.
+        """
+        key = self._key(file_path)
+        if key is None:
+            return None
+        row = self._connect().execute(
+            "SELECT size, mtime_ns, duration, meta FROM media WHERE path = ?", (file_path,)
+        ).fetchone()
+        if row is None or (row[0], row[1]) != key or row[2] is None:
+            return None
+        meta = json.loads(row[3]) if row[3] else {}
+        meta["duration"] = row[2]
+        return meta
+
+    def claim(self, file_path: str) -> bool:
+        """
+        Reserve a file for probing so that other workers skip it.
+        Returns False if it is already cached or being probed elsewhere.
+        """
+        key = self._key(file_path)
+        if key is None:
+            return False
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT size, mtime_ns, duration, claimed_at FROM media WHERE path = ?", (file_path,)
+            ).fetchone()
+            if row is not None and (row[0], row[1]) == key:
+                if row[2] is not None:
+                    conn.execute("COMMIT")
+                    return False
+                if row[3] and time.time() - row[3] < _CLAIM_TIMEOUT:
+                    conn.execute("COMMIT")
+                    return False
+            conn.execute(
+                "INSERT OR REPLACE INTO media (path, size, mtime_ns, duration, meta, claimed_at) "
+                "VALUES (?, ?, ?, NULL, NULL, ?)",
+                (file_path, key[0], key[1], time.time()),
+            )
+            conn.execute("COMMIT")
+            return True
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def put(self, file_path: str, meta: Dict[str, Any], key: tuple):
+        data = {k: v for k, v in meta.items() if k != "duration"}
+        self._connect().execute(
+            "INSERT OR REPLACE INTO media (path, size, mtime_ns, duration, meta, claimed_at) "
+            "VALUES (?, ?, ?, ?, ?, NULL)",
+            (file_path, key[0], key[1], meta.get("duration", 0.0), json.dumps(data)),
+        )
+
+    def forget(self, file_path: str):
+        self._connect().execute("DELETE FROM media WHERE path = ?", (file_path,))
+
+    def probe(self, file_path: str, priority: int = BACKGROUND,
+              timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """
+        Probe a file with ffprobe (through the job scheduler, merged with any
+        probe of the same file already in flight) and store the result.
+        Raises JobQueueTimeout if no slot frees up within `timeout`
+        (interactive callers; background probes wait indefinitely).
+        """
+        key = self._key(file_path)
+        if key is None:
+            return None
+        try:
+            meta = get_job_scheduler().run(
+                "ffprobe", os.path.basename(file_path), lambda: probe_video(file_path),
+                key=("ffprobe", file_path, key), priority=priority, timeout=timeout,
+            )
+        except JobQueueTimeout:
+            raise
+        except Exception as e:
+            logger.error(f"Failed to probe {file_path}: {e}")
+            return None
+        # probe 中に書き込まれていたら結果は保存しない
+        if self._key(file_path) == key:
+            self.put(file_path, meta, key)
+        return meta
+
+
+_media_cache: Optional[MediaCache] = None
+
+
+def get_media_cache() -> MediaCache:
+    global _media_cache
+    if _media_cache is None:
+        from common.config_loader import MEDIA_CACHE_DB
+        _media_cache = MediaCache(MEDIA_CACHE_DB)
+    return _media_cache
+
 def get_video_duration(file_path: str) -> float:
     """
     Get the actual media duration of a video file using ffprobe.
+    The result is served from the persistent cache when the file is unchanged.
     """
+    cache = get_media_cache()
     try:
-        cmd = [
-            "ffprobe", "-v", "error", 
-            "-show_entries", "format=duration", 
-            "-of", "default=noprint_wrappers=1:nokey=1", 
-            file_path
-        ]
-        output = subprocess.check_output(cmd, stderr=subprocess.DEVNULL).decode().strip()
-        try:
-            return float(output)
-        except ValueError:
-            lines = output.splitlines()
-            if lines:
-                return float(lines[0])
-            return 0.0
+        meta = cache.get(file_path) or cache.probe(file_path)
     except Exception as e:
         logger.error(f"Failed to get duration for {file_path}: {e}")
         return 0.0
+    return meta["duration"] if meta else 0.0
+
+def get_cached_video_duration(file_path: str) -> Optional[float]:
+    """
+    Return the cached duration without ever running ffprobe.
+    """
+    try:
+        meta = get_media_cache().get(file_path)
+    except Exception as e:
+        logger.error(f"Failed to read media cache for {file_path}: {e}")
+        return None
+    return meta["duration"] if meta else None
+
+# ---------------------------------------------------------
+# Background prober
+#   Closed segments are queued here as they finalize so that API requests
+#   only ever read the cache.
+# ---------------------------------------------------------
+class DurationProber:
+    def __init__(self, cache: MediaCache):
+        self.cache = cache
+        self._queue: "queue.Queue[str]" = queue.Queue()
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="duration-prober", daemon=True)
+        self._thread.start()
+
+    def submit(self, file_path: str):
+        with self._lock:
+            if file_path in self._pending:
+                return
+            self._pending.add(file_path)
+        self._queue.put(file_path)
+
+    def _run(self):
+        while True:
+            file_path = self._queue.get()
+            try:
+                if self.cache.get(file_path) is None and self.cache.claim(file_path):
+                    self.cache.probe(file_path)
+            except Exception as e:
+                logger.error(f"Background probe failed for {file_path}: {e}")
+            finally:
+                with self._lock:
+                    self._pending.discard(file_path)
+
+
+_prober: Optional[DurationProber] = None
+_prober_lock = threading.Lock()
+
+
+def get_duration_prober() -> DurationProber:
+    global _prober
+    with _prober_lock:
+        if _prober is None:
+            _prober = DurationProber(get_media_cache())
+        return _prober
@@ -4,6 +4,7 @@
 #   - ESP32-CAM 専用録画エンジン
 #   - MJPEG → MKV copy
 #   - latest.jpg を 5fps で更新
+#   - motion.transport: shm_ring の場合は検知用の生フレームを frame_ring に出力
 #   - 分割は systemd RuntimeMaxSec に任せる
 # ---------------------------------------------------------
 
@@ -61,6 +62,51 @@ chmod 777 "$MOTION_TMP_DIR" "$RECORD_DIR"
 START_TIME=$(date -Is)
 OUTFILE="${RECORD_DIR}/$(date +%Y%m%d_%H%M%S).mkv"
 
+# ---------------------------------------------------------
+# 4.5 検知用生フレーム（motion.transport: shm_ring）
+#   - 検知用にグレースケールの生フレームを FIFO に書き出し、
+#     frame_ring.py が /dev/shm のリングバッファへ書き込む
+#   - rawvideo は固定サイズのため motion.ring_width / ring_height に縮小する
+#   - latest.jpg はダッシュボード・イベント保存用に従来どおり出力する
+# ---------------------------------------------------------
+TRANSPORT=$(get_cam_val "$CAM" '.motion.transport // "jpeg"')
+SPLIT_COUNT=2
+SPLIT_LABELS="[v_to_gpu][v_to_img]"
+RING_FILTER=""
+RING_OUTPUT=()
+
+if [ "$TRANSPORT" = "shm_ring" ]; then
+    RING_WIDTH=$(get_cam_val "$CAM" '.motion.ring_width // 640')
+    RING_HEIGHT=$(get_cam_val "$CAM" '.motion.ring_height // 480')
+    RING_FPS=$(get_cam_val "$CAM" '.motion.ring_fps // 5')
+    RING_FILE="${MOTION_TMP_DIR}/frames.ring"
+    RING_FIFO="${MOTION_TMP_DIR}/frames.fifo"
+    VENV_DIR=$(get_main_val '.common.python_venv_dir')
+    if [ -z "$VENV_DIR" ] || [ "$VENV_DIR" = "null" ]; then
+        VENV_DIR="/usr/local/nvr-venv"
+    fi
+
+    rm -f "$RING_FIFO"
+    mkfifo "$RING_FIFO"
+    # ffmpeg の終了（FIFO の EOF）で writer も終了する
+    PYTHONPATH="${NVR_BASE_DIR}:${PYTHONPATH:-}" \
+        "${VENV_DIR}/bin/python3" -m core.opencv.frame_ring write "$RING_FILE" \
+        --width "$RING_WIDTH" --height "$RING_HEIGHT" --format gray < "$RING_FIFO" &
+
+    SPLIT_COUNT=3
+    SPLIT_LABELS="${SPLIT_LABELS}[v_to_ring]"
+    RING_FILTER=";
+        [v_to_ring]fifo,fps=${RING_FPS},scale=${RING_WIDTH}:${RING_HEIGHT},format=gray[v_ring_out]"
+    RING_OUTPUT=(
+        -map "[v_ring_out]"
+        -f rawvideo
+        -pix_fmt gray
+        -y
+        "$RING_FIFO"
+    )
+    echo "[esp32cam] Raw frame ring: ${RING_FILE} (${RING_WIDTH}x${RING_HEIGHT} ${RING_FPS}fps)"
+fi
+
 # ---------------------------------------------------------
 # 5. ffmpeg 実行
 # ---------------------------------------------------------
@@ -84,9 +130,9 @@ exec /usr/bin/ffmpeg \
     -i "$RTSP_URL" \
     \
     -filter_complex "
-        [0:v]split=2[v_to_gpu][v_to_img];
+        [0:v]split=${SPLIT_COUNT}${SPLIT_LABELS};
         [v_to_gpu]format=nv12,hwupload[v_enc_out];
-        [v_to_img]fifo,fps=5,format=yuv420p,setrange=pc[v_img_final]
+        [v_to_img]fifo,fps=5,format=yuv420p,setrange=pc[v_img_final]${RING_FILTER}
     " \
     \
     -map "[v_enc_out]" \
@@ -105,4 +151,6 @@ exec /usr/bin/ffmpeg \
     -update 1 \
     -atomic_writing 1 \
     -y \
-    "$LATEST"
\ No newline at end of file
+    "$LATEST" \
+    \
+    ${RING_OUTPUT[@]+"${RING_OUTPUT[@]}"}
\ No newline at end of file
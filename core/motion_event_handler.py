@@ -0,0 +1,583 @@
+import os
+import sys
+import json
+import time
+import signal
+import functools
+import threading
+import subprocess
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from common.config_loader import (
+    load_camera_config,
+    load_main_config,
+    NVR_CORE_DIR
+)
+from common.frame_pack import FramePackWriter, frame_name
+from common.fs_watch import FrameWatcher
+from common.metrics import get_registry, start_publisher, stop_publisher, LAG_BUCKETS
+from core.opencv.motion_pipeline import is_valid_jpeg_bytes
+
+print = functools.partial(print, flush=True)
+
+# ---------------------------------------------------------
+# motion_event_handler.py
+#   - motion.flag（または検知器からの通知）に基づいてイベントを開始／終了する
+#   - イベント中は latest.jpg を連番 JPEG として保存する
+#   - フレームのサイズ・時刻はメモリ上で管理し、終了時に event.json を一括で書き出す
+#     （旧 motion_event_handler.sh の date / stat / xxd / cp / jq の fork をなくす）
+#   - 単体（カメラ別サービス）でも、motion_engine 内でも動作する
+# ---------------------------------------------------------
+
+# 状態確認の間隔（秒）。旧実装のループ間隔と同じ
+TICK_INTERVAL = 0.05
+# プレロールに保持するフレーム数の上限（pre_roll_sec と fps が大きすぎる場合の歯止め）
+PRE_ROLL_MAX_FRAMES = 100
+# 昼夜判定（get_daynight.sh）の結果を使い回す秒数
+DAYNIGHT_CACHE_SEC = 300
+
+
+# ----------------------------------------
+# 1. 設定ファイルの読み込み
+# ----------------------------------------
+@dataclass
+class EventSettings:
+    idle_sec: int = 10
+    post_motion_buffer_sec: int = 2
+    pre_roll_sec: float = 1.0
+    frame_storage: str = "files"     # files（連番 JPEG）/ pack（frames.pack）
+
+
+def load_event_settings(cam, main_cfg=None, cam_cfg=None) -> EventSettings:
+    """
+    Resolve the event settings of a camera (camera YAML -> main.yaml defaults).
+    """
+    main_cfg = main_cfg if main_cfg is not None else load_main_config()
+    cam_cfg = cam_cfg if cam_cfg is not None else load_camera_config(cam)
+
+    # event 設定（個別 → default）
+    event_cfg = cam_cfg.get("event", {}) or {}
+    common = main_cfg["common"]
+
+    return EventSettings(
+        idle_sec=event_cfg.get("timeout", common["default_event_timeout"]),
+        post_motion_buffer_sec=event_cfg.get(
+            "post_motion_buffer_sec", common["default_post_motion_buffer_sec"]),
+        # イベント開始前に遡って保存する秒数（0 で無効）
+        pre_roll_sec=event_cfg.get("pre_roll_sec", common.get("default_pre_roll_sec", 1.0)),
+        # フレームの保存形式（files / pack）
+        frame_storage=event_cfg.get("frame_storage", common.get("default_frame_storage", "files")),
+    )
+
+
+# ----------------------------------------
+# 2. イベント 1 件分の状態
+# ----------------------------------------
+@dataclass
+class SavedFrame:
+    name: str
+    size: int
+    mtime: float
+
+
+@dataclass
+class ActiveEvent:
+    event_id: str
+    event_dir: str
+    year: str
+    month: str
+    start_iso: str
+    start_epoch: int
+    daynight: str = "unknown"
+    frames: List[SavedFrame] = field(default_factory=list)
+    counter: int = 0
+    alert_sent: bool = False
+    trigger_frame: Optional[str] = None    # 検知時点のフレーム（これより前はプレロール）
+    brightness_min: Optional[float] = None
+    brightness_max: Optional[float] = None
+    pack: Optional[FramePackWriter] = None
+
+
+def _write_json_atomic(path: str, data: dict):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+def _parse_number(text: str):
+    text = text.strip()
+    if not text:
+        return None
+    try:
+        value = float(text)
+    except ValueError:
+        return None
+    return int(value) if value.is_integer() else value
+
+
+class HandlerMetrics:
+    """
+    Per-camera event handler instruments (GET /system/metrics).
+    """
+
+    def __init__(self, cam):
+        registry = get_registry()
+        lag_help = "Event handler lag: motion onset to event start (start), frame write to capture (capture)"
+        self.start_lag = registry.histogram("nvr_event_lag_seconds", lag_help, LAG_BUCKETS, camera=cam, stage="start")
+        self.capture_lag = registry.histogram("nvr_event_lag_seconds", lag_help, LAG_BUCKETS,
+                                              camera=cam, stage="capture")
+        self.events = registry.counter("nvr_events_started_total", "Events started", camera=cam)
+        self.frames = registry.counter("nvr_event_frames_saved_total",
+                                       "Frames saved to events, including pre-roll", camera=cam)
+
+
+# ----------------------------------------
+# 3. カメラ単位のイベント記録
+# ----------------------------------------
+class EventRecorder:
+    """
+    Event lifecycle of one camera: start on motion, save latest.jpg frames
+    while active, end after `idle_sec` without motion, trim frames saved
+    after the post-motion buffer and write event.json (same schema as the
+    former shell handler, see config/event.schema.json).
+
+    While idle, the last `pre_roll_sec` seconds of latest.jpg are kept as
+    the original JPEG bytes and written in front of the trigger frame when
+    an event starts.
+    """
+
+    def __init__(self, cam, main_cfg=None, log: Optional[Callable[[str], None]] = None):
+        self.cam = cam
+        self.log = log or (lambda msg: print(f"[handler] {msg}"))
+
+        main_cfg = main_cfg if main_cfg is not None else load_main_config()
+        self.settings = load_event_settings(cam, main_cfg)
+
+        common = main_cfg["common"]
+        self.events_base = common["events_dir_base"]
+        self.tmp_dir = f"{common['motion_tmp_base']}/{cam}"
+        self.latest_jpg = f"{self.tmp_dir}/latest.jpg"
+        self.motion_flag = f"{self.tmp_dir}/motion.flag"
+        self.yavg_file = f"{self.tmp_dir}/yavg.txt"
+
+        self.get_daynight = os.path.join(NVR_CORE_DIR, "get_daynight.sh")
+        self.send_alert = os.path.join(NVR_CORE_DIR, "send_motion_alert.sh")
+
+        self.event: Optional[ActiveEvent] = None
+        self.motion = False
+        self.motion_since: Optional[float] = None    # 動体ありになった時刻（遅延の計測用）
+        self.last_motion_time = 0.0
+        self.metrics = HandlerMetrics(cam)
+        self.last_saved_sig = None
+        # プレロール：(mtime, JPEG bytes)。デコード・再エンコードはしない
+        self.pre_roll: deque = deque(maxlen=PRE_ROLL_MAX_FRAMES)
+        self._children: List[subprocess.Popen] = []
+        self._lock = threading.Lock()
+        # 昼夜判定のキャッシュ：(値, 取得時刻 monotonic)。更新はバックグラウンドで行う
+        self._daynight_cache = ("unknown", None)
+        self._daynight_refreshing = False
+
+    @property
+    def active(self) -> bool:
+        return self.event is not None
+
+    @property
+    def wants_frames(self) -> bool:
+        """
+        True if latest.jpg updates should be passed to capture().
+        """
+        return self.event is not None or self.settings.pre_roll_sec > 0
+
+    # -----------------------------------------------------
+    # 状態入力
+    # -----------------------------------------------------
+    def set_motion(self, motion: bool, since: Optional[float] = None):
+        """
+        Motion state from the detector (in-process) or from motion.flag.
+        `since` is when the motion started (motion.flag mtime), if known.
+        Safe to call from detector worker threads.
+        """
+        with self._lock:
+            if motion and not self.motion:
+                self.motion_since = since if since is not None else time.time()
+            self.motion = motion
+            if motion:
+                self.last_motion_time = time.time()
+
+    def flag_state(self):
+        """
+        (motion, since) from motion.flag.
+        """
+        try:
+            return True, os.stat(self.motion_flag).st_mtime
+        except FileNotFoundError:
+            return False, None
+
+    def tick(self, now: Optional[float] = None):
+        """
+        Phase A of the former loop: start / timeout, independent of frames.
+        """
+        now = now if now is not None else time.time()
+        with self._lock:
+            motion = self.motion
+            if motion:
+                self.last_motion_time = now
+            last_motion = self.last_motion_time
+
+        if motion and self.event is None:
+            if self.motion_since is not None:
+                self.metrics.start_lag.observe(max(0.0, now - self.motion_since))
+            self.start_event(now)
+        elif not motion and self.event is not None:
+            # 最後の動きから idle_sec 経過したらイベント終了
+            if now - last_motion >= self.settings.idle_sec:
+                self.end_event()
+
+        self._reap_children()
+
+    # -----------------------------------------------------
+    # イベント開始
+    # -----------------------------------------------------
+    def start_event(self, now: float):
+        start = datetime.fromtimestamp(now).astimezone()
+        event_id = start.strftime("%Y%m%d_%H%M%S")
+        year, month = start.strftime("%Y"), start.strftime("%m")
+        event_dir = os.path.join(self.events_base, self.cam, year, month, event_id)
+        os.makedirs(event_dir, exist_ok=True)
+        os.chmod(event_dir, 0o777)
+
+        ev = ActiveEvent(
+            event_id=event_id, event_dir=event_dir, year=year, month=month,
+            start_iso=start.isoformat(timespec="seconds"), start_epoch=int(now),
+        )
+        if self.settings.frame_storage == "pack":
+            ev.pack = FramePackWriter(event_dir)
+        self.event = ev
+        self.metrics.events.inc()
+
+        # --- 検知前フレーム（プレロール）をまとめて書き出す ---
+        self._flush_pre_roll(ev, now)
+
+        # 最初の 1 枚はすぐに保存する（プレロール済みのフレームは除外される）
+        # latest.jpg がプレロール済みなら、その最後のフレームが検知時点のフレーム
+        if not self.capture() and ev.frames:
+            ev.trigger_frame = ev.frames[-1].name
+
+        ev.daynight = self._cached_daynight(ev)
+        self._write_event_json(ev, final=False)
+
+        self.log(f"EVENT START {event_id}")
+
+    def _cached_daynight(self, ev: ActiveEvent) -> str:
+        """
+        Last day/night result of this camera. If it is older than
+        DAYNIGHT_CACHE_SEC, get_daynight.sh runs on a background thread
+        (it forks yq several times) and patches ev.daynight before the
+        final event.json; the shared event loop never waits for it.
+        """
+        value, fetched = self._daynight_cache
+        if fetched is not None and time.monotonic() - fetched < DAYNIGHT_CACHE_SEC:
+            return value
+        with self._lock:
+            if self._daynight_refreshing:
+                return value
+            self._daynight_refreshing = True
+
+        def refresh():
+            try:
+                result = self._daynight()
+                self._daynight_cache = (result, time.monotonic())
+                ev.daynight = result
+            finally:
+                with self._lock:
+                    self._daynight_refreshing = False
+
+        threading.Thread(target=refresh, name=f"daynight-{self.cam}", daemon=True).start()
+        return value
+
+    def _daynight(self) -> str:
+        try:
+            out = subprocess.run(
+                [self.get_daynight, self.cam],
+                capture_output=True, text=True, timeout=10,
+            ).stdout.strip()
+        except (OSError, subprocess.SubprocessError):
+            return "unknown"
+        return out if out in ("day", "night") else "unknown"
+
+    # -----------------------------------------------------
+    # フレーム保存（Phase B）
+    # -----------------------------------------------------
+    def capture(self) -> bool:
+        """
+        Take the current latest.jpg if it is new and complete: saved into
+        the active event, or kept in the pre-roll ring while idle.
+        Returns True if a frame was saved to an event.
+        """
+        ev = self.event
+        if ev is None and self.settings.pre_roll_sec <= 0:
+            return False
+        try:
+            with open(self.latest_jpg, "rb") as f:
+                st = os.fstat(f.fileno())
+                sig = (st.st_mtime_ns, st.st_ino, st.st_size)
+                if sig == self.last_saved_sig:
+                    return False
+                data = f.read()
+        except FileNotFoundError:
+            return False
+
+        # 完全性チェック（壊れた JPEG を保存しない）
+        if not is_valid_jpeg_bytes(data):
+            return False
+        self.last_saved_sig = sig
+
+        if ev is None:
+            self._push_pre_roll(st.st_mtime, data)
+            return False
+
+        self._save_frame(ev, data, time.time())
+        self.metrics.capture_lag.observe(max(0.0, time.time() - st.st_mtime))
+        if ev.trigger_frame is None:
+            ev.trigger_frame = ev.frames[-1].name
+
+        # 初回検知時のアラート送信（非同期）
+        if not ev.alert_sent and os.access(self.send_alert, os.X_OK):
+            try:
+                self._children.append(subprocess.Popen([self.send_alert, ev.event_dir, ev.trigger_frame]))
+            except OSError as e:
+                self.log(f"Failed to start alert: {e}")
+            ev.alert_sent = True
+
+        # 輝度統計更新
+        self._update_brightness(ev)
+        return True
+
+    def _save_frames(self, ev: ActiveEvent, frames: List[tuple]):
+        """
+        Save (mtime, jpeg_bytes) frames; packed events get a single write.
+        """
+        batch = []
+        for mtime, data in frames:
+            ev.counter += 1
+            fname = frame_name(ev.counter)
+            if ev.pack is None:
+                with open(os.path.join(ev.event_dir, fname), "wb") as f:
+                    f.write(data)
+            batch.append((ev.counter, data, mtime))
+            ev.frames.append(SavedFrame(fname, len(data), mtime))
+        if ev.pack is not None:
+            ev.pack.append_many(batch)
+        self.metrics.frames.inc(len(batch))
+
+    def _save_frame(self, ev: ActiveEvent, data: bytes, mtime: float):
+        self._save_frames(ev, [(mtime, data)])
+
+    # -----------------------------------------------------
+    # プレロール
+    # -----------------------------------------------------
+    def _push_pre_roll(self, mtime: float, data: bytes):
+        self.pre_roll.append((mtime, data))
+        # pre_roll_sec より古いフレームを捨てる
+        limit = mtime - self.settings.pre_roll_sec
+        while self.pre_roll and self.pre_roll[0][0] < limit:
+            self.pre_roll.popleft()
+
+    def _flush_pre_roll(self, ev: ActiveEvent, now: float):
+        limit = now - self.settings.pre_roll_sec
+        frames = [(mtime, data) for mtime, data in self.pre_roll if mtime >= limit]
+        self.pre_roll.clear()
+        self._save_frames(ev, frames)
+
+    def _update_brightness(self, ev: ActiveEvent):
+        try:
+            with open(self.yavg_file, "r") as f:
+                val = _parse_number(f.read())
+        except OSError:
+            return
+        if val is None:
+            return
+        if ev.brightness_min is None or val < ev.brightness_min:
+            ev.brightness_min = val
+        if ev.brightness_max is None or val > ev.brightness_max:
+            ev.brightness_max = val
+
+    # -----------------------------------------------------
+    # イベント終了
+    # -----------------------------------------------------
+    def end_event(self):
+        ev = self.event
+        if ev is None:
+            return
+        self.event = None
+
+        # 末尾の無駄な静止画を削除する
+        # 「最後にモーションがあった時刻 + 余韻」より後に保存したフレームを消す
+        # （検知時点のフレームは残す）
+        cutoff = int(self.last_motion_time) + self.settings.post_motion_buffer_sec
+        kept = []
+        for fr in ev.frames:
+            if fr.name != ev.trigger_frame and int(fr.mtime) > cutoff:
+                if ev.pack is None:
+                    try:
+                        os.remove(os.path.join(ev.event_dir, fr.name))
+                    except FileNotFoundError:
+                        pass
+                continue
+            kept.append(fr)
+        if ev.pack is not None:
+            if len(kept) != len(ev.frames):
+                ev.pack.keep(int(fr.name[:-4]) for fr in kept)
+            ev.pack.close()
+        ev.frames = kept
+
+        self._write_event_json(ev, final=True)
+        self.log(f"EVENT END {ev.event_id} (Trimmed to {len(kept)} frames, "
+                 f"{self._duration(ev)}s)")
+
+        # 一覧用の縮小サムネイルを先に作っておく（失敗しても Web 側で遅延生成される）
+        try:
+            from common.event_thumbs import get_thumb_cache
+            get_thumb_cache().prerender(ev.event_dir)
+        except Exception as e:
+            self.log(f"Thumbnail prerender failed: {e!r}")
+
+    @staticmethod
+    def _duration(ev: ActiveEvent) -> int:
+        # 開始時刻 〜 最後に保存したフレームの時刻
+        last = max((fr.mtime for fr in ev.frames), default=ev.start_epoch)
+        return max(0, int(last) - ev.start_epoch)
+
+    def _write_event_json(self, ev: ActiveEvent, final: bool):
+        frames = sorted(ev.frames, key=lambda fr: fr.name) if final else []
+        meta = {
+            "timestamp": ev.start_iso,
+            "timestamp_end": datetime.now().astimezone().isoformat(timespec="seconds") if final else None,
+            "duration_sec": self._duration(ev) if final else 0,
+
+            "camera": self.cam,
+            "event_timeout": self.settings.idle_sec,
+
+            "daynight": ev.daynight,
+
+            "brightness_min": ev.brightness_min if final else None,
+            "brightness_max": ev.brightness_max if final else None,
+
+            "jpeg_count": len(frames),
+            "first_frame": frames[0].name if frames else None,
+            "last_frame": frames[-1].name if frames else None,
+            "trigger_frame": ev.trigger_frame,
+
+            "total_size_bytes": sum(fr.size for fr in frames),
+
+            "ai_tags": [],
+            "ai_objects": [],
+            "ai_confidence": [],
+        }
+        _write_json_atomic(os.path.join(ev.event_dir, "event.json"), meta)
+
+        # イベントインデックス更新（失敗してもイベント処理は継続する）
+        try:
+            from common.event_index import get_event_index
+            get_event_index().upsert(self.cam, ev.year, ev.month, ev.event_id, meta)
+        except Exception as e:
+            self.log(f"Event index update failed: {e!r}")
+
+    def _reap_children(self):
+        if self._children:
+            self._children = [p for p in self._children if p.poll() is None]
+
+    def close(self):
+        if self.event is not None:
+            self.log(f"terminating active event {self.event.event_id}")
+            self.end_event()
+
+
+# ----------------------------------------
+# 4. 複数カメラのイベント処理ループ
+# ----------------------------------------
+class EventService:
+    """
+    Drives EventRecorders: checks start / timeout every TICK_INTERVAL and
+    saves latest.jpg frames on inotify notifications while an event is
+    active. With use_flags=True the motion state is read from motion.flag
+    (standalone service); inside motion_engine the detector calls
+    EventRecorder.set_motion() directly.
+    """
+
+    def __init__(self, recorders: Dict[str, EventRecorder], use_flags: bool = True):
+        self.recorders = recorders
+        self.use_flags = use_flags
+        self._stop = threading.Event()
+
+    def stop(self):
+        self._stop.set()
+
+    def run(self):
+        watcher = FrameWatcher("latest.jpg")
+        for cam, rec in self.recorders.items():
+            watcher.add(cam, rec.tmp_dir)
+
+        try:
+            while not self._stop.is_set():
+                ready = watcher.wait(timeout=TICK_INTERVAL)
+                now = time.time()
+                for cam, rec in self.recorders.items():
+                    try:
+                        if self.use_flags:
+                            rec.set_motion(*rec.flag_state())
+                        rec.tick(now)
+                        if cam in ready and rec.wants_frames:
+                            rec.capture()
+                    except Exception as e:
+                        # 1 カメラの異常は他のカメラに影響させない
+                        rec.log(f"Error: {e!r}")
+        finally:
+            watcher.close()
+            for rec in self.recorders.values():
+                try:
+                    rec.close()
+                except Exception as e:
+                    rec.log(f"Error while closing event: {e!r}")
+
+
+# ----------------------------------------
+# 5. メイン処理
+#   python3 -m core.motion_event_handler <camera_name> [<camera_name> ...]
+# ----------------------------------------
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: motion_event_handler.py <camera_name> [<camera_name> ...]")
+        sys.exit(1)
+
+    main_cfg = load_main_config()
+    recorders = {}
+    for cam in sys.argv[1:]:
+        log = functools.partial(lambda c, msg: print(f"[handler:{c}] {msg}"), cam)
+        recorders[cam] = EventRecorder(cam, main_cfg, log=log)
+        log(f"start for {cam}")
+
+    service = EventService(recorders, use_flags=True)
+
+    # 終了シグナルで進行中のイベントを閉じる
+    def _on_signal(signum, _frame):
+        print("[handler] received termination signal")
+        service.stop()
+
+    signal.signal(signal.SIGTERM, _on_signal)
+    signal.signal(signal.SIGINT, _on_signal)
+    start_publisher("motion_event_handler@" + "+".join(sys.argv[1:]))
+
+    service.run()
+    stop_publisher()
+
+
+# ----------------------------------------
+# 実行
+# ----------------------------------------
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,529 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import resource
+import functools
+from dataclasses import dataclass, field, asdict
+from typing import Dict, List, Optional, Tuple, Union
+
+import cv2
+import numpy as np
+
+from common.frame_pack import list_frames, read_frame
+from core.opencv.motion_pipeline import MotionDetector, MotionSettings, WARMUP_FRAMES
+
+print = functools.partial(print, flush=True)
+
+# ---------------------------------------------------------
+# bench_motion.py
+#   動体検知パイプライン（motion_pipeline.MotionDetector）のベンチマーク
+#   - /etc/nvr・systemd・カメラなしで動く（設定ファイルを読まない）
+#   - 合成シーン（静止・歩行者・帯状ノイズ・グリッチ）または録画済みフレームを流す
+#   - fps、段階別の処理時間（p50/p95/p99）、最大 RSS、フレームごとの判定を出力する
+#   - 保存したベースラインと比べ、速度の低下・判定の変化があれば終了コード 1
+#
+#   python3 -m core.opencv.bench_motion --save-baseline /var/tmp/motion_bench.json
+#   python3 -m core.opencv.bench_motion --baseline /var/tmp/motion_bench.json
+#   python3 -m core.opencv.bench_motion --input <event_dir | video.mkv> --scale 2 --cascade
+# ---------------------------------------------------------
+
+SCENARIOS = ("static", "walker", "noise_bands", "glitch")
+
+# フレームごとの判定
+#   M: 動体あり  G: グリッチとして破棄  .: 動体なし  x: デコード失敗
+# 期待値には ?（判定しない: ウォームアップ中、画面端の出入り、消えた直後）も使う
+MOTION, GLITCH, NONE, UNREADABLE, ANY = "M", "G", ".", "x", "?"
+
+# 合成シーンの既定値（720p のカメラを想定）
+DEFAULT_WIDTH = 1280
+DEFAULT_HEIGHT = 720
+DEFAULT_FRAMES = 150
+JPEG_QUALITY = 85
+SENSOR_NOISE_SIGMA = 2.0
+# 歩行者が画面から出た後、背景モデルの残像を許容するフレーム数
+WALKER_TAIL_FRAMES = 10
+GLITCH_EVERY = 15
+
+Frame = Union[bytes, np.ndarray]
+
+
+# ----------------------------------------
+# 1. 合成シーン
+# ----------------------------------------
+class SceneBuilder:
+    """
+    Deterministic synthetic camera frames: a textured static background
+    with a timestamp overlay (inside the cropped top area) and per-frame
+    sensor noise. Each scenario returns BGR frames and the expected
+    decision per frame.
+    """
+
+    def __init__(self, width: int, height: int, seed: int = 1):
+        self.width = width
+        self.height = height
+        self.k = height / 720
+        self.rng = np.random.default_rng(seed)
+
+        grad = np.linspace(70, 170, width, dtype=np.float32)[None, :].repeat(height, axis=0)
+        texture = cv2.GaussianBlur(self.rng.normal(0, 30, (height, width)).astype(np.float32), (0, 0), 3)
+        gray = np.clip(grad + texture, 0, 255).astype(np.uint8)
+        bg = cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
+        # 建物・植え込みに見立てた静止物
+        cv2.rectangle(bg, (int(width * 0.6), int(height * 0.3)), (int(width * 0.9), int(height * 0.8)), (90, 95, 100), -1)
+        cv2.rectangle(bg, (0, int(height * 0.85)), (width, height), (60, 90, 60), -1)
+        self.background = bg
+
+    def _base(self, i: int) -> np.ndarray:
+        frame = self.background.copy()
+        stamp = f"2025-01-01 12:00:{i // 10 % 60:02d}"
+        cv2.putText(frame, stamp, (int(20 * self.k), int(50 * self.k)), cv2.FONT_HERSHEY_SIMPLEX,
+                    1.2 * self.k, (255, 255, 255), max(1, int(2 * self.k)))
+        return frame
+
+    def _noisy(self, frame: np.ndarray) -> np.ndarray:
+        noise = self.rng.standard_normal((self.height, self.width, 1), dtype=np.float32) * SENSOR_NOISE_SIGMA
+        return np.clip(frame + noise, 0, 255).astype(np.uint8)
+
+    @staticmethod
+    def _warmup_expectations(n: int) -> List[str]:
+        return [ANY if i <= WARMUP_FRAMES else NONE for i in range(1, n + 1)]
+
+    def static(self, n: int) -> Tuple[List[np.ndarray], List[str]]:
+        return [self._noisy(self._base(i)) for i in range(n)], self._warmup_expectations(n)
+
+    def walker(self, n: int) -> Tuple[List[np.ndarray], List[str]]:
+        """
+        A person-sized silhouette crossing the frame left to right.
+        """
+        k = self.k
+        body_w, body_h = int(50 * k), int(180 * k)
+        speed = max(1, int(round(12 * k)))
+        enter = WARMUP_FRAMES + 15
+        y_feet = int(self.height * 0.84)
+        frames, expected = [], self._warmup_expectations(n)
+        exited_at = None
+        for i in range(n):
+            frame = self._base(i)
+            x = -body_w + (i - enter) * speed
+            if i >= enter and x < self.width:
+                top = y_feet - body_h
+                head_r = int(body_w * 0.35)
+                cx = x + body_w // 2
+                cv2.circle(frame, (cx, top + head_r), head_r, (45, 40, 40), -1)
+                cv2.rectangle(frame, (x + body_w // 8, top + 2 * head_r), (x + body_w - body_w // 8, top + int(body_h * 0.6)),
+                              (30, 30, 110), -1)
+                stride = int(body_w * 0.3) if (i // 3) % 2 else 0
+                cv2.line(frame, (cx, top + int(body_h * 0.6)), (cx - stride, y_feet), (35, 35, 35), max(2, int(10 * k)))
+                cv2.line(frame, (cx, top + int(body_h * 0.6)), (cx + stride, y_feet), (35, 35, 35), max(2, int(10 * k)))
+                fully_visible = 0 <= x and x + body_w <= self.width
+                expected[i] = MOTION if fully_visible else ANY
+            elif i >= enter and exited_at is None:
+                exited_at = i
+            if exited_at is not None and i < exited_at + WALKER_TAIL_FRAMES:
+                expected[i] = ANY
+            frames.append(self._noisy(frame))
+        return frames, expected
+
+    def noise_bands(self, n: int) -> Tuple[List[np.ndarray], List[str]]:
+        """
+        Thin full-width interference bands on random frames: must not be
+        reported as motion (vertical opening / aspect ratio filters).
+        """
+        frames = []
+        for i in range(n):
+            frame = self._base(i).astype(np.int16)
+            if i > WARMUP_FRAMES and self.rng.random() < 0.35:
+                for _ in range(self.rng.integers(1, 4)):
+                    y = int(self.rng.integers(int(100 * self.k), self.height - 20))
+                    h = int(self.rng.integers(2, max(3, int(12 * self.k))))
+                    frame[y:y + h] += self.rng.integers(-70, 70, (h, self.width, 1), dtype=np.int16)
+            frames.append(self._noisy(np.clip(frame, 0, 255)))
+        return frames, self._warmup_expectations(n)
+
+    def glitch(self, n: int) -> Tuple[List[np.ndarray], List[str]]:
+        """
+        Every GLITCH_EVERY-th frame has its lower half smeared (decoder
+        error); those frames must be dropped as glitches.
+        """
+        frames, expected = [], self._warmup_expectations(n)
+        for i in range(n):
+            frame = self._base(i)
+            if i > WARMUP_FRAMES and i % GLITCH_EVERY == 0:
+                half = self.height // 2
+                smear = np.repeat(frame[half:half + 1], self.height - half, axis=0)
+                frame[half:] = np.clip(smear.astype(np.int16) + 60, 0, 255).astype(np.uint8)
+                frame[half:, :, 1] = 200
+                expected[i] = GLITCH
+            frames.append(self._noisy(frame))
+        return frames, expected
+
+    def build(self, name: str, n: int) -> Tuple[List[np.ndarray], List[str]]:
+        return getattr(self, name)(n)
+
+
+# ----------------------------------------
+# 2. 録画済みフレーム
+# ----------------------------------------
+def load_recorded(path: str, limit: int) -> List[np.ndarray]:
+    """
+    BGR frames from an event directory (loose JPEGs or frames.pack) or a
+    video file (*.mkv / *.mp4).
+    """
+    frames = []
+    if os.path.isdir(path):
+        for name in list_frames(path)[:limit]:
+            data = read_frame(path, name)
+            img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR) if data else None
+            if img is not None:
+                frames.append(img)
+    else:
+        cap = cv2.VideoCapture(path)
+        while len(frames) < limit:
+            ok, img = cap.read()
+            if not ok:
+                break
+            frames.append(img)
+        cap.release()
+    if not frames:
+        raise ValueError(f"No frames could be read from {path}")
+    return frames
+
+
+def encode_frames(frames: List[np.ndarray], transport: str) -> List[Frame]:
+    """
+    What the detector receives in production: latest.jpg bytes (jpeg) or
+    a gray frame straight from the frame ring (raw).
+    """
+    if transport == "raw":
+        return [cv2.cvtColor(f, cv2.COLOR_BGR2GRAY) for f in frames]
+    params = [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY]
+    return [cv2.imencode(".jpg", f, params)[1].tobytes() for f in frames]
+
+
+# ----------------------------------------
+# 3. 計測
+# ----------------------------------------
+class RecordingTimer:
+    """
+    MotionDetector stage timer that keeps every sample (for percentiles).
+    """
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = {}
+        self._mark = 0.0
+
+    def start(self):
+        self._mark = time.perf_counter()
+
+    def lap(self, stage: str):
+        now = time.perf_counter()
+        self.record(stage, now - self._mark)
+        self._mark = now
+
+    def record(self, stage: str, seconds: float):
+        self.samples.setdefault(stage, []).append(seconds)
+
+
+def percentiles_ms(samples: List[float]) -> Dict[str, float]:
+    arr = np.asarray(samples) * 1000
+    return {f"p{p}": round(float(np.percentile(arr, p)), 3) for p in (50, 95, 99)}
+
+
+def _reset_peak_rss():
+    # Linux: 最大 RSS（VmHWM）を現在値に戻し、シナリオごとのピークを測れるようにする
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def _peak_rss_mb() -> float:
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    # Linux 以外: プロセス全体の最大値（Linux は KiB、macOS はバイト）
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+@dataclass
+class ScenarioResult:
+    frames: int
+    fps: float
+    stages: Dict[str, Dict[str, float]]
+    decisions: str
+    expected: Optional[str]
+    gated: int
+    peak_rss_mb: float
+    accuracy: Dict[str, Optional[float]] = field(default_factory=dict)
+
+
+def score(decisions: str, expected: str) -> Dict[str, Optional[float]]:
+    pairs = [(d, e) for d, e in zip(decisions, expected) if e != ANY]
+    tp = sum(1 for d, e in pairs if e == MOTION and d == MOTION)
+    fn = sum(1 for d, e in pairs if e == MOTION and d != MOTION)
+    fp = sum(1 for d, e in pairs if e != MOTION and d == MOTION)
+    glitches = sum(1 for _d, e in pairs if e == GLITCH)
+    caught = sum(1 for d, e in pairs if e == GLITCH and d == GLITCH)
+    return {
+        "recall": round(tp / (tp + fn), 3) if tp + fn else None,
+        "false_positives": fp,
+        "glitch_recall": round(caught / glitches, 3) if glitches else None,
+    }
+
+
+def run_scenario(frames: List[Frame], settings: MotionSettings, expected: Optional[List[str]] = None,
+                 mask: Optional[np.ndarray] = None, verbose: bool = False) -> ScenarioResult:
+    """
+    Feed frames through a fresh MotionDetector the way CameraRunner does
+    (decode / downscale, process, warm-up gating) and time every stage.
+    """
+    _reset_peak_rss()
+    timer = RecordingTimer()
+    log = print if verbose else (lambda msg: None)
+    detector = MotionDetector(settings, mask, log, timer)
+    decisions = []
+
+    started = time.perf_counter()
+    for data in frames:
+        t0 = time.perf_counter()
+        if isinstance(data, bytes):
+            frame = MotionDetector.decode(data, settings.scale, gray=settings.cascade)
+        else:
+            frame = MotionDetector.reduce(data, settings.scale)
+        t1 = time.perf_counter()
+        timer.record("decode", t1 - t0)
+        if frame is None:
+            decisions.append(UNREADABLE)
+            continue
+        result = detector.process(frame)
+        timer.record("process", time.perf_counter() - t1)
+        if result.glitch:
+            decisions.append(GLITCH)
+        elif result.motion and detector.warmed_up:
+            decisions.append(MOTION)
+        else:
+            decisions.append(NONE)
+    elapsed = time.perf_counter() - started
+
+    decided = "".join(decisions)
+    expected_str = "".join(expected) if expected else None
+    return ScenarioResult(
+        frames=len(frames),
+        fps=round(len(frames) / elapsed, 2) if elapsed > 0 else 0.0,
+        stages={stage: percentiles_ms(s) for stage, s in timer.samples.items()},
+        decisions=decided,
+        expected=expected_str,
+        gated=detector.gated,
+        peak_rss_mb=_peak_rss_mb(),
+        accuracy=score(decided, expected_str) if expected_str else {},
+    )
+
+
+# ----------------------------------------
+# 4. ベースラインとの比較
+# ----------------------------------------
+def environment() -> Dict[str, str]:
+    return {
+        "python": platform.python_version(),
+        "opencv": cv2.__version__,
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "cpu_count": str(os.cpu_count()),
+    }
+
+
+def compare(report: dict, baseline: dict, max_slowdown: float, max_changes: int) -> Tuple[List[str], List[str]]:
+    """
+    (regressions, warnings) of report against baseline. Regressions: fps
+    below (1 - max_slowdown) of the baseline, more than max_changes frame
+    decisions changed, lower recall or more false positives.
+    """
+    regressions, warnings = [], []
+    run, base_run = report["run"], baseline.get("run", {})
+    if run != base_run:
+        base_settings = base_run.get("settings", {})
+        diff = {k: (base_run.get(k), run.get(k)) for k in set(run) | set(base_run)
+                if k != "settings" and base_run.get(k) != run.get(k)}
+        diff.update({k: (base_settings.get(k), run["settings"].get(k)) for k in set(run["settings"]) | set(base_settings)
+                     if base_settings.get(k) != run["settings"].get(k)})
+        regressions.append("baseline was recorded with a different run (baseline, now): "
+                           + ", ".join(f"{k}={b!r}->{c!r}" for k, (b, c) in diff.items()))
+        return regressions, warnings
+    if report["environment"] != baseline.get("environment"):
+        warnings.append(f"environment differs from the baseline: {baseline.get('environment')}")
+
+    for name, cur in report["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(name)
+        if base is None:
+            warnings.append(f"{name}: not in the baseline")
+            continue
+        if cur["fps"] < base["fps"] * (1 - max_slowdown):
+            regressions.append(f"{name}: {cur['fps']:.1f} fps, baseline {base['fps']:.1f} fps "
+                               f"({cur['fps'] / base['fps'] - 1:+.0%})")
+        for stage, pct in cur["stages"].items():
+            base_p50 = base["stages"].get(stage, {}).get("p50")
+            if base_p50 and pct["p50"] > base_p50 * (1 + max_slowdown):
+                warnings.append(f"{name}: {stage} p50 {pct['p50']:.2f}ms, baseline {base_p50:.2f}ms")
+
+        changed = [i for i, (a, b) in enumerate(zip(cur["decisions"], base["decisions"])) if a != b]
+        if len(cur["decisions"]) != len(base["decisions"]) or len(changed) > max_changes:
+            regressions.append(f"{name}: {len(changed)} frame decisions changed (frames {changed[:10]}"
+                               f"{' ...' if len(changed) > 10 else ''})")
+        acc, base_acc = cur.get("accuracy", {}), base.get("accuracy", {})
+        for key in ("recall", "glitch_recall"):
+            if acc.get(key) is not None and base_acc.get(key) is not None and acc[key] < base_acc[key]:
+                regressions.append(f"{name}: {key} {acc[key]}, baseline {base_acc[key]}")
+        if acc.get("false_positives", 0) > base_acc.get("false_positives", 0):
+            regressions.append(f"{name}: {acc['false_positives']} false positive frames, "
+                               f"baseline {base_acc['false_positives']}")
+    return regressions, warnings
+
+
+def print_report(report: dict):
+    print(f"{'scenario':<14} {'frames':>6} {'fps':>8} {'process p50/p95/p99 ms':>24} "
+          f"{'motion':>6} {'glitch':>6} {'gated':>6} {'recall':>6} {'fp':>4} {'rss MB':>7}")
+    for name, r in report["scenarios"].items():
+        proc = r["stages"].get("process", {})
+        acc = r["accuracy"]
+        recall = "-" if acc.get("recall") is None else f"{acc['recall']:.2f}"
+        fp = "-" if "false_positives" not in acc else str(acc["false_positives"])
+        print(f"{name:<14} {r['frames']:>6} {r['fps']:>8.1f} "
+              f"{proc.get('p50', 0):>8.2f}/{proc.get('p95', 0):.2f}/{proc.get('p99', 0):.2f} "
+              f"{r['decisions'].count(MOTION):>6} {r['decisions'].count(GLITCH):>6} {r['gated']:>6} "
+              f"{recall:>6} {fp:>4} {r['peak_rss_mb']:>7.1f}")
+    print()
+    for name, r in report["scenarios"].items():
+        stages = ", ".join(f"{s} {p['p50']:.2f}/{p['p95']:.2f}" for s, p in r["stages"].items()
+                           if s != "process")
+        print(f"{name:<14} p50/p95 ms: {stages}")
+        print(f"{'':<14} decisions : {r['decisions']}")
+        if r["expected"]:
+            print(f"{'':<14} expected  : {r['expected']}")
+
+
+# ----------------------------------------
+# 5. メイン処理
+# ----------------------------------------
+def coerce_setting(settings: MotionSettings, key: str, value: str):
+    """
+    Convert a KEY=VALUE command line string to the type of the
+    MotionSettings field (ValueError for unknown keys or bad values).
+    """
+    if not hasattr(settings, key):
+        raise ValueError(f"unknown motion setting: {key}")
+    default = getattr(settings, key)
+    if isinstance(default, bool):
+        return value.lower() in ("1", "true", "yes")
+    try:
+        return type(default)(value)
+    except ValueError:
+        raise ValueError(f"invalid value for {key}: {value!r}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the motion detection pipeline")
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS,
+                        help="synthetic scenario to run (repeatable, default: all)")
+    parser.add_argument("--input", action="append", default=[],
+                        help="recorded frames instead: event directory or video file (repeatable)")
+    parser.add_argument("--frames", type=int, default=DEFAULT_FRAMES, help="frames per scenario")
+    parser.add_argument("--width", type=int, default=DEFAULT_WIDTH)
+    parser.add_argument("--height", type=int, default=DEFAULT_HEIGHT)
+    parser.add_argument("--transport", choices=("jpeg", "raw"), default="jpeg",
+                        help="jpeg: decode latest.jpg bytes, raw: gray frames as from the frame ring")
+    parser.add_argument("--mask", help="mask image (white = watched area)")
+    parser.add_argument("--set", action="append", default=[], metavar="KEY=VALUE",
+                        help="MotionSettings override, e.g. --set threshold=40")
+    parser.add_argument("--scale", type=int, help="processing scale (1/2/4/8)")
+    parser.add_argument("--cascade", action="store_true", help="enable the cascade gate")
+    parser.add_argument("--baseline", help="compare against this baseline (JSON)")
+    parser.add_argument("--save-baseline", help="write the results as a new baseline (JSON)")
+    parser.add_argument("--max-slowdown", type=float, default=0.15,
+                        help="allowed fps drop against the baseline (fraction)")
+    parser.add_argument("--max-decision-changes", type=int, default=0,
+                        help="allowed number of changed frame decisions per scenario")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    parser.add_argument("--verbose", action="store_true", help="show detector log lines")
+    args = parser.parse_args(argv)
+
+    settings = MotionSettings()
+    overrides = dict(kv.split("=", 1) for kv in args.set)
+    for key, value in overrides.items():
+        try:
+            setattr(settings, key, coerce_setting(settings, key, value))
+        except ValueError as e:
+            parser.error(str(e))
+    if args.scale:
+        settings.scale = args.scale
+    if args.cascade:
+        settings.cascade = True
+
+    mask = MotionDetector.load_mask(args.mask, lambda msg: None) if args.mask else None
+
+    # 入力の準備（生成・エンコードは計測に含めない）
+    inputs: List[Tuple[str, List[Frame], Optional[List[str]]]] = []
+    if args.input:
+        for path in args.input:
+            frames = load_recorded(path, args.frames)
+            inputs.append((os.path.basename(os.path.normpath(path)), encode_frames(frames, args.transport), None))
+        width, height = frames[0].shape[1], frames[0].shape[0]
+    else:
+        width, height = args.width, args.height
+        builder = SceneBuilder(width, height)
+        for name in args.scenario or SCENARIOS:
+            frames, expected = builder.build(name, args.frames)
+            inputs.append((name, encode_frames(frames, args.transport), expected))
+            del frames
+
+    report = {
+        "run": {
+            "settings": asdict(settings),
+            "resolution": [width, height],
+            "frames": args.frames,
+            "transport": args.transport,
+            "mask": bool(args.mask),
+        },
+        "environment": environment(),
+        "scenarios": {},
+    }
+    for name, frames, expected in inputs:
+        result = run_scenario(frames, settings, expected, mask, args.verbose)
+        report["scenarios"][name] = asdict(result)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+    status = 0
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        regressions, warnings = compare(report, baseline, args.max_slowdown, args.max_decision_changes)
+        for w in warnings:
+            print(f"WARNING: {w}", file=sys.stderr)
+        for r in regressions:
+            print(f"REGRESSION: {r}", file=sys.stderr)
+        if regressions:
+            status = 1
+        else:
+            print(f"OK: no regression against {args.baseline}")
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline written to {args.save_baseline}")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,221 @@
+import os
+import sys
+import mmap
+import time
+import struct
+import argparse
+import functools
+from typing import Optional, Tuple
+
+import numpy as np
+
+print = functools.partial(print, flush=True)
+
+# ---------------------------------------------------------
+# frame_ring.py
+#   ffmpeg → 検知器の生フレーム受け渡し用リングバッファ（/dev/shm 上の固定長ファイル）
+#
+#   [header 64B][slot header 16B x slots][frame x slots]
+#     header : magic, version, pix_fmt, width, height, slots, frame_size, write_seq
+#     slot   : seq (0 = 書き込み中), timestamp (ns)
+#
+#   - writer は ffmpeg の rawvideo 出力（FIFO）をスロットへ直接 readinto する
+#   - reader は最新スロットを numpy 配列として参照し、手元へ 1 回だけ取り出す（縮小時は縮小結果）
+#   - 取り出し後に slot seq を再確認し、上書きされていればそのフレームを処理せずに捨てる
+# ---------------------------------------------------------
+
+MAGIC = b"NVRRING1"
+VERSION = 1
+
+PIX_FMT_GRAY = 0
+PIX_FMT_NV12 = 1
+PIX_FMTS = {"gray": PIX_FMT_GRAY, "nv12": PIX_FMT_NV12}
+
+_HEADER = struct.Struct("<8sIIIIIIQ")     # magic, version, pix_fmt, w, h, slots, frame_size, write_seq
+_HEADER_SIZE = 64
+_WRITE_SEQ_OFFSET = 8 + 4 * 6
+_SLOT = struct.Struct("<QQ")              # seq, ts_ns
+_ALIGN = 64
+
+
+def frame_size_for(pix_fmt: int, width: int, height: int) -> int:
+    if pix_fmt == PIX_FMT_NV12:
+        return width * height * 3 // 2
+    return width * height
+
+
+def _align(n: int) -> int:
+    return (n + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+def _layout(slots: int, frame_size: int) -> Tuple[int, int, int]:
+    slot_hdr_off = _HEADER_SIZE
+    data_off = _align(slot_hdr_off + _SLOT.size * slots)
+    stride = _align(frame_size)
+    return slot_hdr_off, data_off, stride
+
+
+class FrameRingWriter:
+    def __init__(self, path: str, width: int, height: int, pix_fmt: int = PIX_FMT_GRAY, slots: int = 4):
+        self.path = path
+        self.width = width
+        self.height = height
+        self.pix_fmt = pix_fmt
+        self.slots = slots
+        self.frame_size = frame_size_for(pix_fmt, width, height)
+        self._slot_hdr_off, self._data_off, self._stride = _layout(slots, self.frame_size)
+        total = self._data_off + self._stride * slots
+
+        # 一時ファイルで作ってから rename（reader が中途半端なヘッダを見ないように）
+        tmp = f"{path}.tmp"
+        fd = os.open(tmp, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o666)
+        try:
+            os.ftruncate(fd, total)
+            self._mm = mmap.mmap(fd, total)
+        finally:
+            os.close(fd)
+        _HEADER.pack_into(self._mm, 0, MAGIC, VERSION, pix_fmt, width, height,
+                          slots, self.frame_size, 0)
+        os.replace(tmp, path)
+        self.seq = 0
+
+    def slot_buffer(self, seq: int) -> memoryview:
+        slot = seq % self.slots
+        off = self._data_off + slot * self._stride
+        return memoryview(self._mm)[off:off + self.frame_size]
+
+    def begin(self) -> Tuple[int, memoryview]:
+        """
+        Reserve the next slot; returns (seq, writable buffer).
+        """
+        seq = self.seq + 1
+        slot = seq % self.slots
+        _SLOT.pack_into(self._mm, self._slot_hdr_off + slot * _SLOT.size, 0, 0)
+        return seq, self.slot_buffer(seq)
+
+    def commit(self, seq: int, ts_ns: Optional[int] = None):
+        slot = seq % self.slots
+        _SLOT.pack_into(self._mm, self._slot_hdr_off + slot * _SLOT.size,
+                        seq, ts_ns if ts_ns is not None else time.time_ns())
+        struct.pack_into("<Q", self._mm, _WRITE_SEQ_OFFSET, seq)
+        self.seq = seq
+
+    def write(self, data) -> int:
+        seq, buf = self.begin()
+        buf[:] = data
+        self.commit(seq)
+        return seq
+
+    def close(self):
+        self._mm.close()
+
+
+class FrameRingReader:
+    def __init__(self, path: str):
+        self.path = path
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            size = os.fstat(fd).st_size
+            self._mm = mmap.mmap(fd, size, prot=mmap.PROT_READ)
+            self.ino = os.fstat(fd).st_ino
+        finally:
+            os.close(fd)
+
+        magic, version, pix_fmt, width, height, slots, frame_size, _ = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            self._mm.close()
+            raise ValueError(f"Not a frame ring: {path}")
+        self.pix_fmt = pix_fmt
+        self.width = width
+        self.height = height
+        self.slots = slots
+        self.frame_size = frame_size
+        self._slot_hdr_off, self._data_off, self._stride = _layout(slots, frame_size)
+        self._buf = np.frombuffer(self._mm, dtype=np.uint8)
+
+    def latest_seq(self) -> int:
+        return struct.unpack_from("<Q", self._mm, _WRITE_SEQ_OFFSET)[0]
+
+    def slot_seq(self, seq: int) -> int:
+        slot = seq % self.slots
+        return _SLOT.unpack_from(self._mm, self._slot_hdr_off + slot * _SLOT.size)[0]
+
+    def view(self, seq: int) -> Optional[Tuple[int, np.ndarray]]:
+        """
+        Zero-copy gray (Y plane) view of a frame; None if it was overwritten.
+        """
+        slot = seq % self.slots
+        s, ts_ns = _SLOT.unpack_from(self._mm, self._slot_hdr_off + slot * _SLOT.size)
+        if s != seq:
+            return None
+        off = self._data_off + slot * self._stride
+        # NV12 の先頭 width*height は Y（輝度）面なのでそのままグレースケールとして使える
+        y = self._buf[off:off + self.width * self.height].reshape(self.height, self.width)
+        return ts_ns, y
+
+    def still_valid(self, seq: int) -> bool:
+        return self.slot_seq(seq) == seq
+
+    def replaced(self) -> bool:
+        """
+        True if the ring file was recreated (ffmpeg / writer restarted).
+        """
+        try:
+            return os.stat(self.path).st_ino != self.ino
+        except FileNotFoundError:
+            return True
+
+    def close(self):
+        self._buf = None
+        try:
+            self._mm.close()
+        except BufferError:
+            # まだ numpy ビューが残っている場合は GC に任せる
+            pass
+
+
+# ----------------------------------------
+# writer CLI（ffmpeg_runner.sh から起動）
+#   python3 -m core.opencv.frame_ring write <ring_path> --width W --height H [--format gray|nv12]
+#   stdin（FIFO）から rawvideo を 1 フレームずつ読み込む
+# ----------------------------------------
+def run_writer(args) -> int:
+    pix_fmt = PIX_FMTS[args.format]
+    writer = FrameRingWriter(args.ring, args.width, args.height, pix_fmt, args.slots)
+    src = sys.stdin.buffer.raw if hasattr(sys.stdin.buffer, "raw") else sys.stdin.buffer
+    print(f"[frame_ring] writing {args.width}x{args.height} {args.format} frames to {args.ring}")
+
+    frames = 0
+    while True:
+        seq, buf = writer.begin()
+        got = 0
+        while got < writer.frame_size:
+            n = src.readinto(buf[got:])
+            if not n:
+                print(f"[frame_ring] input closed after {frames} frames")
+                buf.release()
+                writer.close()
+                return 0
+            got += n
+        writer.commit(seq)
+        frames += 1
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Raw frame shared-memory ring")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    w = sub.add_parser("write", help="copy rawvideo frames from stdin into the ring")
+    w.add_argument("ring")
+    w.add_argument("--width", type=int, required=True)
+    w.add_argument("--height", type=int, required=True)
+    w.add_argument("--format", choices=sorted(PIX_FMTS), default="gray")
+    w.add_argument("--slots", type=int, default=4)
+    args = parser.parse_args(argv)
+
+    if args.cmd == "write":
+        return run_writer(args)
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,278 +1,464 @@
-import cv2
 import os
 import time
 import sys
-import numpy as np
+import signal
 import functools
+import threading
+from dataclasses import asdict
+from typing import Optional, Callable
+
+import numpy as np
+
 from common.config_loader import (
     load_camera_config,
     load_main_config,
+    camera_config_signature,
     NVR_CONFIG_MASK_DIR
 )
+from common.fs_watch import FrameWatcher, file_signature
+from common.metrics import get_registry, metrics_enabled, start_publisher, LAG_BUCKETS, NULL_TIMER
+from core.opencv.frame_ring import FrameRingReader
+from core.opencv.motion_pipeline import MotionDetector, MotionSettings
 
 print = functools.partial(print, flush=True)
 
+# フレームの受け取り方法（カメラ YAML の motion.transport）
+#   jpeg    : latest.jpg をデコード（従来方式）
+#   shm_ring: ffmpeg が書き込む生フレームリング（frames.ring）を直接参照
+TRANSPORT_JPEG = "jpeg"
+TRANSPORT_SHM_RING = "shm_ring"
+# リングの新フレーム確認間隔（秒）
+RING_POLL_INTERVAL = 0.005
+# リングファイルの作り直し（ffmpeg 再起動）を確認する間隔（秒）
+RING_REOPEN_INTERVAL = 1.0
+# 設定ファイル・マスクの更新を確認する間隔（秒）
+CONFIG_CHECK_INTERVAL = 2.0
+
 # ----------------------------------------
 # 1. 設定ファイルの読み込み
 # ----------------------------------------
-# （load_main_config と load_camera_config を使用）
+def load_motion_settings(cam, main_cfg=None, cam_cfg=None) -> MotionSettings:
+    """
+    Resolve the motion settings of a camera (camera YAML -> main.yaml defaults).
+    """
+    main_cfg = main_cfg if main_cfg is not None else load_main_config()
+    cam_cfg = cam_cfg if cam_cfg is not None else load_camera_config(cam)
+
+    # motion 設定（個別 → default）
+    motion_cfg = cam_cfg.get("motion", {})
+    common = main_cfg["common"]
+
+    return MotionSettings(
+        threshold=motion_cfg.get("threshold", common["default_motion_threshold"]),
+        # 検知とみなす最小面積（ピクセル）
+        min_area=motion_cfg.get("min_area", common["default_motion_min_area"]),
+        # メディアンフィルタのカーネルサイズ（奇数）
+        blur=motion_cfg.get("blur", common["default_motion_blur"]),
+        # ノイズ除去用カーネルの高さ（ピクセル）。ノイズの帯より大きく設定。
+        noise_v_kernel_height=motion_cfg.get(
+            "noise_v_kernel_height", common["default_motion_noise_v_kernel_height"]),
+        # 物体の最大アスペクト比（幅 / 高さ）
+        max_aspect_ratio=motion_cfg.get(
+            "max_aspect_ratio", common["default_motion_max_aspect_ratio"]),
+        # 動体検知の有効/無効
+        enabled=motion_cfg.get("enabled", common["default_motion_enabled"]),
+        # 処理解像度の縮小率（1 / 2 / 4 / 8）
+        scale=motion_cfg.get("scale", common.get("default_motion_scale", 1)),
+        # カスケード検知（フレーム差分ゲート → MOG2 / 輪郭抽出）
+        cascade=motion_cfg.get("cascade", common.get("default_motion_cascade", False)),
+        gate_threshold=motion_cfg.get(
+            "gate_threshold", common.get("default_motion_gate_threshold", 15)),
+        bg_update_interval=motion_cfg.get(
+            "bg_update_interval", common.get("default_motion_bg_update_interval", 5)),
+    )
 
 # ---------------------------------------------------------
-# 2.5. JPEG完全性チェック
-# ---------------------------------------------------------
-# ---------------------------------------------------------
-# 2.5. JPEG完全性チェック (Bytes)
+# 2. メトリクス（GET /system/metrics）
 # ---------------------------------------------------------
-def is_valid_jpeg_bytes(data):
+# 処理されなかったフレームの理由
+#   unreadable : latest.jpg が読めない・壊れている
+#   dropped    : リング上で一度も参照されずに上書きされた
+#   overwritten: エンジンで処理待ちの間に次のフレームが届いた
+SKIP_REASONS = ("unreadable", "dropped", "overwritten")
+
+
+class DetectorMetrics:
     """
-    Check if the bytes have a valid JPEG SOI and EOI marker.
-    POI: SOI (FF D8) at start, EOI (FF D9) at end.
+    Per-camera detector instruments in this process's metrics registry.
+    Stage timing is only recorded while metrics are enabled.
     """
-    if len(data) < 4:
-        return False
-    
-    # Check SOI
-    if data[:2] != b'\xff\xd8':
-        return False
-    # Check EOI
-    if data[-2:] != b'\xff\xd9':
-        return False
-        
-    return True
 
+    def __init__(self, cam):
+        registry = get_registry()
+        self.timer = (registry.stage_timer("nvr_detector_stage_seconds",
+                                           "Time spent in each motion detection stage", camera=cam)
+                      if metrics_enabled() else NULL_TIMER)
+        self.decode = registry.histogram("nvr_detector_decode_seconds",
+                                         "JPEG decode (or ring frame downscale) time", camera=cam)
+        self.frame_age = registry.histogram("nvr_detector_frame_age_seconds",
+                                            "Age of a frame when its processing starts", LAG_BUCKETS, camera=cam)
+        self.processed = registry.counter("nvr_detector_frames_processed_total",
+                                          "Frames run through the detector", camera=cam)
+        self.gated = registry.counter("nvr_detector_frames_gated_total",
+                                      "Frames the cascade gate judged static", camera=cam)
+        self.glitches = registry.counter("nvr_detector_glitches_total",
+                                         "Frames rejected as video glitches", camera=cam)
+        self.overruns = registry.counter("nvr_detector_ring_overruns_total",
+                                         "Ring slots overwritten while being processed", camera=cam)
+        self.errors = registry.counter("nvr_detector_errors_total",
+                                       "Unexpected errors while processing a frame", camera=cam)
+        self.skipped = {
+            reason: registry.counter("nvr_detector_frames_skipped_total",
+                                     "Frames that were not processed", camera=cam, reason=reason)
+            for reason in SKIP_REASONS
+        }
 
 # ---------------------------------------------------------
-# 2. 平均輝度（YAVG）を計算
+# 3. 平均輝度（YAVG）を計算
 # ---------------------------------------------------------
 # def calc_yavg(frame):
 #    return int(np.mean(frame[::10, ::10, :]))
 
 # ----------------------------------------
-# 4. メイン処理
+# 4. カメラ単位の処理（latest.jpg → motion.flag）
 # ----------------------------------------
-def main():
-    if len(sys.argv) < 2:
-        print("Usage: motion_detector.py <camera_name>")
-        sys.exit(1)
-
-    cam = sys.argv[1]
-
-    # カメラ設定を取得
-    main_cfg = load_main_config()
-    cam_cfg = load_camera_config(cam)
-
-    # motion 設定（個別 → default）
-    motion_cfg = cam_cfg.get("motion", {})
-
-    threshold = motion_cfg.get(
-        "threshold",
-        main_cfg["common"]["default_motion_threshold"]
-    )
-    # 検知とみなす最小面積（ピクセル）
-    min_area = motion_cfg.get( 
-        "min_area",
-        main_cfg["common"]["default_motion_min_area"]
-    )
-    # メディアンフィルタのカーネルサイズ（奇数）
-    blur = motion_cfg.get(
-        "blur",
-        main_cfg["common"]["default_motion_blur"]
-    )
-    # 動体検知の有効/無効
-    enabled = motion_cfg.get(
-        "enabled",
-        main_cfg["common"]["default_motion_enabled"]
-    )
-    # ノイズ除去用カーネルの高さ（ピクセル）。ノイズの帯より大きく設定。
-    noise_v_kernel_height = motion_cfg.get(
-        "noise_v_kernel_height",
-        main_cfg["common"]["default_motion_noise_v_kernel_height"]
-    )
-    # 物体の最大アスペクト比（幅 / 高さ）
-    max_aspect_ratio = motion_cfg.get(
-        "max_aspect_ratio",
-        main_cfg["common"]["default_motion_max_aspect_ratio"]
-    )
-
-    if not enabled:
-        print(f"[motion_detector] Motion detector disabled for {cam}")
-        time.sleep(1)
-        return
-
-    tmp_base = main_cfg["common"]["motion_tmp_base"]
-    tmp_dir = f"{tmp_base}/{cam}"
-
-    latest_jpg = f"{tmp_dir}/latest.jpg"
-    motion_flag = f"{tmp_dir}/motion.flag"
-    yavg_file = f"{tmp_dir}/yavg.txt"
-    pre_motion_jpg = f"{tmp_dir}/pre_motion.jpg"
-
-    print(f"[motion_detector] Starting for camera: {cam}")
-    print(f"[motion_detector] threshold={threshold}, min_area={min_area}, blur={blur}, noise_v_kernel_height={noise_v_kernel_height}, max_aspect_ratio={max_aspect_ratio}")
-    print(f"[motion_detector] Watching file: {latest_jpg}")
-    print(f"[motion_detector] Motion flag file: {motion_flag}")
-    print(f"[motion_detector] YAVG file: {yavg_file}")
-
-
-    # 背景差分法の初期化
-    fgbg = cv2.createBackgroundSubtractorMOG2(varThreshold=threshold, detectShadows=False)
-
-    # ノイズ除去用カーネル
-    kernel_v = cv2.getStructuringElement(cv2.MORPH_RECT, (1, noise_v_kernel_height))
-
-    # --- マスク画像の読み込み ---
-    mask_path = os.path.join(NVR_CONFIG_MASK_DIR, f"{cam}.png")
-    mask_img = None
-    if os.path.exists(mask_path):
-        print(f"[motion_detector] Loading mask: {mask_path}")
-        mask_img = cv2.imread(mask_path, cv2.IMREAD_GRAYSCALE)
-        if mask_img is None:
-            print(f"[motion_detector] Warning: Could not read mask {mask_path}")
-        else:
-            # マスクを二値化（0 or 255）して確実に動作させる
-            # 1以上の値があれば「監視対象」とする（誤って薄いグレーで塗られた場合への対策）
-            _, mask_img = cv2.threshold(mask_img, 1, 255, cv2.THRESH_BINARY)
-            print(f"[motion_detector] Mask loaded and binarized: {mask_path}")
+class CameraRunner:
+    """
+    Per-camera I/O around MotionDetector: watches latest.jpg (or the raw
+    frame ring), runs the detector on new frames and maintains
+    motion.flag.
+    Used by both the single-camera detector and the multi-camera engine.
+    """
 
-    last_mtime = 0
-    counter = 0
-    prev_frame = None
+    def __init__(self, cam, main_cfg=None, log: Optional[Callable[[str], None]] = None):
+        self.cam = cam
+        self.log = log or (lambda msg: print(f"[motion_detector] {msg}"))
+
+        main_cfg = main_cfg if main_cfg is not None else load_main_config()
+        cam_cfg = load_camera_config(cam)
+        self.settings = load_motion_settings(cam, main_cfg, cam_cfg)
+        self.transport = cam_cfg.get("motion", {}).get("transport", TRANSPORT_JPEG)
+
+        tmp_base = main_cfg["common"]["motion_tmp_base"]
+        self.tmp_dir = f"{tmp_base}/{cam}"
+
+        self.latest_jpg = f"{self.tmp_dir}/latest.jpg"
+        self.motion_flag = f"{self.tmp_dir}/motion.flag"
+        self.yavg_file = f"{self.tmp_dir}/yavg.txt"
+        self.ring_path = f"{self.tmp_dir}/frames.ring"
+        self.mask_path = os.path.join(NVR_CONFIG_MASK_DIR, f"{cam}.png")
+
+        self.detector = None
+        self.last_sig = None
+        self.metrics = DetectorMetrics(cam)
+
+        # 設定のホットリロード（SIGHUP で reload_requested を立てると次のフレームで即確認）
+        self._config_sig = self._config_signature()
+        self._config_checked = time.monotonic()
+        self.reload_requested = False
+
+        # 動体状態の通知先（motion_engine 内でイベント処理する場合）
+        self.on_motion: Optional[Callable[[bool], None]] = None
+
+        self.ring: Optional[FrameRingReader] = None
+        self._ring_checked = 0.0
+        self._ring_lock = threading.Lock()   # エンジンではディスパッチとワーカーの両方から参照する
+        self._ring_frame = None    # リングから取り出したフレーム（使い回す）
+        self.ring_overruns = 0     # 取り出し中にリング上で上書きされたフレーム数
+
+    @property
+    def uses_ring(self) -> bool:
+        return self.transport == TRANSPORT_SHM_RING
+
+    @property
+    def enabled(self) -> bool:
+        return self.settings.enabled
+
+    def start(self):
+        s = self.settings
+        self.log(f"Starting for camera: {self.cam}")
+        self.log(f"threshold={s.threshold}, min_area={s.min_area}, blur={s.blur}, noise_v_kernel_height={s.noise_v_kernel_height}, max_aspect_ratio={s.max_aspect_ratio}")
+        if s.scale > 1 or s.cascade:
+            self.log(f"scale=1/{s.scale}, cascade={s.cascade}, gate_threshold={s.gate_threshold}, bg_update_interval={s.bg_update_interval}")
+        self.log(f"Watching file: {self.ring_path if self.uses_ring else self.latest_jpg}")
+        self.log(f"Motion flag file: {self.motion_flag}")
+        self.log(f"YAVG file: {self.yavg_file}")
+
+        self.detector = MotionDetector(self.settings, self._load_mask(), self.log, self.metrics.timer)
+
+    def _load_mask(self):
+        # --- マスク画像の読み込み ---
+        if os.path.exists(self.mask_path):
+            return MotionDetector.load_mask(self.mask_path, self.log)
+        return None
+
+    def _config_signature(self):
+        return camera_config_signature(self.cam) + (file_signature(self.mask_path),)
+
+    def maybe_reload(self):
+        """
+        Re-read the motion settings and mask if their files changed (checked
+        every CONFIG_CHECK_INTERVAL, or at once after reload_requested was
+        set) and apply them to the running detector, keeping the learned
+        background model. Called between frames by the thread that
+        processes this camera.
+        """
+        now = time.monotonic()
+        if not self.reload_requested and now - self._config_checked < CONFIG_CHECK_INTERVAL:
+            return
+        self._config_checked = now
+        forced, self.reload_requested = self.reload_requested, False
+
+        sig = self._config_signature()
+        if sig == self._config_sig and not forced:
+            return
+        self._config_sig = sig
 
-    while True:
-        # latest.jpg の更新を待つ
         try:
-            mtime = os.path.getmtime(latest_jpg)
-        except FileNotFoundError:
-            time.sleep(0.5)
-            continue
-
-        if mtime == last_mtime:
-            time.sleep(0.2)
-            continue
-
-        # print(f"[motion_detector] Frame update detected: {mtime}")
-        counter += 1
-        last_mtime = mtime
+            cam_cfg = load_camera_config(self.cam)
+            settings = load_motion_settings(self.cam, load_main_config(), cam_cfg)
+            mask = self._load_mask()
+        except Exception as e:
+            self.log(f"Config reload failed, keeping current settings: {e!r}")
+            return
+
+        changed = {k: v for k, v in asdict(settings).items() if getattr(self.settings, k) != v}
+        transport = cam_cfg.get("motion", {}).get("transport", TRANSPORT_JPEG)
+        if transport != self.transport:
+            self.log(f"motion.transport changed to {transport}; takes effect after a restart")
+
+        if self.detector is not None and not self.detector.reconfigure(settings, mask):
+            # 処理解像度が変わると学習済みの背景モデルは使えない
+            self.log(f"scale changed to 1/{settings.scale}: background model reset")
+            gated = self.detector.gated
+            self.detector = MotionDetector(settings, mask, self.log, self.metrics.timer)
+            self.detector.gated = gated
+        self.settings = settings
+        if "enabled" in changed and not settings.enabled:
+            self.clear_flag()
+        self.log(f"Config reloaded: {changed or 'no motion setting changed'}")
+
+    def _open_ring(self) -> Optional[FrameRingReader]:
+        """
+        Attach to frames.ring, re-attaching when ffmpeg recreated it.
+        """
+        now = time.monotonic()
+        if self.ring is not None and now - self._ring_checked < RING_REOPEN_INTERVAL:
+            return self.ring
+
+        with self._ring_lock:
+            self._ring_checked = now
+            if self.ring is not None and not self.ring.replaced():
+                return self.ring
+            if self.ring is not None:
+                self.log("Frame ring was recreated, re-attaching")
+                self.ring.close()
+                self.ring = None
+            try:
+                self.ring = FrameRingReader(self.ring_path)
+                self.log(f"Attached frame ring {self.ring.width}x{self.ring.height} ({self.ring.slots} slots)")
+            except (FileNotFoundError, ValueError):
+                self.ring = None
+            return self.ring
+
+    def current_signature(self):
+        if self.uses_ring:
+            ring = self._open_ring()
+            if ring is None:
+                return None
+            seq = ring.latest_seq()
+            return (ring.ino, seq) if seq else None
+        return file_signature(self.latest_jpg)
+
+    def wait_ring(self, timeout: float) -> bool:
+        """
+        Wait until the ring has a frame newer than the last processed one.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            sig = self.current_signature()
+            if sig is not None and sig != self.last_sig:
+                return True
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(RING_POLL_INTERVAL if sig is not None else min(RING_REOPEN_INTERVAL, timeout))
+
+    def poll(self) -> Optional[bool]:
+        """
+        Check whether latest.jpg (or the ring) changed since the last
+        processed frame. Returns None if there is no frame yet.
+        """
+        sig = self.current_signature()
+        if sig is None:
+            return None
+        return sig != self.last_sig
+
+    def step(self) -> bool:
+        """
+        Read and process the current latest.jpg (or the newest ring frame).
+        Returns False if the frame could not be read or decoded.
+        """
+        self.maybe_reload()
+        if not self.settings.enabled:
+            # 無効中もフレームは見たことにする（wait_ring / poll が同じフレームで
+            # すぐに戻り続けて CPU を使い切らないように）。再有効化は次の更新で確認される
+            self.last_sig = self.current_signature()
+            return False
+
+        if self.uses_ring:
+            return self._step_ring()
 
         # フレーム読み込み（完全性チェック付き）
         frame = None
         try:
-            with open(latest_jpg, 'rb') as f:
+            with open(self.latest_jpg, 'rb') as f:
+                st = os.fstat(f.fileno())
+                self.last_sig = (st.st_mtime_ns, st.st_ino, st.st_size)
                 data = f.read()
-
-            if is_valid_jpeg_bytes(data):
-                # バイト配列からデコード
-                arr = np.frombuffer(data, np.uint8)
-                frame = cv2.imdecode(arr, cv2.IMREAD_COLOR)
+            # scale > 1 の場合は libjpeg の縮小デコードでグレー画像を直接得る
+            t0 = time.perf_counter()
+            frame = MotionDetector.decode(data, self.settings.scale, gray=self.settings.cascade)
+            self.metrics.decode.observe(time.perf_counter() - t0)
         except Exception:
             # 読み込み中のエラーは無視して次へ
             pass
-        
-        if frame is None:
-            # 読み込み失敗時はスキップして次ループへ
-            time.sleep(0.1)
-            continue
 
-
-        # マスクの初期化（初回またはリサイズ時）
-        if mask_img is not None:
-            # フレームサイズに合わせる
-            h, w = frame.shape[:2]
-            if mask_img.shape[:2] != (h, w):
-                print(f"[motion_detector] Resizing mask to {w}x{h}")
-                mask_img = cv2.resize(mask_img, (w, h))
-
-        # --- 1. 前処理：メディアンフィルタでざらつきを除去 ---
-        # --- グレイスケールで解析
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-
-        # --- 上部 80px をカット
-        h_start = 80
-        roi = gray[h_start:, :]
-
-        # カーネルサイズは奇数。ノイズが酷い場合は 7 や 9 に上げる など調整。
-        #blurred = cv2.medianBlur(frame, blur)
-        blurred = cv2.medianBlur(roi, 3)
-
-        # --- 2. 背景差分法による動体検知 ---
-        fgmask = fgbg.apply(blurred) 
-
-        # --- マスク適用 ---
-        if mask_img is not None:
-            current_mask = mask_img[h_start:, :]
-            fgmask = cv2.bitwise_and(fgmask, current_mask)
-        
-        # --- 3. ノイズ除去：強力な垂直オープニング ---
-        fgmask = cv2.erode(fgmask, kernel_v)
-
-        # 【追加】画面全体の変化率チェック（映像の乱れをここで弾く）
-        white_pixels = cv2.countNonZero(fgmask)
-        if white_pixels > (fgmask.size * 0.3): # 画面の30%以上が変化していたら異常
-            print(f"[motion_detector] Glitch ignored: change_ratio={white_pixels/fgmask.size:.2f}")
+        if frame is None:
+            self.metrics.skipped["unreadable"].inc()
+            return False
+
+        self.metrics.frame_age.observe(max(0.0, time.time() - st.st_mtime_ns / 1e9))
+        self.handle_frame(frame)
+        return True
+
+    def _step_ring(self) -> bool:
+        ring = self._open_ring()
+        if ring is None:
+            return False
+        seq = ring.latest_seq()
+        if not seq:
+            return False
+        if self.last_sig is not None and self.last_sig[0] == ring.ino and seq > self.last_sig[1] + 1:
+            self.metrics.skipped["dropped"].inc(seq - self.last_sig[1] - 1)
+        self.last_sig = (ring.ino, seq)
+
+        view = ring.view(seq)
+        if view is None:
+            return False
+        ts_ns, frame = view
+        self.metrics.frame_age.observe(max(0.0, (time.time_ns() - ts_ns) / 1e9))
+        t0 = time.perf_counter()
+        # スロットから手元のバッファへ取り出す（縮小時は縮小結果がそのまま手元のコピー）
+        if self.settings.scale > 1:
+            frame = MotionDetector.reduce(frame, self.settings.scale)
+        else:
+            if self._ring_frame is None or self._ring_frame.shape != frame.shape:
+                self._ring_frame = np.empty_like(frame)
+            np.copyto(self._ring_frame, frame)
+            frame = self._ring_frame
+        self.metrics.decode.observe(time.perf_counter() - t0)
+
+        # 取り出し中に writer が 1 周してスロットを上書きした（処理が追いついていない）
+        # 壊れたフレームは背景モデルにも motion.flag にも反映しない
+        if not ring.still_valid(seq):
+            self.ring_overruns += 1
+            self.metrics.overruns.inc()
+            return False
+        self.handle_frame(frame)
+        return True
+
+    def handle_frame(self, frame):
+        result = self.detector.process(frame)
+        self.metrics.processed.inc()
+        if result.gated:
+            self.metrics.gated.inc()
+
+        if result.glitch:
             # 異常フレームとして、motion_flag を更新せずに次へ
-            prev_frame = frame
-            continue
-        # --- 輪郭抽出と判定 ---
-        contours, _ = cv2.findContours(fgmask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-
-        motion = False  # ループの前に初期化
-        img_w = frame.shape[1]
-
-        if len(contours) > 0:
-            print(f"[motion_detector] Found {len(contours)} raw contours")
-
-        for contour in contours:
-            area = cv2.contourArea(contour)
-            if area < min_area:
-                continue  # 小さいものは無視して次の輪郭へ
-
-            x, y, w, h = cv2.boundingRect(contour)
-            aspect_ratio = float(w) / h
-            
-            print(f"[motion_detector] Candidate: Area={area}, Aspect={aspect_ratio:.2f}, Width={w}")
-
-            # --- 形状フィルタリング ---
-            # 横長すぎるもの（帯状ノイズ）を無視
-            if aspect_ratio > max_aspect_ratio:
-                print(f"[motion_detector] Rejected: Too wide aspect ratio {aspect_ratio:.2f}")
-                continue
-            # 画像幅の半分を超えるような巨大すぎる横長も無視
-            if w > img_w * 0.6:
-                print(f"[motion_detector] Rejected: Too large width {w}")
-                continue
-
-            # ここまで到達すれば「本物の動体」とみなす
-            print(f"[motion_detector] MOTION DETECTED! Area={area}")
-            motion = True
-            break  # 一つでも見つかれば確定なのでループを抜ける
+            self.metrics.glitches.inc()
+            return result
 
         # motion.flag の更新
         # 起動直後の不安定な時期（最初の25フレーム）を除外
-        if motion and counter > 25:
-            if not os.path.exists(motion_flag):
-                # We just transitioned to motion. 
-                # Save the PREVIOUS frame to give context.
-                if prev_frame is not None:
-                    try:
-                        cv2.imwrite(pre_motion_jpg, prev_frame)
-                    except Exception:
-                        pass
-                open(motion_flag, "w").close()
+        if result.motion and self.detector.warmed_up:
+            if not os.path.exists(self.motion_flag):
+                # We just transitioned to motion.
+                # 検知前のフレームはイベントハンドラのプレロールが保存する
+                open(self.motion_flag, "w").close()
         else:
-            if os.path.exists(motion_flag):
+            if os.path.exists(self.motion_flag):
                 try:
-                    os.remove(motion_flag)
+                    os.remove(self.motion_flag)
                 except FileNotFoundError:
                     pass
 
+        if self.on_motion is not None:
+            self.on_motion(result.motion and self.detector.warmed_up)
+
         # YAVG の保存(5frameに1回)
         # if counter % 5 == 0:
         #    yavg = calc_yavg(frame)
         #    with open(yavg_file, "w") as f:
         #        f.write(str(yavg))
 
-        # Update prev_frame for next iteration
-        prev_frame = frame
+        return result
+
+    def clear_flag(self):
+        try:
+            os.remove(self.motion_flag)
+        except FileNotFoundError:
+            pass
+        if self.on_motion is not None:
+            self.on_motion(False)
+
+# ----------------------------------------
+# 5. メイン処理
+# ----------------------------------------
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: motion_detector.py <camera_name>")
+        sys.exit(1)
+
+    cam = sys.argv[1]
+    runner = CameraRunner(cam)
+
+    if not runner.enabled:
+        print(f"[motion_detector] Motion detector disabled for {cam}")
+        time.sleep(1)
+        return
+
+    runner.start()
+
+    # SIGHUP（systemctl reload）で設定とマスクを即座に読み直す
+    def _on_sighup(_signum, _frame):
+        runner.reload_requested = True
+
+    signal.signal(signal.SIGHUP, _on_sighup)
+    start_publisher(f"motion_detector@{cam}")
+
+    if runner.uses_ring:
+        # 生フレームリングの seq を監視する（ファイル I/O・デコードなし）
+        print("[motion_detector] Frame watch mode: shm_ring")
+        while True:
+            if runner.wait_ring(timeout=1.0):
+                runner.step()
+
+    # latest.jpg の到着を inotify (IN_MOVED_TO / IN_CLOSE_WRITE) で待つ
+    # inotify が使えない環境では stat ポーリングにフォールバックする
+    watcher = FrameWatcher("latest.jpg")
+    watcher.add(cam, runner.tmp_dir)
+    print(f"[motion_detector] Frame watch mode: {watcher.mode}")
+
+    while True:
+        # latest.jpg の更新を待つ
+        # （タイムアウト時も念のため stat で取りこぼしを確認する）
+        if not watcher.wait(timeout=1.0) and not runner.poll():
+            continue
+
+        # print(f"[motion_detector] Frame update detected")
+        if not runner.step():
+            # 読み込み失敗時はスキップして次のフレームを待つ
+            continue
 
 # ----------------------------------------
 # 実行
@@ -0,0 +1,271 @@
+import os
+import sys
+import glob
+import time
+import signal
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from common.config_loader import (
+    load_camera_config,
+    load_main_config,
+    get_config_value,
+    NVR_CONFIG_CAM_DIR
+)
+from common.fs_watch import FrameWatcher
+from common.metrics import start_publisher, stop_publisher
+from core.opencv.motion_detector import CameraRunner, RING_POLL_INTERVAL
+from core.motion_event_handler import EventRecorder, EventService
+
+print = functools.partial(print, flush=True)
+
+# ---------------------------------------------------------
+# motion_engine.py
+#   - 有効な全カメラの動体検知を 1 プロセスで実行する
+#   - cv2 / numpy の読み込みは 1 回だけ。OpenCV は処理中 GIL を解放するため
+#     スレッドプールで実並列に処理できる
+#   - 1 カメラにつき同時に 1 フレームまで（順序を保ち、他カメラを巻き込まない）
+#   - common.motion_engine.handle_events が true の場合はイベント処理
+#     （motion_event_handler）もエンジン内のスレッドで行う
+# ---------------------------------------------------------
+
+# 新フレーム待ちのタイムアウト（秒）。タイムアウト時は stat で取りこぼしを確認する
+DISPATCH_TIMEOUT = 1.0
+# 統計の出力間隔（秒）
+STATS_INTERVAL = 60
+# 連続エラー時の待機（秒）の上限
+MAX_BACKOFF = 30
+
+
+class CameraWorker:
+    """
+    Wraps a CameraRunner with per-camera scheduling state and statistics.
+    """
+
+    def __init__(self, runner: CameraRunner, pool: ThreadPoolExecutor):
+        self.runner = runner
+        self.pool = pool
+        self.cam = runner.cam
+        self.busy = False
+        self.pending = False      # 処理中に新しいフレームが届いた
+        self.seen_sig = None
+        self.frames = 0           # 処理したフレーム数（統計期間内）
+        self.skipped = 0          # 処理前に上書きされたフレーム数（統計期間内）
+        self.errors = 0           # 連続エラー数
+        self.gated_total = 0      # カスケードのゲートで省略したフレーム数（前回統計時点の累計）
+        self.retry_at = 0.0
+        self.lock = threading.Lock()
+
+    def run_step(self):
+        try:
+            ok = self.runner.step()
+            with self.lock:
+                if ok:
+                    self.frames += 1
+                self.errors = 0
+        except Exception as e:
+            # 1 カメラの異常は他のカメラに影響させない
+            self.runner.metrics.errors.inc()
+            with self.lock:
+                self.errors += 1
+                backoff = min(MAX_BACKOFF, 2 ** min(self.errors, 5))
+                self.retry_at = time.monotonic() + backoff
+            self.runner.log(f"Error: {e!r} (retry in {backoff}s)")
+            try:
+                self.runner.clear_flag()
+            except Exception:
+                pass
+        finally:
+            with self.lock:
+                self.busy = False
+                pending = self.pending
+            # 処理中に届いたフレームがあればすぐに次を処理する
+            if pending and time.monotonic() >= self.retry_at:
+                self.dispatch()
+
+    def dispatch(self):
+        """
+        Submit the current latest.jpg (or ring frame) to the pool unless a
+        frame of this camera is already being processed.
+        """
+        try:
+            sig = self.runner.current_signature()
+        except Exception:
+            sig = None
+        if sig is None or sig == self.runner.last_sig:
+            with self.lock:
+                self.pending = False
+            return
+
+        with self.lock:
+            if self.busy:
+                # 処理中に latest.jpg が更新された（処理が追いついていない）
+                if sig != self.seen_sig:
+                    if self.pending:
+                        # 待機中だったフレームは処理されずに上書きされた
+                        self.skipped += 1
+                        self.runner.metrics.skipped["overwritten"].inc()
+                    self.pending = True
+                    self.seen_sig = sig
+                return
+            self.busy = True
+            self.pending = False
+            self.seen_sig = sig
+
+        self.pool.submit(self.run_step)
+
+    def snapshot(self, elapsed: float) -> Dict[str, float]:
+        detector = self.runner.detector
+        gated = detector.gated - self.gated_total if detector else 0
+        with self.lock:
+            fps = self.frames / elapsed if elapsed > 0 else 0.0
+            gated_ratio = gated / self.frames if self.frames else 0.0
+            self.gated_total += gated
+            stats = {
+                "fps": round(fps, 2),
+                "backlog": int(self.pending) + (1 if self.busy else 0),
+                "skipped": self.skipped,
+                "errors": self.errors,
+                "overruns": self.runner.ring_overruns,
+                "gated": round(gated_ratio, 2),
+            }
+            self.frames = 0
+            self.skipped = 0
+            self.runner.ring_overruns = 0
+        return stats
+
+
+def enabled_cameras() -> List[str]:
+    """
+    Cameras from NVR_CONFIG_CAM_DIR with enabled: true.
+    """
+    cams = []
+    for f in sorted(glob.glob(os.path.join(NVR_CONFIG_CAM_DIR, "*.yaml"))):
+        cam = os.path.splitext(os.path.basename(f))[0]
+        try:
+            if load_camera_config(cam).get("enabled", False):
+                cams.append(cam)
+        except Exception as e:
+            print(f"[motion_engine] Skipping {cam}: {e}")
+    return cams
+
+
+def main():
+    main_cfg = load_main_config()
+    cams = sys.argv[1:] or enabled_cameras()
+
+    runners: List[CameraRunner] = []
+    for cam in cams:
+        runner = CameraRunner(
+            cam, main_cfg,
+            log=functools.partial(lambda c, msg: print(f"[motion_engine:{c}] {msg}"), cam),
+        )
+        if not runner.enabled:
+            # 監視は続け、設定の再読み込みで有効になったら検知を始める
+            print(f"[motion_engine] Motion detector disabled for {cam} (waiting for re-enable)")
+        try:
+            runner.start()
+        except Exception as e:
+            print(f"[motion_engine] Failed to start {cam}: {e!r}")
+            continue
+        runners.append(runner)
+
+    if not runners:
+        print("[motion_engine] No cameras to watch")
+        time.sleep(1)
+        return
+
+    n_threads = get_config_value(main_cfg, "common.motion_engine.workers", 0)
+    if not n_threads:
+        n_threads = min(len(runners), os.cpu_count() or 1)
+
+    pool = ThreadPoolExecutor(max_workers=n_threads, thread_name_prefix="motion")
+    workers = [CameraWorker(r, pool) for r in runners]
+    print(f"[motion_engine] Starting for {len(workers)} cameras with {n_threads} workers: {[w.cam for w in workers]}")
+
+    # latest.jpg のカメラは 1 つの inotify で待ち、
+    # 生フレームリング（motion.transport: shm_ring）のカメラは seq を短い間隔で確認する
+    jpeg_workers = [w for w in workers if not w.runner.uses_ring]
+    ring_workers = [w for w in workers if w.runner.uses_ring]
+    watcher = FrameWatcher("latest.jpg")
+    for w in jpeg_workers:
+        watcher.add(w.cam, w.runner.tmp_dir)
+    print(f"[motion_engine] Frame watch mode: {watcher.mode}"
+          + (f", shm_ring for {[w.cam for w in ring_workers]}" if ring_workers else ""))
+
+    # イベント処理（検知結果を motion.flag を介さずに直接渡す）
+    service = None
+    if get_config_value(main_cfg, "common.motion_engine.handle_events", True):
+        recorders = {}
+        for w in workers:
+            rec = EventRecorder(
+                w.cam, main_cfg,
+                log=functools.partial(lambda c, msg: print(f"[handler:{c}] {msg}"), w.cam),
+            )
+            w.runner.on_motion = rec.set_motion
+            recorders[w.cam] = rec
+        service = EventService(recorders, use_flags=False)
+        service_thread = threading.Thread(target=service.run, name="events", daemon=True)
+        service_thread.start()
+        print(f"[motion_engine] Handling events in-process for {list(recorders)}")
+
+    stop = threading.Event()
+
+    def _on_signal(signum, _frame):
+        print("[motion_engine] received termination signal")
+        stop.set()
+
+    def _on_sighup(_signum, _frame):
+        # 設定とマスクを各カメラの次のフレームで読み直す
+        for w in workers:
+            w.runner.reload_requested = True
+
+    signal.signal(signal.SIGTERM, _on_signal)
+    signal.signal(signal.SIGINT, _on_signal)
+    signal.signal(signal.SIGHUP, _on_sighup)
+    start_publisher("motion_engine")
+
+    by_cam = {w.cam: w for w in workers}
+    wait_timeout = RING_POLL_INTERVAL if ring_workers else DISPATCH_TIMEOUT
+    stats_start = time.monotonic()
+    last_full_check = stats_start
+
+    while not stop.is_set():
+        ready = watcher.wait(timeout=wait_timeout)
+        now = time.monotonic()
+
+        # 通知のあったカメラのみ。一定時間通知がなければ全カメラを stat で確認する
+        targets = [by_cam[c] for c in ready]
+        if ready:
+            last_full_check = now
+        elif now - last_full_check >= DISPATCH_TIMEOUT:
+            targets = jpeg_workers
+            last_full_check = now
+        for w in targets + ring_workers:
+            if now < w.retry_at:
+                continue
+            w.dispatch()
+
+        if now - stats_start >= STATS_INTERVAL:
+            elapsed = now - stats_start
+            stats_start = now
+            line = ", ".join(
+                f"{w.cam}: {s['fps']}fps backlog={s['backlog']} skipped={s['skipped']} errors={s['errors']}"
+                + (f" overruns={s['overruns']}" if w.runner.uses_ring else "")
+                + (f" gated={s['gated']:.0%}" if w.runner.settings.cascade else "")
+                for w in workers for s in [w.snapshot(elapsed)]
+            )
+            print(f"[motion_engine] stats {line}")
+
+    # 進行中のイベントを閉じてから終了する
+    pool.shutdown(wait=False, cancel_futures=True)
+    if service is not None:
+        service.stop()
+        service_thread.join(timeout=5)
+    stop_publisher()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+import cv2
+import numpy as np
+from dataclasses import dataclass
+from typing import Optional, Callable
+
+from common.metrics import NULL_TIMER
+
+# ---------------------------------------------------------
+# 動体検知パイプライン本体
+#   - 設定ファイルや /dev/shm には依存しない（単体・エンジン・ベンチで共用）
+# ---------------------------------------------------------
+
+# 上部の除外領域（タイムスタンプ表示など）
+CROP_TOP_PX = 80
+# 画面のこの割合以上が変化したフレームは映像の乱れとして捨てる
+GLITCH_RATIO = 0.3
+# 画像幅のこの割合を超える輪郭は帯状ノイズとして捨てる
+MAX_WIDTH_RATIO = 0.6
+# 起動直後の不安定な時期として無視するフレーム数
+WARMUP_FRAMES = 25
+
+# ----- カスケードモード -----
+# 縮小デコードに使える倍率（cv2.IMREAD_REDUCED_GRAYSCALE_N）
+REDUCED_DECODE_FLAGS = {
+    2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+    4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    8: cv2.IMREAD_REDUCED_GRAYSCALE_8,
+}
+# ゲート判定用フレームの幅（ピクセル）。処理解像度からさらに縮小する
+GATE_WIDTH = 160
+# ゲート通過に必要な変化画素数（min_area をゲート解像度に換算した値に対する割合）
+GATE_AREA_FACTOR = 0.25
+
+
+def is_valid_jpeg_bytes(data):
+    """
+    Check if the bytes have a valid JPEG SOI and EOI marker.
+    POI: SOI (FF D8) at start, EOI (FF D9) at end.
+    """
+    if len(data) < 4:
+        return False
+
+    # Check SOI
+    if data[:2] != b'\xff\xd8':
+        return False
+    # Check EOI
+    if data[-2:] != b'\xff\xd9':
+        return False
+
+    return True
+
+
+@dataclass
+class MotionSettings:
+    threshold: int = 50
+    min_area: int = 500
+    blur: int = 5
+    noise_v_kernel_height: int = 20
+    max_aspect_ratio: float = 1.5
+    enabled: bool = True
+    # 処理解像度の縮小率（1, 2, 4, 8）。min_area などは元解像度の値のまま指定する
+    scale: int = 1
+    # フレーム差分ゲートで静止フレームの MOG2 / 輪郭抽出を省略する
+    cascade: bool = False
+    # ゲートで「変化あり」とみなす画素値の差
+    gate_threshold: int = 15
+    # 静止中に MOG2 の背景モデルを更新する間隔（フレーム数）
+    bg_update_interval: int = 5
+
+
+@dataclass
+class MotionResult:
+    motion: bool = False
+    glitch: bool = False
+    contours: int = 0
+    gated: bool = False        # ゲートで静止と判定され、輪郭抽出を省略した
+
+
+class MotionDetector:
+    """
+    MOG2-based motion detector for one camera.
+
+    Holds the learned background model, kernels and mask; process()
+    takes a decoded BGR (or already gray) frame at the processing
+    resolution (original / settings.scale) and returns the decision for
+    that frame.
+
+    In cascade mode a cheap frame difference on a small copy of the frame
+    decides whether the frame needs the MOG2 + contour stage at all; while
+    the scene is static the background model is only refreshed every
+    bg_update_interval frames.
+
+    `timer` (common.metrics.StageTimer) receives the time spent in each
+    stage of process(): gray, gate, blur, mog2, erode, contours.
+    """
+
+    def __init__(self, settings: MotionSettings, mask: Optional[np.ndarray] = None,
+                 log: Callable[[str], None] = print, timer=NULL_TIMER):
+        self.log = log
+        self.timer = timer
+        self.counter = 0
+
+        # 背景差分法の初期化
+        self.fgbg = cv2.createBackgroundSubtractorMOG2(varThreshold=settings.threshold, detectShadows=False)
+
+        # 縮小率に合わせて元解像度基準のパラメータを換算する
+        scale = max(1, int(settings.scale))
+        self.scale = scale
+        self.crop_top = CROP_TOP_PX // scale
+
+        self.last_motion = False
+        self.gated = 0              # ゲートで省略したフレーム数（累計）
+        self._apply(settings, mask)
+
+    def _apply(self, settings: MotionSettings, mask: Optional[np.ndarray]):
+        self.settings = settings
+        self.min_area = settings.min_area / (self.scale * self.scale)
+        kernel_h = max(1, round(settings.noise_v_kernel_height / self.scale))
+
+        # ノイズ除去用カーネル
+        self.kernel_v = cv2.getStructuringElement(cv2.MORPH_RECT, (1, kernel_h))
+
+        self.mask_img = mask
+
+        # カスケード用の状態
+        self.gate_ref = None        # 最後に MOG2 に渡したフレーム（ゲート解像度）
+        self.since_bg_update = 0    # 最後に MOG2 に渡してからのフレーム数
+        self.gate_min_pixels = 0.0
+        self._gate_mask = None
+
+    def reconfigure(self, settings: MotionSettings, mask: Optional[np.ndarray] = None) -> bool:
+        """
+        Apply changed settings (threshold, min_area, kernels, mask, cascade)
+        while keeping the learned background model and warm-up state.
+        Returns False if the change needs a new detector (a different
+        processing scale changes the frame size the model was learned on).
+        """
+        if max(1, int(settings.scale)) != self.scale:
+            return False
+        self.fgbg.setVarThreshold(settings.threshold)
+        self._apply(settings, mask)
+        return True
+
+    @staticmethod
+    def load_mask(mask_path: str, log: Callable[[str], None] = print) -> Optional[np.ndarray]:
+        """
+        Load a grayscale mask image and binarize it (0 or 255).
+        """
+        log(f"Loading mask: {mask_path}")
+        mask_img = cv2.imread(mask_path, cv2.IMREAD_GRAYSCALE)
+        if mask_img is None:
+            log(f"Warning: Could not read mask {mask_path}")
+            return None
+        # マスクを二値化（0 or 255）して確実に動作させる
+        # 1以上の値があれば「監視対象」とする（誤って薄いグレーで塗られた場合への対策）
+        _, mask_img = cv2.threshold(mask_img, 1, 255, cv2.THRESH_BINARY)
+        log(f"Mask loaded and binarized: {mask_path}")
+        return mask_img
+
+    @staticmethod
+    def decode(data: bytes, scale: int = 1, gray: bool = False) -> Optional[np.ndarray]:
+        """
+        Decode JPEG bytes after the SOI/EOI integrity check.
+        scale 2/4/8 decodes a reduced grayscale image directly (libjpeg
+        DCT scaling), which is much cheaper than decoding and resizing.
+        """
+        if not is_valid_jpeg_bytes(data):
+            return None
+        # バイト配列からデコード
+        arr = np.frombuffer(data, np.uint8)
+        if scale in REDUCED_DECODE_FLAGS:
+            return cv2.imdecode(arr, REDUCED_DECODE_FLAGS[scale])
+        return cv2.imdecode(arr, cv2.IMREAD_GRAYSCALE if gray else cv2.IMREAD_COLOR)
+
+    @staticmethod
+    def reduce(frame: np.ndarray, scale: int) -> np.ndarray:
+        """
+        Downscale an already decoded frame (e.g. from the frame ring).
+        """
+        if scale <= 1:
+            return frame
+        h, w = frame.shape[:2]
+        return cv2.resize(frame, (w // scale, h // scale), interpolation=cv2.INTER_AREA)
+
+    @property
+    def warmed_up(self) -> bool:
+        # 起動直後の不安定な時期（最初の25フレーム）を除外
+        return self.counter > WARMUP_FRAMES
+
+    def process(self, frame: np.ndarray) -> MotionResult:
+        self.counter += 1
+        s = self.settings
+        timer = self.timer
+        timer.start()
+
+        # マスクの初期化（初回またはリサイズ時）
+        if self.mask_img is not None:
+            # フレームサイズに合わせる
+            h, w = frame.shape[:2]
+            if self.mask_img.shape[:2] != (h, w):
+                self.log(f"Resizing mask to {w}x{h}")
+                self.mask_img = cv2.resize(self.mask_img, (w, h))
+
+        # --- 1. 前処理：メディアンフィルタでざらつきを除去 ---
+        # --- グレイスケールで解析（frame_ring からのフレームは最初からグレー）
+        gray = frame if frame.ndim == 2 else cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+        # --- 上部 80px をカット（縮小時は換算）
+        h_start = self.crop_top
+        roi = gray[h_start:, :]
+        timer.lap("gray")
+
+        # --- 0. カスケード：安価なフレーム差分で静止フレームを除外 ---
+        if s.cascade and self.warmed_up and not self.last_motion:
+            small = self._gate_frame(roi)
+            if self.gate_ref is not None and self.gate_ref.shape == small.shape \
+                    and not self._gate_passes(small):
+                self.since_bg_update += 1
+                timer.lap("gate")
+                if self.since_bg_update < s.bg_update_interval:
+                    self.gated += 1
+                    return MotionResult(gated=True)
+                # 背景モデルの更新のみ（省略したフレーム分の学習率で 1 回だけ学習）
+                learning_rate = min(1.0, self.since_bg_update / self.fgbg.getHistory())
+                self.fgbg.apply(cv2.medianBlur(roi, 3), learningRate=learning_rate)
+                timer.lap("mog2")
+                self.since_bg_update = 0
+                self.gate_ref = small
+                self.gated += 1
+                return MotionResult(gated=True)
+            self.gate_ref = small
+            timer.lap("gate")
+        elif s.cascade:
+            self.gate_ref = self._gate_frame(roi)
+            timer.lap("gate")
+        self.since_bg_update = 0
+
+        # カーネルサイズは奇数。ノイズが酷い場合は 7 や 9 に上げる など調整。
+        #blurred = cv2.medianBlur(frame, blur)
+        blurred = cv2.medianBlur(roi, 3)
+        timer.lap("blur")
+
+        # --- 2. 背景差分法による動体検知 ---
+        fgmask = self.fgbg.apply(blurred)
+        timer.lap("mog2")
+
+        # --- マスク適用 ---
+        if self.mask_img is not None:
+            current_mask = self.mask_img[h_start:, :]
+            fgmask = cv2.bitwise_and(fgmask, current_mask)
+
+        # --- 3. ノイズ除去：強力な垂直オープニング ---
+        fgmask = cv2.erode(fgmask, self.kernel_v)
+        timer.lap("erode")
+
+        # 【追加】画面全体の変化率チェック（映像の乱れをここで弾く）
+        white_pixels = cv2.countNonZero(fgmask)
+        if white_pixels > (fgmask.size * GLITCH_RATIO): # 画面の30%以上が変化していたら異常
+            self.log(f"Glitch ignored: change_ratio={white_pixels/fgmask.size:.2f}")
+            self.last_motion = False
+            return MotionResult(glitch=True)
+
+        # --- 輪郭抽出と判定 ---
+        contours, _ = cv2.findContours(fgmask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        result = MotionResult(contours=len(contours))
+        img_w = frame.shape[1]
+
+        if len(contours) > 0:
+            self.log(f"Found {len(contours)} raw contours")
+
+        for contour in contours:
+            area = cv2.contourArea(contour)
+            if area < self.min_area:
+                continue  # 小さいものは無視して次の輪郭へ
+
+            x, y, w, h = cv2.boundingRect(contour)
+            aspect_ratio = float(w) / h
+
+            self.log(f"Candidate: Area={area}, Aspect={aspect_ratio:.2f}, Width={w}")
+
+            # --- 形状フィルタリング ---
+            # 横長すぎるもの（帯状ノイズ）を無視
+            if aspect_ratio > s.max_aspect_ratio:
+                self.log(f"Rejected: Too wide aspect ratio {aspect_ratio:.2f}")
+                continue
+            # 画像幅の半分を超えるような巨大すぎる横長も無視
+            if w > img_w * MAX_WIDTH_RATIO:
+                self.log(f"Rejected: Too large width {w}")
+                continue
+
+            # ここまで到達すれば「本物の動体」とみなす
+            self.log(f"MOTION DETECTED! Area={area}")
+            result.motion = True
+            break  # 一つでも見つかれば確定なのでループを抜ける
+
+        timer.lap("contours")
+
+        # 動体検知中はゲートを通さず毎フレーム判定する（flag のばたつき防止）
+        self.last_motion = result.motion
+        return result
+
+    def _gate_frame(self, roi: np.ndarray) -> np.ndarray:
+        h, w = roi.shape[:2]
+        gw = min(w, GATE_WIDTH)
+        gh = max(1, h * gw // w)
+        # min_area をゲート解像度の画素数に換算（面積なので縮小率の 2 乗）
+        self.gate_min_pixels = self.min_area * (gw / w) ** 2 * GATE_AREA_FACTOR
+        small = cv2.resize(roi, (gw, gh), interpolation=cv2.INTER_AREA)
+        if self.mask_img is not None:
+            if self._gate_mask is None or self._gate_mask.shape != small.shape:
+                self._gate_mask = cv2.resize(self.mask_img[self.crop_top:, :], (gw, gh),
+                                             interpolation=cv2.INTER_NEAREST)
+            small = cv2.bitwise_and(small, self._gate_mask)
+        return small
+
+    def _gate_passes(self, small: np.ndarray) -> bool:
+        """
+        True if enough pixels changed since the last frame given to MOG2
+        to possibly contain an object of min_area.
+        """
+        diff = cv2.absdiff(small, self.gate_ref)
+        _, changed = cv2.threshold(diff, self.settings.gate_threshold, 255, cv2.THRESH_BINARY)
+        return cv2.countNonZero(changed) >= self.gate_min_pixels
@@ -0,0 +1,442 @@
+import os
+import sys
+import json
+import time
+import argparse
+import itertools
+import functools
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, asdict
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from common.video_utils import parse_recording_timestamp
+from core.opencv.bench_motion import coerce_setting, percentiles_ms
+from core.opencv.motion_pipeline import MotionDetector, MotionSettings
+
+print = functools.partial(print, flush=True)
+
+# ---------------------------------------------------------
+# motion_replay.py
+#   録画（*.mkv）をオフラインで再生し、動体検知の設定値を総当たりで比べる
+#   - 本番と同じ MotionDetector に、本番と同じ間隔（latest_fps）で間引いたフレームを渡す
+#   - 設定の組み合わせ（--grid）をプロセスプールで並列に処理する
+#   - 組み合わせごとに、イベントハンドラと同じ規則でまとめた動体区間と処理コストを出す
+#
+#   python3 -m core.opencv.motion_replay --cam frontdoor \
+#       --grid threshold=40,50,64 --grid min_area=300,500,800 /var/nvr/records/frontdoor/20250101_*.mkv
+# ---------------------------------------------------------
+
+# --cam なしで使う既定値（イベント設定は main.yaml の既定値と同じ）
+DEFAULT_FPS = 5.0
+DEFAULT_IDLE_SEC = 10
+DEFAULT_POST_MOTION_BUFFER_SEC = 2
+# 録画を時間で分割して並列処理する場合、直前の録画の末尾をこの秒数だけ
+# 判定なしで流して背景モデルを学習させてから計測を始める
+PRIME_SEC = 60.0
+
+
+# ----------------------------------------
+# 1. 録画の読み込み
+# ----------------------------------------
+@dataclass
+class Segment:
+    path: str
+    start: float         # 開始時刻（epoch 秒。ファイル名が日時でなければ直前の録画に続く相対秒）
+    duration: float
+    absolute: bool       # start がファイル名から得た実時刻か
+
+
+def probe_segments(paths: List[str]) -> List[Segment]:
+    """
+    Recording files in time order with their start time (from the
+    YYYYMMDD_HHMMSS.mkv name) and duration (container metadata).
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(os.path.join(path, n) for n in sorted(os.listdir(path)) if n.endswith(".mkv"))
+        else:
+            files.append(path)
+
+    segments = []
+    offset = 0.0
+    for path in files:
+        cap = cv2.VideoCapture(path)
+        if not cap.isOpened():
+            raise ValueError(f"Cannot open {path}")
+        src_fps = cap.get(cv2.CAP_PROP_FPS) or 0.0
+        count = cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0.0
+        cap.release()
+        duration = count / src_fps if src_fps > 0 else 0.0
+
+        ts = parse_recording_timestamp(path)
+        if ts is not None:
+            segments.append(Segment(path, ts.timestamp(), duration, True))
+        else:
+            segments.append(Segment(path, offset, duration, False))
+        offset += duration
+    if not segments:
+        raise ValueError("No recordings given")
+    if all(s.absolute for s in segments):
+        segments.sort(key=lambda s: s.start)
+    return segments
+
+
+def sample_frames(path: str, fps: float, start_sec: float = 0.0,
+                  width: Optional[int] = None) -> Iterator[Tuple[float, np.ndarray]]:
+    """
+    (offset seconds, gray frame) of a video decoded at full speed and
+    thinned to `fps`, as the ffmpeg fps filter feeds latest.jpg.
+    `width` downsizes the frames first (frame ring with ring_width).
+    """
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise ValueError(f"Cannot open {path}")
+    src_fps = cap.get(cv2.CAP_PROP_FPS) or 0.0
+    if start_sec > 0:
+        cap.set(cv2.CAP_PROP_POS_MSEC, start_sec * 1000)
+    step = 1.0 / fps
+    next_t = start_sec
+    index = 0
+    try:
+        while cap.grab():
+            pos = cap.get(cv2.CAP_PROP_POS_MSEC) / 1000
+            if pos <= 0 and index and src_fps > 0:
+                pos = start_sec + index / src_fps
+            index += 1
+            if pos + 1e-6 < next_t:
+                continue
+            ok, frame = cap.retrieve()
+            if not ok:
+                continue
+            # 録画の欠け（タイムスタンプの飛び）の後はそこから数え直す
+            next_t = next_t + step if pos < next_t + step else pos + step
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            if width and gray.shape[1] != width:
+                h, w = gray.shape
+                gray = cv2.resize(gray, (width, h * width // w), interpolation=cv2.INTER_AREA)
+            yield pos, gray
+    finally:
+        cap.release()
+
+
+# ----------------------------------------
+# 2. 並列処理の単位（設定のまとまり × 連続した録画）
+# ----------------------------------------
+def replay_task(task: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Run one group of parameter sets over one run of consecutive
+    recordings. Each frame is decoded once and given to every detector
+    of the group; only MotionDetector.process() is timed per set.
+    Runs in a worker process (arguments and result are plain data).
+    """
+    mask = MotionDetector.load_mask(task["mask"], lambda msg: None) if task["mask"] else None
+    detectors = [MotionDetector(MotionSettings(**s), mask, lambda msg: None) for s in task["sets"]]
+    results = [{"decisions": [], "times": [], "process": [], "gated": 0} for _ in detectors]
+
+    def feed(frame: np.ndarray, record: bool, t: float = 0.0):
+        reduced: Dict[int, np.ndarray] = {}
+        for det, res in zip(detectors, results):
+            scaled = reduced.get(det.scale)
+            if scaled is None:
+                scaled = reduced[det.scale] = MotionDetector.reduce(frame, det.scale)
+            t0 = time.perf_counter()
+            result = det.process(scaled)
+            elapsed = time.perf_counter() - t0
+            if not record:
+                continue
+            res["process"].append(elapsed)
+            res["gated"] += int(result.gated)
+            res["times"].append(t)
+            # CameraRunner.handle_frame と同じ判定（グリッチは flag を変えない）
+            if result.glitch:
+                res["decisions"].append("G")
+            elif result.motion and det.warmed_up:
+                res["decisions"].append("M")
+            else:
+                res["decisions"].append(".")
+
+    decode = 0.0
+    frames = 0
+    prime = task.get("prime")
+    if prime:
+        for _pos, frame in sample_frames(prime["path"], task["fps"], prime["from"], task["width"]):
+            feed(frame, record=False)
+    for seg in task["segments"]:
+        t0 = time.perf_counter()
+        for pos, frame in sample_frames(seg["path"], task["fps"], width=task["width"]):
+            decode += time.perf_counter() - t0
+            frames += 1
+            feed(frame, record=True, t=seg["start"] + pos)
+            t0 = time.perf_counter()
+        decode += time.perf_counter() - t0
+
+    for res in results:
+        res["decisions"] = "".join(res["decisions"])
+    return {"index": task["index"], "frames": frames, "decode_sec": decode, "sets": results}
+
+
+def _init_worker():
+    # 並列度はプロセス数で取る（OpenCV 内部のスレッドと取り合わない）
+    cv2.setNumThreads(1)
+
+
+def plan_tasks(segments: List[Segment], sets: List[Dict[str, Any]], workers: int,
+               fps: float, mask: Optional[str], width: Optional[int]) -> List[Dict[str, Any]]:
+    """
+    Split the work into parameter groups x runs of consecutive recordings
+    so that about `workers` tasks exist. Groups share the decoding of a
+    frame; a run that does not start at the first recording is primed
+    with the tail of the recording before it.
+    """
+    groups = min(len(sets), workers)
+    runs = max(1, min(len(segments), workers // groups))
+    per_run = -(-len(segments) // runs)
+
+    tasks = []
+    for g in range(groups):
+        group_sets = [(i, s) for i, s in enumerate(sets) if i % groups == g]
+        for r in range(0, len(segments), per_run):
+            prime = None
+            if r > 0:
+                prev = segments[r - 1]
+                prime = {"path": prev.path, "from": max(0.0, prev.duration - PRIME_SEC)}
+            tasks.append({
+                "index": len(tasks),
+                "set_ids": [i for i, _s in group_sets],
+                "sets": [s for _i, s in group_sets],
+                "segments": [{"path": s.path, "start": s.start} for s in segments[r:r + per_run]],
+                "prime": prime,
+                "fps": fps,
+                "mask": mask,
+                "width": width,
+            })
+    return tasks
+
+
+# ----------------------------------------
+# 3. 動体区間（motion_event_handler と同じまとめ方）
+# ----------------------------------------
+def motion_intervals(times: List[float], decisions: str, frame_sec: float,
+                     idle_sec: float, post_sec: float) -> List[Dict[str, float]]:
+    """
+    Events the handler would record from these frame decisions: motion.flag
+    is raised on M and cleared on '.', a glitch keeps it; an event ends
+    idle_sec after the last flagged moment and closes post_sec after it.
+    """
+    intervals = []
+    start = last = None
+    frames = 0
+    flag = False
+    for t, d in zip(times, decisions):
+        if d == "M":
+            flag = True
+        elif d == ".":
+            flag = False
+        if not flag:
+            continue
+        if start is not None and t - last >= idle_sec:
+            intervals.append({"start": start, "end": last + frame_sec + post_sec, "motion_frames": frames})
+            start = None
+        if start is None:
+            start, frames = t, 0
+        last = t
+        frames += 1
+    if start is not None:
+        intervals.append({"start": start, "end": last + frame_sec + post_sec, "motion_frames": frames})
+    return intervals
+
+
+def summarize(sets: List[Dict[str, Any]], tasks: List[Dict[str, Any]], outputs: List[Dict[str, Any]],
+              fps: float, idle_sec: float, post_sec: float, video_sec: float) -> List[Dict[str, Any]]:
+    per_set: List[Dict[str, Any]] = [{"times": [], "decisions": [], "process": [], "gated": 0} for _ in sets]
+    for out in sorted(outputs, key=lambda o: o["index"]):
+        task = tasks[out["index"]]
+        for set_id, res in zip(task["set_ids"], out["sets"]):
+            acc = per_set[set_id]
+            acc["times"].extend(res["times"])
+            acc["decisions"].append(res["decisions"])
+            acc["process"].extend(res["process"])
+            acc["gated"] += res["gated"]
+
+    summary = []
+    for settings, acc in zip(sets, per_set):
+        decisions = "".join(acc["decisions"])
+        order = sorted(range(len(acc["times"])), key=acc["times"].__getitem__)
+        times = [acc["times"][i] for i in order]
+        decisions = "".join(decisions[i] for i in order)
+        intervals = motion_intervals(times, decisions, 1.0 / fps, idle_sec, post_sec)
+        cpu = sum(acc["process"])
+        summary.append({
+            "settings": settings,
+            "frames": len(decisions),
+            "motion_frames": decisions.count("M"),
+            "glitches": decisions.count("G"),
+            "gated": acc["gated"],
+            "events": len(intervals),
+            "motion_sec": round(sum(i["end"] - i["start"] for i in intervals), 1),
+            "process_ms": percentiles_ms(acc["process"]) if acc["process"] else {},
+            "cpu_sec": round(cpu, 2),
+            "realtime": round(video_sec / cpu, 1) if cpu > 0 else None,
+            "intervals": intervals,
+        })
+    return summary
+
+
+# ----------------------------------------
+# 4. 出力
+# ----------------------------------------
+def _fmt_time(t: float, absolute: bool) -> str:
+    if absolute:
+        return datetime.fromtimestamp(t).strftime("%Y-%m-%d %H:%M:%S")
+    return time.strftime("+%H:%M:%S", time.gmtime(t))
+
+
+def print_report(report: dict, show_intervals: bool):
+    keys = report["grid_keys"]
+    absolute = report["absolute_times"]
+    print(f"{report['video_sec'] / 60:.1f} min of video in {len(report['segments'])} recordings, "
+          f"{report['fps']} fps, {report['frames']} frames, decode {report['decode_sec']:.1f}s, "
+          f"wall {report['wall_sec']:.1f}s ({report['workers']} workers)")
+    header = " ".join(f"{k:>14}" for k in keys)
+    print(f"{'#':>3} {header} {'events':>6} {'motion s':>8} {'M frames':>8} {'glitch':>6} {'gated':>6} "
+          f"{'p50/p99 ms':>13} {'cpu s':>7} {'x rt':>6}")
+    for i, r in enumerate(report["results"]):
+        values = " ".join(f"{str(r['settings'][k]):>14}" for k in keys)
+        p = r["process_ms"]
+        ms = f"{p.get('p50', 0):.2f}/{p.get('p99', 0):.2f}"
+        realtime = "-" if r["realtime"] is None else f"{r['realtime']:.0f}"
+        print(f"{i:>3} {values} {r['events']:>6} {r['motion_sec']:>8.1f} {r['motion_frames']:>8} "
+              f"{r['glitches']:>6} {r['gated']:>6} {ms:>13} {r['cpu_sec']:>7.2f} {realtime:>6}")
+    if not show_intervals:
+        return
+    for i, r in enumerate(report["results"]):
+        print()
+        print(f"#{i} " + ", ".join(f"{k}={r['settings'][k]}" for k in keys))
+        for iv in r["intervals"]:
+            print(f"    {_fmt_time(iv['start'], absolute)}  {iv['end'] - iv['start']:6.1f}s  "
+                  f"{iv['motion_frames']:>4} frames")
+
+
+# ----------------------------------------
+# 5. メイン処理
+# ----------------------------------------
+def camera_defaults(cam: str) -> Dict[str, Any]:
+    """
+    Motion / event settings, sampling rate and mask of a configured
+    camera (needs /etc/nvr).
+    """
+    from common.config_loader import NVR_CONFIG_MASK_DIR, load_camera_config, load_main_config
+    from core.opencv.motion_detector import TRANSPORT_SHM_RING, load_motion_settings
+    from core.motion_event_handler import load_event_settings
+
+    main_cfg = load_main_config()
+    cam_cfg = load_camera_config(cam)
+    motion_cfg = cam_cfg.get("motion", {}) or {}
+    fps = (cam_cfg.get("ffmpeg", {}) or {}).get("latest_fps") or DEFAULT_FPS
+    width = None
+    if motion_cfg.get("transport") == TRANSPORT_SHM_RING:
+        fps = motion_cfg.get("ring_fps", fps)
+        width = motion_cfg.get("ring_width")
+    event = load_event_settings(cam, main_cfg, cam_cfg)
+    mask = os.path.join(NVR_CONFIG_MASK_DIR, f"{cam}.png")
+    return {
+        "settings": load_motion_settings(cam, main_cfg, cam_cfg),
+        "fps": float(fps),
+        "width": width,
+        "idle_sec": event.idle_sec,
+        "post_sec": event.post_motion_buffer_sec,
+        "mask": mask if os.path.exists(mask) else None,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Replay recordings through the motion detector with many settings")
+    parser.add_argument("recordings", nargs="+", help="*.mkv files or directories of them")
+    parser.add_argument("--cam", help="start from this camera's settings, fps, mask and event timeout")
+    parser.add_argument("--grid", action="append", default=[], metavar="KEY=V1,V2,...",
+                        help="MotionSettings values to try (repeatable; all combinations are run)")
+    parser.add_argument("--set", action="append", default=[], metavar="KEY=VALUE",
+                        help="fixed MotionSettings override for every combination")
+    parser.add_argument("--fps", type=float, help="detection frame rate (default: camera latest_fps or 5)")
+    parser.add_argument("--width", type=int, help="downsize frames to this width first (frame ring)")
+    parser.add_argument("--mask", help="mask image (white = watched area)")
+    parser.add_argument("--idle-sec", type=float, help="event timeout (default: camera / 10)")
+    parser.add_argument("--post-sec", type=float, help="post motion buffer (default: camera / 2)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="worker processes")
+    parser.add_argument("--intervals", action="store_true", help="list the motion intervals of every combination")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    base = camera_defaults(args.cam) if args.cam else {
+        "settings": MotionSettings(), "fps": DEFAULT_FPS, "width": None,
+        "idle_sec": DEFAULT_IDLE_SEC, "post_sec": DEFAULT_POST_MOTION_BUFFER_SEC, "mask": None,
+    }
+    settings: MotionSettings = base["settings"]
+    fps = args.fps or base["fps"]
+    width = args.width or base["width"]
+    idle_sec = args.idle_sec if args.idle_sec is not None else base["idle_sec"]
+    post_sec = args.post_sec if args.post_sec is not None else base["post_sec"]
+    mask = args.mask or base["mask"]
+
+    grid: Dict[str, List[Any]] = {}
+    try:
+        for kv in args.set:
+            key, value = kv.split("=", 1)
+            setattr(settings, key, coerce_setting(settings, key, value))
+        for kv in args.grid:
+            key, values = kv.split("=", 1)
+            grid[key] = [coerce_setting(settings, key, v) for v in values.split(",")]
+    except ValueError as e:
+        parser.error(str(e))
+    settings.enabled = True
+    sets = [{**asdict(settings), **dict(zip(grid, combo))} for combo in itertools.product(*grid.values())]
+
+    try:
+        segments = probe_segments(args.recordings)
+    except ValueError as e:
+        parser.error(str(e))
+    video_sec = sum(s.duration for s in segments)
+    tasks = plan_tasks(segments, sets, max(1, args.workers), fps, mask, width)
+    print(f"Replaying {len(segments)} recordings with {len(sets)} settings as {len(tasks)} tasks", file=sys.stderr)
+
+    started = time.perf_counter()
+    if len(tasks) == 1:
+        outputs = [replay_task(tasks[0])]
+    else:
+        with ProcessPoolExecutor(max_workers=min(args.workers, len(tasks)), initializer=_init_worker) as pool:
+            outputs = list(pool.map(replay_task, tasks))
+    wall = time.perf_counter() - started
+
+    # 同じ録画を複数のグループがデコードするため、フレーム数・デコード時間は 1 グループ分
+    first_group = {t["index"] for t in tasks if t["set_ids"] == tasks[0]["set_ids"]}
+    report = {
+        "segments": [s.path for s in segments],
+        "absolute_times": all(s.absolute for s in segments),
+        "video_sec": round(video_sec, 1),
+        "fps": fps,
+        "width": width,
+        "mask": mask,
+        "idle_sec": idle_sec,
+        "post_sec": post_sec,
+        "grid_keys": list(grid) or ["threshold", "min_area"],
+        "workers": min(args.workers, len(tasks)),
+        "frames": sum(o["frames"] for o in outputs if o["index"] in first_group),
+        "decode_sec": round(sum(o["decode_sec"] for o in outputs if o["index"] in first_group), 2),
+        "wall_sec": round(wall, 2),
+        "results": summarize(sets, tasks, outputs, fps, idle_sec, post_sec, video_sec),
+    }
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report, args.intervals)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,479 @@
+import os
+import sys
+import glob
+import json
+import time
+import bisect
+import shutil
+import signal
+import argparse
+import functools
+import threading
+from dataclasses import dataclass, asdict
+from datetime import datetime
+from typing import Dict, List, Optional, Set
+
+from common.config_loader import (
+    load_camera_config,
+    load_main_config,
+    get_config_value,
+    NVR_CONFIG_CAM_DIR,
+    RECORDS_DIR_BASE,
+    EVENTS_DIR_BASE,
+    MOTION_TMP_BASE,
+)
+from common.event_index import get_event_index
+from common.segment_index import SegmentIndex
+
+print = functools.partial(print, flush=True)
+
+# ---------------------------------------------------------
+# retention.py
+#   - 録画セグメント（*.mkv）とイベントディレクトリを、カメラごとの上限
+#     （容量・日数）とディスクの空き容量の下限に従って古いものから削除する
+#   - 使用量は du で数え直さずに台帳で管理する
+#       録画: セグメント一覧（ディレクトリの mtime が変わったときだけ再取得）と、
+#             書き込みが終わった時点のファイルサイズ
+#       イベント: イベントインデックス（event.json の total_size_bytes）
+#   - イベントを含むセグメントは event_linked_days まで長く残す
+#   - 削除は batch_size 件ずつ、間に batch_pause_sec 秒の休止を入れて録画の書き込みを妨げない
+#   - 状態は <motion_tmp_base>/retention.json に書き出す（GET /system/status で参照）
+# ---------------------------------------------------------
+
+GB = 1024 ** 3
+DAY = 86400
+STATE_FILE = os.path.join(MOTION_TMP_BASE, "retention.json")
+# イベントの前後このマージン内に重なるセグメントをイベント付きとみなす（秒）
+EVENT_LINK_MARGIN = 10
+# 直近の削除履歴として状態ファイルに残す件数
+RECENT_DELETIONS = 20
+
+
+# ----------------------------------------
+# 1. 設定
+# ----------------------------------------
+@dataclass
+class RetentionPolicy:
+    records_max_bytes: int = 0      # 0 は無制限
+    records_max_days: float = 0
+    events_max_bytes: int = 0
+    events_max_days: float = 0
+    event_linked_days: float = 0    # イベントを含むセグメントの保持日数（records_max_days より長い場合のみ有効）
+
+
+@dataclass
+class RetentionSettings:
+    interval_sec: float = 60
+    min_free_bytes: int = 0
+    batch_size: int = 5
+    batch_pause_sec: float = 2.0
+
+
+def load_retention_settings(main_cfg=None) -> RetentionSettings:
+    main_cfg = main_cfg if main_cfg is not None else load_main_config()
+    cfg = get_config_value(main_cfg, "common.retention", {}) or {}
+    return RetentionSettings(
+        interval_sec=float(cfg.get("interval_sec", 60)),
+        min_free_bytes=int(float(cfg.get("min_free_gb", 0)) * GB),
+        batch_size=max(1, int(cfg.get("batch_size", 5))),
+        batch_pause_sec=float(cfg.get("batch_pause_sec", 2.0)),
+    )
+
+
+def load_retention_policy(cam, main_cfg=None, cam_cfg=None) -> RetentionPolicy:
+    """
+    Resolve the retention policy of a camera (camera YAML -> main.yaml common.retention).
+    """
+    main_cfg = main_cfg if main_cfg is not None else load_main_config()
+    if cam_cfg is None:
+        try:
+            cam_cfg = load_camera_config(cam)
+        except FileNotFoundError:
+            # 設定が削除されたカメラの録画も既定の上限で整理する
+            cam_cfg = {}
+    default = get_config_value(main_cfg, "common.retention", {}) or {}
+    own = cam_cfg.get("retention", {}) or {}
+
+    def value(key_path):
+        val = get_config_value(own, key_path)
+        return val if val is not None else get_config_value(default, key_path, 0)
+
+    return RetentionPolicy(
+        records_max_bytes=int(float(value("records.max_gb")) * GB),
+        records_max_days=float(value("records.max_days")),
+        events_max_bytes=int(float(value("events.max_gb")) * GB),
+        events_max_days=float(value("events.max_days")),
+        event_linked_days=float(value("event_linked_days")),
+    )
+
+
+def retention_cameras() -> List[str]:
+    """
+    Cameras with a config file or a records directory (recordings of a
+    removed camera are still subject to the default policy).
+    """
+    cams = {os.path.splitext(os.path.basename(f))[0]
+            for f in glob.glob(os.path.join(NVR_CONFIG_CAM_DIR, "*.yaml"))}
+    for base in (RECORDS_DIR_BASE, EVENTS_DIR_BASE):
+        try:
+            cams.update(n for n in os.listdir(base)
+                        if not n.startswith(".") and os.path.isdir(os.path.join(base, n)))
+        except FileNotFoundError:
+            pass
+    return sorted(cams)
+
+
+# ----------------------------------------
+# 2. 使用量の台帳
+# ----------------------------------------
+@dataclass
+class Victim:
+    kind: str               # record / event
+    camera: str
+    path: str
+    size: int
+    start: float            # 開始時刻（epoch）
+    time: float             # 終了時刻（epoch）
+    reason: str             # age / quota / free_space
+    linked: bool = False    # イベントを含むセグメント
+    event_id: Optional[str] = None
+    recording: bool = False  # 記録中のイベント（event.json に終了時刻がない）
+
+
+class CameraLedger:
+    """
+    Sizes of one camera's segments and events, kept up to date
+    incrementally: segments are stat'ed once when they are closed (the
+    open one on every pass) and event sizes come from the event index.
+    """
+
+    def __init__(self, cam: str):
+        self.cam = cam
+        self.sizes: Dict[str, int] = {}
+        self.event_sizes: Dict[str, int] = {}   # total_size_bytes のないイベントの実測値
+        self.segment_index = SegmentIndex(os.path.join(RECORDS_DIR_BASE, cam), check_interval=0,
+                                          on_closed=self._on_closed)
+
+    def _stat(self, name: str, path: str):
+        try:
+            self.sizes[name] = os.path.getsize(path)
+        except FileNotFoundError:
+            self.sizes.pop(name, None)
+
+    def _on_closed(self, path: str):
+        # 書き込みが終わったセグメントのサイズは以後変わらない
+        self._stat(os.path.basename(path), path)
+
+    def records(self) -> List[Victim]:
+        """
+        All segments oldest first as deletion candidates (time = end of the
+        segment: the next segment's start, or now for the open one).
+        """
+        segments = self.segment_index.segments()
+        names = {s.name for s in segments}
+        for gone in self.sizes.keys() - names:
+            del self.sizes[gone]
+
+        now = time.time()
+        result = []
+        for i, seg in enumerate(segments):
+            if seg.name not in self.sizes or not seg.closed:
+                self._stat(seg.name, seg.path)
+            end = segments[i + 1].start.timestamp() if i + 1 < len(segments) else now
+            result.append(Victim("record", self.cam, seg.path, self.sizes.get(seg.name, 0),
+                                 seg.start.timestamp(), end, ""))
+        return result
+
+    def events(self) -> List[Victim]:
+        result = []
+        for row in get_event_index().summaries(self.cam):
+            event_dir = os.path.join(EVENTS_DIR_BASE, self.cam, row["year"], row["month"], row["event_id"])
+            size = row["size"]
+            if size is None:
+                size = self.event_sizes.get(row["event_id"])
+                if size is None:
+                    size = self.event_sizes[row["event_id"]] = _dir_size(event_dir)
+            result.append(Victim("event", self.cam, event_dir, int(size), row["ts"], row["ts_end"] or row["ts"], "",
+                                 event_id=row["event_id"], recording=row["ts_end"] is None))
+        return result
+
+
+def _dir_size(path: str) -> int:
+    total = 0
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                if entry.is_file(follow_symlinks=False):
+                    total += entry.stat(follow_symlinks=False).st_size
+    except FileNotFoundError:
+        pass
+    return total
+
+
+def mark_linked(records: List[Victim], events: List[Victim]):
+    """
+    Flag segments that overlap an event (with EVENT_LINK_MARGIN).
+    Both lists are oldest first.
+    """
+    seg_starts = [r.start for r in records]
+    for ev in events:
+        ev_start = ev.start - EVENT_LINK_MARGIN
+        first = max(0, bisect.bisect_right(seg_starts, ev_start) - 1)
+        last = bisect.bisect_right(seg_starts, ev.time + EVENT_LINK_MARGIN)
+        for r in records[first:last]:
+            if r.time >= ev_start:
+                r.linked = True
+
+
+# ----------------------------------------
+# 3. 削除計画と実行
+# ----------------------------------------
+class RetentionService:
+    def __init__(self, settings: RetentionSettings, dry_run: bool = False,
+                 log=lambda msg: print(f"[retention] {msg}")):
+        self.settings = settings
+        self.dry_run = dry_run
+        self.log = log
+        self.ledgers: Dict[str, CameraLedger] = {}
+        self.policies: Dict[str, RetentionPolicy] = {}
+        self.failed: Set[str] = set()       # 削除に失敗したパス（繰り返さない）
+        self.deleted = {"records": 0, "events": 0, "bytes": 0}
+        self.recent: List[dict] = []
+        self.usage: Dict[str, dict] = {}
+
+    def refresh_policies(self):
+        main_cfg = load_main_config()
+        self.settings = load_retention_settings(main_cfg)
+        self.policies = {}
+        for cam in retention_cameras():
+            self.policies[cam] = load_retention_policy(cam, main_cfg)
+            if cam not in self.ledgers:
+                self.ledgers[cam] = CameraLedger(cam)
+        for cam in list(self.ledgers):
+            if cam not in self.policies:
+                del self.ledgers[cam]
+
+    @staticmethod
+    def _free_bytes() -> Optional[int]:
+        try:
+            return shutil.disk_usage(RECORDS_DIR_BASE).free
+        except OSError:
+            return None
+
+    @staticmethod
+    def _same_device(a: str, b: str) -> bool:
+        try:
+            return os.stat(a).st_dev == os.stat(b).st_dev
+        except OSError:
+            return False
+
+    def plan(self) -> List[Victim]:
+        """
+        Everything that should be deleted now, oldest first.
+        """
+        now = time.time()
+        victims: Dict[str, Victim] = {}
+        spare: List[Victim] = []        # 空き容量が足りない場合に追加で削除できるもの
+        usage = {}
+
+        def take(v: Victim, reason: str):
+            if v.path not in victims and v.path not in self.failed:
+                v.reason = reason
+                victims[v.path] = v
+
+        for cam, ledger in self.ledgers.items():
+            policy = self.policies[cam]
+            records = ledger.records()
+            events = ledger.events()
+            mark_linked(records, events)
+            usage[cam] = {
+                "records_bytes": sum(r.size for r in records),
+                "records_count": len(records),
+                "events_bytes": sum(e.size for e in events),
+                "events_count": len(events),
+                "oldest_record": datetime.fromtimestamp(records[0].start).isoformat(timespec="seconds")
+                                 if records else None,
+                "oldest_event": events[0].event_id if events else None,
+                "policy": asdict(policy),
+            }
+
+            # 書き込み中の最新セグメントと記録中のイベントは削除しない
+            closed = records[:-1]
+            finished = [e for e in events if not e.recording]
+
+            # 日数の上限
+            if policy.records_max_days:
+                for r in closed:
+                    days = policy.records_max_days
+                    if r.linked and policy.event_linked_days > days:
+                        days = policy.event_linked_days
+                    if now - r.time > days * DAY:
+                        take(r, "age")
+            if policy.events_max_days:
+                for e in finished:
+                    if now - e.time > policy.events_max_days * DAY:
+                        take(e, "age")
+
+            # 容量の上限（イベントなしのセグメントから、次にイベント付きを古い順に）
+            if policy.records_max_bytes:
+                over = usage[cam]["records_bytes"] - policy.records_max_bytes
+                over -= sum(v.size for v in victims.values() if v.camera == cam and v.kind == "record")
+                for r in [r for r in closed if not r.linked] + [r for r in closed if r.linked]:
+                    if over <= 0:
+                        break
+                    if r.path not in victims:
+                        take(r, "quota")
+                        over -= r.size
+            if policy.events_max_bytes:
+                over = usage[cam]["events_bytes"] - policy.events_max_bytes
+                over -= sum(v.size for v in victims.values() if v.camera == cam and v.kind == "event")
+                for e in finished:
+                    if over <= 0:
+                        break
+                    if e.path not in victims:
+                        take(e, "quota")
+                        over -= e.size
+
+            spare.extend(r for r in closed if r.path not in victims)
+            spare.extend(e for e in finished if e.path not in victims)
+
+        # 空き容量の下限（全カメラで古いものから。イベントなしのセグメント → イベント付き → イベント）
+        free = self._free_bytes()
+        if self.settings.min_free_bytes and free is not None:
+            deficit = self.settings.min_free_bytes - free - sum(v.size for v in victims.values())
+            if deficit > 0:
+                events_here = self._same_device(EVENTS_DIR_BASE, RECORDS_DIR_BASE)
+                order = {("record", False): 0, ("record", True): 1, ("event", False): 2}
+                for v in sorted((v for v in spare if v.kind == "record" or events_here),
+                                key=lambda v: (order[(v.kind, v.linked)], v.time)):
+                    if deficit <= 0:
+                        break
+                    take(v, "free_space")
+                    deficit -= v.size
+
+        self.usage = usage
+        return sorted(victims.values(), key=lambda v: v.time)
+
+    def delete(self, v: Victim) -> bool:
+        when = datetime.fromtimestamp(v.time).isoformat(timespec="seconds")
+        if self.dry_run:
+            self.log(f"[dry-run] would delete {v.kind} {v.path} ({v.size / 2**20:.1f} MiB, {v.reason}, end {when})")
+            return True
+        try:
+            if v.kind == "record":
+                os.remove(v.path)
+                self.deleted["records"] += 1
+            else:
+                shutil.rmtree(v.path, ignore_errors=False)
+                get_event_index().delete(v.camera, v.event_id)
+                try:
+                    from common.event_thumbs import get_thumb_cache
+                    get_thumb_cache().forget(v.camera, v.event_id)
+                except Exception:
+                    pass
+                self.deleted["events"] += 1
+        except FileNotFoundError:
+            if v.kind == "event":
+                # ディレクトリが既にないイベントはインデックスからだけ消す
+                get_event_index().delete(v.camera, v.event_id)
+                self.log(f"Dropped stale index entry {v.camera}/{v.event_id}")
+            return True
+        except OSError as e:
+            self.log(f"Failed to delete {v.path}: {e}")
+            self.failed.add(v.path)
+            return False
+
+        self.deleted["bytes"] += v.size
+        self.recent = (self.recent + [{
+            "kind": v.kind, "camera": v.camera, "path": v.path, "size": v.size,
+            "reason": v.reason, "linked": v.linked, "end": when,
+        }])[-RECENT_DELETIONS:]
+        self.log(f"Deleted {v.kind} {v.path} ({v.size / 2**20:.1f} MiB, {v.reason})")
+        return True
+
+    def write_state(self):
+        try:
+            usage = shutil.disk_usage(RECORDS_DIR_BASE)
+            disk = {"total_bytes": usage.total, "free_bytes": usage.free}
+        except OSError:
+            disk = {}
+        state = {
+            "updated_at": datetime.now().isoformat(timespec="seconds"),
+            "dry_run": self.dry_run,
+            "min_free_bytes": self.settings.min_free_bytes,
+            **disk,
+            "cameras": self.usage,
+            "deleted": self.deleted,
+            "recent": self.recent,
+        }
+        try:
+            tmp = f"{STATE_FILE}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(state, f, ensure_ascii=False, indent=2)
+            os.replace(tmp, STATE_FILE)
+        except OSError as e:
+            self.log(f"Failed to write {STATE_FILE}: {e}")
+
+    def run_cycle(self, stop: threading.Event):
+        """
+        Delete in batches until nothing is over its limit.
+        """
+        self.refresh_policies()
+        while not stop.is_set():
+            victims = self.plan()
+            if not victims:
+                break
+            if self.dry_run:
+                # 計画を一覧するだけ（削除しないので繰り返さない）
+                for v in victims:
+                    self.delete(v)
+                break
+            for v in victims[:self.settings.batch_size]:
+                self.delete(v)
+            self.write_state()
+            # 録画の書き込み帯域を空けるため、バッチごとに休む
+            if stop.wait(self.settings.batch_pause_sec):
+                break
+        self.write_state()
+
+    def run(self, stop: threading.Event, once: bool = False):
+        while not stop.is_set():
+            try:
+                self.run_cycle(stop)
+            except Exception as e:
+                self.log(f"Error: {e!r}")
+            if once:
+                return
+            stop.wait(self.settings.interval_sec)
+
+
+# ----------------------------------------
+# 4. メイン処理
+# ----------------------------------------
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Delete old recordings and events by quota")
+    parser.add_argument("--once", action="store_true", help="run one cycle and exit")
+    parser.add_argument("--dry-run", action="store_true", help="only print what would be deleted")
+    args = parser.parse_args(argv)
+
+    service = RetentionService(load_retention_settings(), dry_run=args.dry_run)
+    stop = threading.Event()
+
+    def _on_signal(signum, _frame):
+        print("[retention] received termination signal")
+        stop.set()
+
+    signal.signal(signal.SIGTERM, _on_signal)
+    signal.signal(signal.SIGINT, _on_signal)
+
+    s = service.settings
+    print(f"[retention] Starting (interval={s.interval_sec}s, min_free={s.min_free_bytes / GB:.1f}GB, "
+          f"batch={s.batch_size}/{s.batch_pause_sec}s{', dry-run' if args.dry_run else ''})")
+    service.run(stop, once=args.once or args.dry_run)
+
+
+# ----------------------------------------
+# 実行
+# ----------------------------------------
+if __name__ == "__main__":
+    main(sys.argv[1:])
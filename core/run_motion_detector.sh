@@ -1,16 +1,17 @@
 #!/bin/bash
 # ---------------------------------------------------------
-# run_motion_detector.sh <CAM>
+# run_motion_detector.sh <CAM> | --engine
 #   - OpenCV motion detector launcher
 #   - systemd (motion_detector@.service) から呼ばれる
-#   - venv を activate して motion_detector.py を実行する
+#   - --engine: 全カメラを 1 プロセスで処理する (motion_engine.service)
+#   - venv を activate して motion_detector.py / motion_engine.py を実行する
 # ---------------------------------------------------------
 
 set -euo pipefail
 
-CAM="$1"
+CAM="${1:-}"
 if [ -z "$CAM" ]; then
-    echo "[run_motion_detector] Error: CAM argument is required."
+    echo "[run_motion_detector] Error: CAM argument (or --engine) is required."
     exit 1
 fi
 
@@ -35,20 +36,32 @@ fi
 # systemd は root で動くため sudo は不要
 source "${VENV_DIR}/bin/activate"
 
+# PYTHONPATH の設定 (既存のパスも壊さないように追記)
+export PYTHONPATH="${NVR_BASE_DIR}:${PYTHONPATH:-}"
+VENV_PYTHON="${VENV_DIR}/bin/python3"
+TMP_BASE=$(get_main_val '.common.motion_tmp_base')
+
 # ---------------------------------------------------------
-# 2. main.yaml から TMP_DIR を取得して作成
+# 2. エンジンモード（全カメラを 1 プロセスで処理）
+# ---------------------------------------------------------
+if [ "$CAM" = "--engine" ]; then
+    for f in "$NVR_CONFIG_CAM_DIR"/*.yaml; do
+        mkdir -p "${TMP_BASE}/$(basename "$f" .yaml)"
+    done
+    echo "[run_motion_detector] Starting motion engine for all enabled cameras"
+    exec "$VENV_PYTHON" "${NVR_CORE_DIR}/opencv/motion_engine.py"
+fi
+
+# ---------------------------------------------------------
+# 3. main.yaml から TMP_DIR を取得して作成
 # ---------------------------------------------------------
-TMP_BASE=$(get_main_val '.common.motion_tmp_base')
 MOTION_TMP_DIR="${TMP_BASE}/${CAM}"
 
 mkdir -p "$MOTION_TMP_DIR"
 
 # ---------------------------------------------------------
-# 3. OpenCV motion detector を起動
+# 4. OpenCV motion detector を起動
 # ---------------------------------------------------------
 echo "[run_motion_detector] Starting motion detector for $CAM"
-# PYTHONPATH の設定 (既存のパスも壊さないように追記)
-export PYTHONPATH="${NVR_BASE_DIR}:${PYTHONPATH:-}"
-VENV_PYTHON="${VENV_DIR}/bin/python3"
 SCRIPT_PATH="${NVR_CORE_DIR}/opencv/motion_detector.py"
 exec "$VENV_PYTHON" "$SCRIPT_PATH" "$CAM"
@@ -0,0 +1,26 @@
+#!/bin/bash
+# ---------------------------------------------------------
+# run_retention.sh [--once] [--dry-run]
+#   - 録画・イベント自動削除サービスの launcher
+#   - systemd (nvr_retention.service) から呼ばれる
+#   - 削除の方針は main.yaml の common.retention（カメラ YAML で個別に上書き）
+# ---------------------------------------------------------
+
+set -euo pipefail
+
+ENV_GATEWAY="/etc/nvr/common_utils_path"
+if [ ! -f "$ENV_GATEWAY" ]; then
+    echo "Error: $ENV_GATEWAY not found. Please run deploy_nvr.sh first." >&2
+    exit 1
+fi
+source "$ENV_GATEWAY"
+source "$COMMON_UTILS"
+
+VENV_DIR=$(get_main_val '.common.python_venv_dir')
+if [ -z "$VENV_DIR" ] || [ "$VENV_DIR" = "null" ]; then
+    VENV_DIR="/usr/local/nvr-venv"
+fi
+
+export PYTHONPATH="${NVR_BASE_DIR}:${PYTHONPATH:-}"
+echo "[retention] Starting retention service"
+exec "${VENV_DIR}/bin/python3" -m core.retention "$@"
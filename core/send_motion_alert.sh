@@ -1,5 +1,7 @@
 #!/bin/bash
 EVENT_DIR="$1"
+# 検知時点のフレーム名（handler が渡す。これより前のフレームはプレロール）
+TRIGGER_FRAME="$2"
 if [ -z "$EVENT_DIR" ]; then
     echo "[NVR SendAlert] Error: Event directory not provided."
     exit 1
@@ -34,10 +36,33 @@ else
     EVENT_TIME="$EVENT_ID"
 fi
 
-# 添付するJPEGを取得 (0002.jpgを優先、なければ2番目、それでもなければ最初の画像を添付)
-ATTACH_JPEG_PATH="$EVENT_DIR/0002.jpg"
-if [ ! -f "$ATTACH_JPEG_PATH" ]; then
-    # 0002.jpg がなければ ls の結果から探す
+# 引数がなければ event.json の trigger_frame（古いイベントにはない）
+if [ -z "$TRIGGER_FRAME" ] && [ -f "$EVENT_DIR/event.json" ]; then
+    TRIGGER_FRAME=$(yq -r '.trigger_frame // ""' "$EVENT_DIR/event.json" 2>/dev/null)
+fi
+if [ -z "$TRIGGER_FRAME" ]; then
+    # 旧来の既定（0001.jpg は検知前のことが多いため 0002.jpg）
+    TRIGGER_FRAME="0002.jpg"
+fi
+
+# 添付するJPEGを取得 (検知時点のフレームを優先、なければ2番目、それでもなければ最初の画像を添付)
+ATTACH_JPEG_PATH="$EVENT_DIR/$TRIGGER_FRAME"
+if [ -f "$EVENT_DIR/frames.idx" ]; then
+    # frames.pack 形式のイベントは一時ファイルに取り出して添付する
+    VENV_DIR=$(get_main_val '.common.python_venv_dir')
+    if [ -z "$VENV_DIR" ] || [ "$VENV_DIR" = "null" ]; then
+        VENV_DIR="/usr/local/nvr-venv"
+    fi
+    ATTACH_JPEG_PATH=$(mktemp --suffix=.jpg)
+    trap 'rm -f "$ATTACH_JPEG_PATH"' EXIT
+    export PYTHONPATH="${NVR_BASE_DIR}:${PYTHONPATH:-}"
+    if ! "${VENV_DIR}/bin/python3" -m common.frame_pack extract "$EVENT_DIR" "$TRIGGER_FRAME" "$ATTACH_JPEG_PATH" 2>/dev/null \
+        && ! "${VENV_DIR}/bin/python3" -m common.frame_pack extract "$EVENT_DIR" 0001.jpg "$ATTACH_JPEG_PATH"; then
+        echo "[NVR SendAlert] No JPEG images found in $EVENT_DIR"
+        exit 0
+    fi
+elif [ ! -f "$ATTACH_JPEG_PATH" ]; then
+    # 検知時点のフレームがなければ ls の結果から探す
     ATTACH_JPEG=$(ls "$EVENT_DIR"/*.jpg 2>/dev/null | sort | sed -n '2p') # 2番目のファイルを取得
     if [ -z "$ATTACH_JPEG" ]; then
         # 2番目のファイルもなければ、最初のファイルを取得 (フォールバック)
@@ -161,16 +161,52 @@ systemctl daemon-reload
 # ---------------------------------------------------------
 echo "[setup_nvr] Enabling units..."
 
+# エンジンモードでは motion_detector@CAM の代わりに motion_engine.service を使う
+MOTION_ENGINE=$(get_main_val '.common.motion_engine.enabled // false')
+# エンジンがイベント処理も行う場合は motion_event_handler@CAM も使わない
+# （handle_events は未指定なら true。yq の // は false も置き換えるため直接比較する）
+ENGINE_EVENTS="false"
+if [ "$MOTION_ENGINE" = "true" ] && [ "$(get_main_val '.common.motion_engine.handle_events')" != "false" ]; then
+    ENGINE_EVENTS="true"
+fi
+
 for CAM in "${YAML_CAMERAS[@]}"; do
     ENABLED=$(get_cam_val "$CAM" '.enabled')
     if [ "$ENABLED" != "true" ]; then
         continue
     fi
     systemctl enable "ffmpeg_nvr@${CAM}.service"
-    systemctl enable "motion_detector@${CAM}.service"
-    systemctl enable "motion_event_handler@${CAM}.service"
+    if [ "$MOTION_ENGINE" = "true" ]; then
+        systemctl stop "motion_detector@${CAM}.service" || true
+        systemctl disable "motion_detector@${CAM}.service" || true
+    else
+        systemctl enable "motion_detector@${CAM}.service"
+    fi
+    if [ "$ENGINE_EVENTS" = "true" ]; then
+        systemctl stop "motion_event_handler@${CAM}.service" || true
+        systemctl disable "motion_event_handler@${CAM}.service" || true
+    else
+        systemctl enable "motion_event_handler@${CAM}.service"
+    fi
 done
 
+if [ "$MOTION_ENGINE" = "true" ]; then
+    echo "[setup_nvr] Motion engine mode: enabling motion_engine.service"
+    systemctl enable motion_engine.service
+else
+    systemctl stop motion_engine.service 2>/dev/null || true
+    systemctl disable motion_engine.service 2>/dev/null || true
+fi
+
+# 録画・イベントの自動削除（既定は無効）
+if [ "$(get_main_val '.common.retention.enabled // false')" = "true" ]; then
+    echo "[setup_nvr] Retention enabled: enabling nvr_retention.service"
+    systemctl enable nvr_retention.service
+else
+    systemctl stop nvr_retention.service 2>/dev/null || true
+    systemctl disable nvr_retention.service 2>/dev/null || true
+fi
+
 # ---------------------------------------------------------
 # 8. set storage directories permissions
 # ---------------------------------------------------------
@@ -25,6 +25,15 @@ fi
 
 echo "[start_nvr] Cameras: $CAMERAS"
 
+# エンジンモードでは motion_detector@CAM の代わりに motion_engine.service を起動する
+MOTION_ENGINE=$(get_main_val '.common.motion_engine.enabled // false')
+# エンジンがイベント処理も行う場合は motion_event_handler@CAM も使わない
+# （handle_events は未指定なら true。yq の // は false も置き換えるため直接比較する）
+ENGINE_EVENTS="false"
+if [ "$MOTION_ENGINE" = "true" ] && [ "$(get_main_val '.common.motion_engine.handle_events')" != "false" ]; then
+    ENGINE_EVENTS="true"
+fi
+
 for CAM in $CAMERAS; do
     CAMFILE="$NVR_CONFIG_CAM_DIR/$CAM.yaml"
 
@@ -50,32 +59,47 @@ for CAM in $CAMERAS; do
     done
 
     # motion_detector サービス
-    systemctl start motion_detector@"$CAM".service
-    echo -n "[start_nvr] Waiting for motion_detector@$CAM to become active"
-    for i in {1..10}; do
-        if systemctl is-active --quiet motion_detector@"$CAM".service; then
-            echo " OK"
-            break
-        fi
-        echo -n "."
-        sleep 1
-    done
+    if [ "$MOTION_ENGINE" != "true" ]; then
+        systemctl start motion_detector@"$CAM".service
+        echo -n "[start_nvr] Waiting for motion_detector@$CAM to become active"
+        for i in {1..10}; do
+            if systemctl is-active --quiet motion_detector@"$CAM".service; then
+                echo " OK"
+                break
+            fi
+            echo -n "."
+            sleep 1
+        done
+    fi
 
     # motion_event_handler サービス
-    systemctl start motion_event_handler@"$CAM".service
-    echo -n "[start_nvr] Waiting for motion_event_handler@$CAM to become active"
-    for i in {1..10}; do
-        if systemctl is-active --quiet motion_event_handler@"$CAM".service; then
-            echo " OK"
-            break
-        fi
-        echo -n "."
-        sleep 1
-    done
+    if [ "$ENGINE_EVENTS" != "true" ]; then
+        systemctl start motion_event_handler@"$CAM".service
+        echo -n "[start_nvr] Waiting for motion_event_handler@$CAM to become active"
+        for i in {1..10}; do
+            if systemctl is-active --quiet motion_event_handler@"$CAM".service; then
+                echo " OK"
+                break
+            fi
+            echo -n "."
+            sleep 1
+        done
+    fi
 
 done
 
+if [ "$MOTION_ENGINE" = "true" ]; then
+    systemctl start motion_engine.service
+    echo "[start_nvr] Motion engine started."
+fi
+
 echo "[start_nvr] All enabled cameras started."
 
+# 録画・イベントの自動削除
+if [ "$(get_main_val '.common.retention.enabled')" = "true" ]; then
+    systemctl start nvr_retention.service
+    echo "[start_nvr] Retention service started."
+fi
+
 systemctl start nvr-web.service
 echo "[start_nvr] WebUI started."
@@ -10,6 +10,20 @@ set -euo pipefail
 
 echo "[stop_nvr] Scanning running NVR services..."
 
+# 動体検知エンジン（全カメラ共通）
+if systemctl is-active --quiet motion_engine.service; then
+    echo "[stop_nvr] stopping motion_engine"
+    systemctl stop motion_engine.service || \
+        echo "[stop_nvr] warning: failed to stop motion_engine"
+fi
+
+# 録画・イベントの自動削除
+if systemctl is-active --quiet nvr_retention.service; then
+    echo "[stop_nvr] stopping nvr_retention"
+    systemctl stop nvr_retention.service || \
+        echo "[stop_nvr] warning: failed to stop nvr_retention"
+fi
+
 # ---------------------------------------------------------
 # 1. systemd から稼働中の NVR 関連サービスを抽出
 # ---------------------------------------------------------
@@ -4,6 +4,7 @@
 #   - tapoc113用録画エンジン
 #   - RTSP → MKV copy
 #   - latest.jpg を 5fps で更新
+#   - motion.transport: shm_ring の場合は検知用の生フレームを frame_ring に出力
 # ---------------------------------------------------------
 
 set -euo pipefail
@@ -66,6 +67,47 @@ LATEST_FPS=$(get_cam_val "$CAM" '.ffmpeg.latest_fps')
 # export LIBVA_DRIVERS_PATH=/usr/lib/x86_64-linux-gnu/dri
 VAAPI_DEVICE="/dev/dri/renderD128"
 
+# ---------------------------------------------------------
+# 4.5 検知用生フレーム（motion.transport: shm_ring）
+#   - latest.jpg と同じ 640x360 NV12 から Y 面（グレー）だけを FIFO に書き出し、
+#     frame_ring.py が /dev/shm のリングバッファへ書き込む
+#   - 検知器は JPEG デコードなしでリングを直接参照する
+#   - latest.jpg はダッシュボード・イベント保存用に従来どおり出力する
+# ---------------------------------------------------------
+TRANSPORT=$(get_cam_val "$CAM" '.motion.transport // "jpeg"')
+SNAP_FILTER="fps=${LATEST_FPS}[v_img_out]"
+RING_OUTPUT=()
+
+if [ "$TRANSPORT" = "shm_ring" ]; then
+    RING_FPS=$(get_cam_val "$CAM" ".motion.ring_fps // ${LATEST_FPS}")
+    RING_FILE="${MOTION_TMP_DIR}/frames.ring"
+    RING_FIFO="${MOTION_TMP_DIR}/frames.fifo"
+    VENV_DIR=$(get_main_val '.common.python_venv_dir')
+    if [ -z "$VENV_DIR" ] || [ "$VENV_DIR" = "null" ]; then
+        VENV_DIR="/usr/local/nvr-venv"
+    fi
+
+    rm -f "$RING_FIFO"
+    mkfifo "$RING_FIFO"
+    # ffmpeg の終了（FIFO の EOF）で writer も終了する
+    PYTHONPATH="${NVR_BASE_DIR}:${PYTHONPATH:-}" \
+        "${VENV_DIR}/bin/python3" -m core.opencv.frame_ring write "$RING_FILE" \
+        --width 640 --height 360 --format gray < "$RING_FIFO" &
+
+    SNAP_FILTER="split=2[v_img_raw][v_ring_raw];
+        [v_img_raw]fps=${LATEST_FPS}[v_img_out];
+        [v_ring_raw]fps=${RING_FPS}[v_ring_out]"
+    RING_OUTPUT=(
+        -map "[v_ring_out]"
+        -an
+        -f rawvideo
+        -pix_fmt gray
+        -y
+        "$RING_FIFO"
+    )
+    echo "[tapoc113] Raw frame ring: ${RING_FILE} (${RING_FPS}fps)"
+fi
+
 # ---------------------------------------------------------
 # 5. ffmpeg 実行
 # ---------------------------------------------------------
@@ -97,7 +139,7 @@ exec ffmpeg \
         [v_snap]scale_vaapi=w=640:h=360:format=nv12,
                 hwdownload,
                 format=nv12,
-                fps=${LATEST_FPS}[v_img_out]
+                ${SNAP_FILTER}
     " \
     \
     -map "[v_enc_in]" \
@@ -119,5 +161,7 @@ exec ffmpeg \
     -update 1 \
     -atomic_writing 1 \
     -y \
-    "$LATEST"
+    "$LATEST" \
+    \
+    ${RING_OUTPUT[@]+"${RING_OUTPUT[@]}"}
     
\ No newline at end of file
@@ -181,7 +181,9 @@ if [ "$WEB_ONLY" = false ]; then
     backup_if_exists "$ETC_NVR_DIR"
     backup_if_exists "$SYSTEMD_DIR/ffmpeg_nvr@.service"
     backup_if_exists "$SYSTEMD_DIR/motion_detector@.service"
+    backup_if_exists "$SYSTEMD_DIR/motion_engine.service"
     backup_if_exists "$SYSTEMD_DIR/motion_event_handler@.service"
+    backup_if_exists "$SYSTEMD_DIR/nvr_retention.service"
 fi
 
 # ---------------------------------------------------------
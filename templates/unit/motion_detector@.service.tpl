@@ -7,6 +7,7 @@ Group={{NVR_GROUP}}
 UMask=000
 Type=simple
 ExecStart={{NVR_CORE_DIR}}/run_motion_detector.sh %i
+ExecReload=/bin/kill -HUP $MAINPID
 Restart=always
 RestartSec=1
 RuntimeMaxSec=86400
@@ -0,0 +1,19 @@
+[Unit]
+Description=NVR OpenCV Motion Engine (all cameras)
+
+[Service]
+User={{NVR_USER}}
+Group={{NVR_GROUP}}
+UMask=000
+Type=simple
+ExecStart={{NVR_CORE_DIR}}/run_motion_detector.sh --engine
+ExecReload=/bin/kill -HUP $MAINPID
+Restart=always
+RestartSec=1
+RuntimeMaxSec=86400
+KillMode=process
+# 終了時に全カメラの進行中イベントを閉じる（service_thread.join の 5 秒 + 余裕）
+TimeoutStopSec=10
+
+[Install]
+WantedBy=multi-user.target
@@ -0,0 +1,19 @@
+[Unit]
+Description=NVR Recording / Event Retention
+
+[Service]
+User={{NVR_USER}}
+Group={{NVR_GROUP}}
+UMask=000
+Type=simple
+ExecStart={{NVR_CORE_DIR}}/run_retention.sh
+# 削除は録画・検知より後回しにする
+Nice=10
+IOSchedulingClass=idle
+Restart=always
+RestartSec=10
+KillMode=process
+TimeoutStopSec=5
+
+[Install]
+WantedBy=multi-user.target
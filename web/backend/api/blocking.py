@@ -0,0 +1,90 @@
+import time
+import logging
+from typing import Any, Callable, Dict
+
+import anyio
+import anyio.to_thread
+
+from common.config_loader import WEB_THREADS, WEB_CONCURRENCY
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------
+# Blocking work off the event loop
+#   Route handlers are async; every filesystem walk, SQLite query, image
+#   decode or subprocess they need runs in a worker thread through
+#   run_blocking(). Each kind of work has its own CapacityLimiter, so a
+#   burst of slow event listings on the HDD can hold at most
+#   WEB_CONCURRENCY["listing"] threads and never starves snapshots,
+#   FileResponse reads or the other pools.
+# ---------------------------------------------------------
+
+POOLS = ("listing", "files", "media", "jobs", "system")
+
+
+class _Pool:
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limiter = anyio.CapacityLimiter(limit)
+        self.completed = 0
+        self.wait_max = 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self.limiter.statistics()
+        return {
+            "limit": int(self.limiter.total_tokens),
+            "running": stats.borrowed_tokens,
+            "queued": stats.tasks_waiting,
+            "completed": self.completed,
+            "wait_max_sec": round(self.wait_max, 3),
+        }
+
+
+_pools: Dict[str, _Pool] = {}
+
+
+def _pool(name: str) -> _Pool:
+    # Limiters are bound to the running event loop, so they are created lazily
+    pool = _pools.get(name)
+    if pool is None:
+        if name not in POOLS:
+            raise ValueError(f"Unknown pool: {name}")
+        pool = _pools[name] = _Pool(name, max(1, int(WEB_CONCURRENCY[name])))
+    return pool
+
+
+def configure_default_threads():
+    """
+    Bound the default threadpool (sync dependencies, FileResponse reads,
+    run_in_threadpool) to WEB_THREADS. Must run inside the event loop.
+    """
+    anyio.to_thread.current_default_thread_limiter().total_tokens = WEB_THREADS
+
+
+async def run_blocking(fn: Callable[..., Any], *args, pool: str = "files", **kwargs) -> Any:
+    """
+    Run fn(*args, **kwargs) in a worker thread, holding one slot of the
+    named pool for the duration of the call.
+    """
+    p = _pool(pool)
+    queued = time.monotonic()
+
+    def call():
+        p.wait_max = max(p.wait_max, time.monotonic() - queued)
+        return fn(*args, **kwargs)
+
+    try:
+        return await anyio.to_thread.run_sync(call, limiter=p.limiter)
+    finally:
+        p.completed += 1
+
+
+def stats() -> Dict[str, Any]:
+    default = anyio.to_thread.current_default_thread_limiter()
+    return {
+        "default": {
+            "limit": int(default.total_tokens),
+            "running": default.borrowed_tokens,
+        },
+        **{name: _pool(name).stats() for name in POOLS},
+    }
@@ -0,0 +1,142 @@
+import os
+import time
+import logging
+import subprocess
+import threading
+from typing import Any, Dict, List, Optional
+
+from common.config_loader import (
+    MOTION_TMP_BASE, CAMERA_STATUS_CACHE_TTL, CAMERA_STATUS_STALE_FRAME_SEC, CAMERA_STATUS_STALE_SEGMENT_SEC,
+)
+from common.segment_index import get_segment_index
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------
+# Camera service status
+#   The systemd state of every camera unit is read with a single
+#   `systemctl show` call and cached for a few seconds, so listing the
+#   cameras costs at most one fork per TTL instead of one per camera per
+#   request. Alongside the unit state, the age of latest.jpg and of the
+#   newest recording segment tell a running-but-stalled recorder apart
+#   from a healthy one.
+# ---------------------------------------------------------
+
+UNIT_TEMPLATES = {
+    "recorder": "ffmpeg_nvr@{}.service",
+    "detector": "motion_detector@{}.service",
+    "event_handler": "motion_event_handler@{}.service",
+}
+SHOW_PROPERTIES = "Id,LoadState,ActiveState,SubState,NRestarts"
+SYSTEMCTL_TIMEOUT = 5.0
+
+
+def parse_systemctl_show(output: str) -> Dict[str, Dict[str, str]]:
+    """
+    Parse `systemctl show -p ...` output for several units (blocks of
+    KEY=VALUE lines separated by blank lines) into {unit_id: properties}.
+    """
+    units: Dict[str, Dict[str, str]] = {}
+    for block in output.strip().split("\n\n"):
+        props = dict(line.split("=", 1) for line in block.splitlines() if "=" in line)
+        if props.get("Id"):
+            units[props["Id"]] = props
+    return units
+
+
+def _age(mtime: Optional[float], now: float) -> Optional[float]:
+    return round(max(0.0, now - mtime), 1) if mtime is not None else None
+
+
+class CameraStatusProvider:
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._cameras: List[str] = []
+        self._units: Dict[str, Dict[str, str]] = {}
+        self._fetched_at = 0.0
+        self.systemctl_calls = 0
+
+    def _query_units(self, cameras: List[str]) -> Dict[str, Dict[str, str]]:
+        units = [tpl.format(cam) for cam in cameras for tpl in UNIT_TEMPLATES.values()]
+        cmd = ["systemctl", "show", "--no-pager", "-p", SHOW_PROPERTIES, *units]
+        self.systemctl_calls += 1
+        try:
+            result = subprocess.run(cmd, capture_output=True, text=True, timeout=SYSTEMCTL_TIMEOUT)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            logger.warning(f"systemctl show failed: {e}")
+            return {}
+        return parse_systemctl_show(result.stdout)
+
+    def _units_for(self, cameras: List[str]) -> Dict[str, Dict[str, str]]:
+        # 同時に期限切れになったリクエストは 1 回の systemctl を共有する
+        with self._lock:
+            now = time.monotonic()
+            expired = now - self._fetched_at >= self.ttl
+            if expired or not set(cameras) <= set(self._cameras):
+                wanted = sorted(set(cameras) if expired else set(cameras) | set(self._cameras))
+                self._units = self._query_units(wanted)
+                self._cameras = wanted
+                self._fetched_at = now
+            return self._units
+
+    @staticmethod
+    def _liveness(camera: str, now: float) -> Dict[str, Optional[float]]:
+        try:
+            frame_mtime = os.stat(os.path.join(MOTION_TMP_BASE, camera, "latest.jpg")).st_mtime
+        except OSError:
+            frame_mtime = None
+        seg = get_segment_index(camera).latest()
+        return {
+            "frame_age_sec": _age(frame_mtime, now),
+            "segment_age_sec": _age(seg.end.timestamp() if seg and seg.end else None, now),
+        }
+
+    def statuses(self, cameras: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        {camera: status} for the given cameras. `status` is the recorder
+        unit's ActiveState (as `systemctl is-active` reported it); `health`
+        is one of running / stalled / stopped / unknown.
+        """
+        units = self._units_for(cameras)
+        now = time.time()
+        result = {}
+        for cam in cameras:
+            services = {}
+            for role, tpl in UNIT_TEMPLATES.items():
+                props = units.get(tpl.format(cam), {})
+                services[role] = {
+                    "state": props.get("ActiveState", "unknown"),
+                    "sub_state": props.get("SubState", ""),
+                    "restarts": int(props["NRestarts"]) if props.get("NRestarts", "").isdigit() else None,
+                }
+            liveness = self._liveness(cam, now)
+            recorder = services["recorder"]["state"]
+
+            if recorder == "unknown":
+                health = "unknown"
+            elif recorder != "active":
+                health = "stopped"
+            elif (liveness["segment_age_sec"] is None
+                  or liveness["segment_age_sec"] > CAMERA_STATUS_STALE_SEGMENT_SEC
+                  or liveness["frame_age_sec"] is None
+                  or liveness["frame_age_sec"] > CAMERA_STATUS_STALE_FRAME_SEC):
+                health = "stalled"
+            else:
+                health = "running"
+
+            result[cam] = {"status": recorder, "health": health, "services": services, **liveness}
+        return result
+
+    def status(self, camera: str) -> Dict[str, Any]:
+        return self.statuses([camera])[camera]
+
+
+_provider: Optional[CameraStatusProvider] = None
+
+
+def get_camera_status_provider() -> CameraStatusProvider:
+    global _provider
+    if _provider is None:
+        _provider = CameraStatusProvider(CAMERA_STATUS_CACHE_TTL)
+    return _provider
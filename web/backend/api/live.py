@@ -0,0 +1,165 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from typing import Dict, Optional, Set
+
+from common.config_loader import MOTION_TMP_BASE
+from common.fs_watch import FrameWatcher
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------
+# Live MJPEG fan-out
+#   One reader thread per camera waits for latest.jpg to be replaced
+#   (inotify) and hands the same multipart chunk to every connected
+#   client. Each client has a small queue; a client that falls behind
+#   loses its oldest frames instead of slowing down the others.
+# ---------------------------------------------------------
+
+BOUNDARY = "frame"
+# Frames buffered per client before the oldest one is dropped
+CLIENT_QUEUE_SIZE = 2
+# The reader thread stops this long after the last client disconnects
+IDLE_STOP_SEC = 5.0
+# FrameWatcher wait timeout; also bounds how late an idle stop is noticed
+WAIT_TIMEOUT = 1.0
+
+
+def _is_complete_jpeg(data: bytes) -> bool:
+    return len(data) > 4 and data[:2] == b"\xff\xd8" and data[-2:] == b"\xff\xd9"
+
+
+def multipart_chunk(jpeg: bytes) -> bytes:
+    header = (f"--{BOUNDARY}\r\nContent-Type: image/jpeg\r\n"
+              f"Content-Length: {len(jpeg)}\r\n\r\n").encode()
+    return header + jpeg + b"\r\n"
+
+
+class Subscriber:
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.queue: "asyncio.Queue[bytes]" = asyncio.Queue(maxsize=CLIENT_QUEUE_SIZE)
+        self.dropped = 0
+
+    def offer(self, chunk: bytes):
+        # Runs on the subscriber's event loop
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(chunk)
+
+
+class CameraFeed:
+    def __init__(self, camera: str):
+        self.camera = camera
+        self.directory = os.path.join(MOTION_TMP_BASE, camera)
+        self.subscribers: Set[Subscriber] = set()
+        self.latest: Optional[bytes] = None
+        self.frames = 0
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def subscribe(self, sub: Subscriber):
+        with self._lock:
+            self.subscribers.add(sub)
+            if self.latest is not None:
+                sub.offer(self.latest)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=f"live-{self.camera}", daemon=True)
+                self._thread.start()
+
+    def unsubscribe(self, sub: Subscriber):
+        with self._lock:
+            self.subscribers.discard(sub)
+
+    def _read(self) -> Optional[bytes]:
+        try:
+            with open(os.path.join(self.directory, "latest.jpg"), "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        return data if _is_complete_jpeg(data) else None
+
+    def _run(self):
+        watcher = FrameWatcher("latest.jpg")
+        watcher.add(self.camera, self.directory)
+        idle_since = None
+        logger.info(f"Live feed started for {self.camera} ({watcher.mode})")
+        try:
+            while True:
+                ready = watcher.wait(WAIT_TIMEOUT)
+                with self._lock:
+                    if not self.subscribers:
+                        idle_since = idle_since or time.monotonic()
+                        if time.monotonic() - idle_since >= IDLE_STOP_SEC:
+                            self._thread = None
+                            self.latest = None
+                            return
+                        continue
+                    idle_since = None
+                if not ready:
+                    continue
+                data = self._read()
+                if data is None:
+                    continue
+                chunk = multipart_chunk(data)
+                with self._lock:
+                    self.latest = chunk
+                    self.frames += 1
+                    subs = list(self.subscribers)
+                for sub in subs:
+                    sub.loop.call_soon_threadsafe(sub.offer, chunk)
+        finally:
+            watcher.close()
+            logger.info(f"Live feed stopped for {self.camera}")
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "clients": len(self.subscribers),
+                "frames": self.frames,
+                "dropped": sum(s.dropped for s in self.subscribers),
+            }
+
+
+class LiveHub:
+    def __init__(self):
+        self._feeds: Dict[str, CameraFeed] = {}
+        self._lock = threading.Lock()
+
+    def feed(self, camera: str) -> CameraFeed:
+        with self._lock:
+            feed = self._feeds.get(camera)
+            if feed is None:
+                feed = self._feeds[camera] = CameraFeed(camera)
+            return feed
+
+    async def stream(self, camera: str):
+        """
+        Async generator of multipart/x-mixed-replace chunks for one client.
+        """
+        feed = self.feed(camera)
+        sub = Subscriber(asyncio.get_running_loop())
+        feed.subscribe(sub)
+        try:
+            while True:
+                yield await sub.queue.get()
+        finally:
+            feed.unsubscribe(sub)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            feeds = list(self._feeds.values())
+        return {f.camera: f.stats() for f in feeds}
+
+
+_hub: Optional[LiveHub] = None
+
+
+def get_live_hub() -> LiveHub:
+    global _hub
+    if _hub is None:
+        _hub = LiveHub()
+    return _hub
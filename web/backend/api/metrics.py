@@ -0,0 +1,110 @@
+import time
+from typing import Any, Dict
+
+from common.config_loader import METRICS_DIR
+from common.media_jobs import get_job_scheduler
+from common.metrics import get_registry, read_snapshots, render
+
+# ---------------------------------------------------------
+# Prometheus metrics of the Web API
+#   Request latency is recorded by LatencyMiddleware (time to the response
+#   headers, so long-lived streams count only their setup). At scrape time
+#   the job scheduler and thread pool state are copied into the registry,
+#   and the snapshots published by the detector / event handler processes
+#   are merged in.
+# ---------------------------------------------------------
+
+# Requests that matched no route share one label (keeps the series count bounded)
+UNMATCHED_ROUTE = "unmatched"
+
+
+def route_template(scope) -> str:
+    """
+    Path template of the matched route including its router prefix
+    (e.g. /events/{camera}/{year}/{month}/{event_id}/frames). Included
+    routers match the remainder of the path, so the prefix is what is left
+    after removing the route's own part.
+    """
+    route = scope.get("route")
+    path = scope.get("path")
+    if route is None or path is None:
+        return UNMATCHED_ROUTE
+    try:
+        own = route.path_format.format(**scope.get("path_params", {}))
+    except (AttributeError, KeyError, IndexError, ValueError):
+        return route.path
+    prefix = path[:-len(own)] if own and path.endswith(own) else ""
+    return prefix + route.path
+
+
+class LatencyMiddleware:
+    """
+    ASGI middleware observing nvr_api_request_duration_seconds per method
+    and route template, and counting responses per status code.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.registry = get_registry()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        observed = False
+
+        def observe(status: int):
+            labels = {"method": scope["method"], "route": route_template(scope)}
+            self.registry.histogram("nvr_api_request_duration_seconds",
+                                    "Time until the response headers were sent", **labels
+                                    ).observe(time.perf_counter() - start)
+            self.registry.counter("nvr_api_requests_total", "API responses by status code",
+                                  status=status, **labels).inc()
+
+        async def send_wrapper(message):
+            nonlocal observed
+            if message["type"] == "http.response.start" and not observed:
+                observed = True
+                observe(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if not observed:
+                observe(500)
+
+
+def _update_server_metrics(pool_stats: Dict[str, Any]):
+    registry = get_registry()
+
+    jobs: Dict[str, Any] = get_job_scheduler().stats()
+    registry.gauge("nvr_media_jobs_running", "ffmpeg / ffprobe jobs running").set(len(jobs["running"]))
+    registry.gauge("nvr_media_jobs_queued", "ffmpeg / ffprobe jobs waiting for a slot").set(jobs["queue_length"])
+    registry.gauge("nvr_media_jobs_max_concurrent", "ffmpeg / ffprobe slots").set(jobs["max_concurrent"])
+    for kind, count in jobs["completed_by_kind"].items():
+        registry.counter("nvr_media_jobs_completed_total", "ffmpeg / ffprobe jobs finished", kind=kind).set(count)
+    registry.counter("nvr_media_jobs_merged_total",
+                     "Requests that shared the result of an identical job").set(jobs["merged"])
+    registry.counter("nvr_media_jobs_timeouts_total", "Requests that found no free slot in time").set(jobs["timeouts"])
+
+    for pool, stats in pool_stats.items():
+        registry.gauge("nvr_api_pool_running", "Blocking calls running per thread pool", pool=pool
+                       ).set(stats["running"])
+        if "queued" in stats:
+            registry.gauge("nvr_api_pool_queued", "Blocking calls waiting per thread pool", pool=pool
+                           ).set(stats["queued"])
+            registry.counter("nvr_api_pool_completed_total", "Blocking calls finished per thread pool",
+                             pool=pool).set(stats["completed"])
+
+
+def prometheus_text(pool_stats: Dict[str, Any]) -> str:
+    """
+    Metrics of this API process plus every live detector / event handler
+    snapshot, in Prometheus text format. `pool_stats` is blocking.stats(),
+    taken on the event loop; this function reads files, so run it off the loop.
+    """
+    _update_server_metrics(pool_stats)
+    return render([get_registry().snapshot(), *read_snapshots(METRICS_DIR)])
@@ -0,0 +1,160 @@
+import os
+import glob
+import math
+import time
+import hashlib
+import logging
+import threading
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from common import config_loader
+from common.config_loader import MOTION_TMP_BASE
+from common.event_thumbs import decode_for_width
+from common.fs_watch import file_signature
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------
+# Multi-camera mosaic
+#   All enabled cameras' latest.jpg tiled into one reduced-size JPEG.
+#   The ETag is derived from the source files' signatures (mtime, inode,
+#   size), so a poll with an unchanged ETag costs one stat per camera and
+#   a changed one is composed once and shared by every client.
+# ---------------------------------------------------------
+
+# Tile aspect ratio (frames of other shapes are letterboxed)
+TILE_ASPECT = 9 / 16
+# Minimum interval between two compositions of the same layout
+MIN_COMPOSE_INTERVAL = 0.2
+# How long the enabled-camera list is reused before re-reading configs
+CAMERA_LIST_TTL = 5.0
+JPEG_QUALITY = 70
+
+
+@dataclass
+class Mosaic:
+    etag: str
+    data: bytes
+    cameras: List[str]
+    columns: int
+
+
+def _cv2():
+    try:
+        import cv2
+        return cv2
+    except ImportError:
+        return None
+
+
+class MosaicBuilder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cameras: List[str] = []
+        self._cameras_at = 0.0
+        self._cache: dict = {}      # (width, columns) -> (signature, composed_at, Mosaic)
+        self._canvas = {}           # (width, columns, rows) -> reusable ndarray
+
+    def enabled_cameras(self) -> List[str]:
+        now = time.monotonic()
+        if now - self._cameras_at < CAMERA_LIST_TTL:
+            return self._cameras
+        names = []
+        for path in sorted(glob.glob(os.path.join(config_loader.NVR_CONFIG_CAM_DIR, "*.yaml"))):
+            name = os.path.splitext(os.path.basename(path))[0]
+            try:
+                cfg = config_loader.load_camera_config(name)
+            except Exception as e:
+                logger.debug(f"Skipping {name} in mosaic: {e}")
+                continue
+            # setup_nvr.sh・motion_engine と同じく、enabled の指定がなければ起動しないカメラ
+            if cfg.get("enabled", False):
+                names.append(cfg.get("name") or name)
+        self._cameras, self._cameras_at = names, now
+        return names
+
+    @staticmethod
+    def _signature(cameras: List[str]) -> Tuple:
+        return tuple(file_signature(os.path.join(MOTION_TMP_BASE, cam, "latest.jpg")) for cam in cameras)
+
+    @staticmethod
+    def etag_for(cameras: List[str], width: int, columns: int, signature: Tuple) -> str:
+        digest = hashlib.blake2b(repr((cameras, width, columns, signature)).encode(), digest_size=12)
+        return f'"{digest.hexdigest()}"'
+
+    def get(self, width: int, columns: Optional[int] = None) -> Optional[Mosaic]:
+        """
+        Current mosaic, recomposed only if a source frame changed (and at
+        most every MIN_COMPOSE_INTERVAL). None if cv2 is unavailable or
+        there are no enabled cameras.
+        """
+        with self._lock:
+            cameras = self.enabled_cameras()
+            if not cameras:
+                return None
+            columns = max(1, min(columns or math.ceil(math.sqrt(len(cameras))), len(cameras)))
+            key = (width, columns)
+            signature = self._signature(cameras)
+
+            cached = self._cache.get(key)
+            if cached is not None:
+                sig, composed_at, mosaic = cached
+                if mosaic.cameras == cameras and (
+                        sig == signature or time.monotonic() - composed_at < MIN_COMPOSE_INTERVAL):
+                    return mosaic
+
+            data = self._compose(cameras, width, columns)
+            if data is None:
+                return None
+            mosaic = Mosaic(self.etag_for(cameras, width, columns, signature), data, list(cameras), columns)
+            self._cache[key] = (signature, time.monotonic(), mosaic)
+            return mosaic
+
+    def _compose(self, cameras: List[str], width: int, columns: int) -> Optional[bytes]:
+        cv2 = _cv2()
+        if cv2 is None:
+            return None
+        import numpy as np
+
+        tile_h = int(round(width * TILE_ASPECT))
+        rows = math.ceil(len(cameras) / columns)
+        canvas = self._canvas.get((width, columns, rows))
+        if canvas is None:
+            canvas = self._canvas[(width, columns, rows)] = np.zeros((tile_h * rows, width * columns, 3), np.uint8)
+        canvas[:] = 0
+
+        for i, cam in enumerate(cameras):
+            r, c = divmod(i, columns)
+            y0, x0 = r * tile_h, c * width
+            img = None
+            try:
+                with open(os.path.join(MOTION_TMP_BASE, cam, "latest.jpg"), "rb") as f:
+                    img = decode_for_width(cv2, f.read(), width)
+            except OSError:
+                pass
+            if img is not None:
+                # Keep the aspect ratio inside the tile
+                h, w = img.shape[:2]
+                scale = min(width / w, tile_h / h)
+                tw, th = max(1, int(w * scale)), max(1, int(h * scale))
+                ox, oy = x0 + (width - tw) // 2, y0 + (tile_h - th) // 2
+                canvas[oy:oy + th, ox:ox + tw] = cv2.resize(img, (tw, th), interpolation=cv2.INTER_AREA)
+            else:
+                cv2.putText(canvas, "no signal", (x0 + 8, y0 + tile_h // 2), cv2.FONT_HERSHEY_SIMPLEX,
+                            0.5, (90, 90, 90), 1, cv2.LINE_AA)
+            cv2.putText(canvas, cam, (x0 + 6, y0 + 16), cv2.FONT_HERSHEY_SIMPLEX,
+                        0.45, (255, 255, 255), 1, cv2.LINE_AA)
+
+        ok, buf = cv2.imencode(".jpg", canvas, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+        return buf.tobytes() if ok else None
+
+
+_builder: Optional[MosaicBuilder] = None
+
+
+def get_mosaic_builder() -> MosaicBuilder:
+    global _builder
+    if _builder is None:
+        _builder = MosaicBuilder()
+    return _builder
@@ -1,11 +1,15 @@
-from fastapi import APIRouter, Response, UploadFile, File
+from fastapi import APIRouter, Request, Response, UploadFile, File, Query
 from fastapi.responses import FileResponse
 import yaml
+from typing import Optional
 import os
 import glob
 import subprocess
 import shutil
 from common import config_loader
+from api.mosaic import get_mosaic_builder
+from api.camera_status import get_camera_status_provider
+from api.blocking import run_blocking
 
 router = APIRouter()
 
@@ -13,26 +17,10 @@ MAIN_CONFIG = config_loader.load_main_config()
 
 from common.config_loader import MOTION_TMP_BASE, NVR_CONFIG_MASK_DIR
 
-# Helper function moved to config_loader
-def get_camera_status(camera_name: str) -> str:
-    """
-    Check if the camera's ffmpeg service is active.
-    """
-    try:
-        cmd = ["systemctl", "is-active", f"ffmpeg_nvr@{camera_name}.service"]
-        result = subprocess.run(cmd, capture_output=True, text=True)
-        return result.stdout.strip()
-    except Exception:
-        return "unknown"
-
-@router.get("/")
-async def get_cameras():
-    """
-    List all cameras from cameras.yaml files with active status.
-    """
+def _list_cameras():
     cameras = []
     cam_files = glob.glob(os.path.join(config_loader.NVR_CONFIG_CAM_DIR, "*.yaml"))
-    
+
     for f in cam_files:
         try:
             cam_name = os.path.splitext(os.path.basename(f))[0]
@@ -40,26 +28,63 @@ async def get_cameras():
             if data:
                 # Handle both single camera file and multi-camera structure if any
                 # Usually, backend splits them. Let's assume standard format.
-                name = data.get("name")
-                if name:
-                    data["status"] = get_camera_status(name)
+                if data.get("name"):
                     cameras.append(data)
         except Exception as e:
             print(f"Error reading {f}: {e}")
-            
+
+    # One batched, cached systemctl call for all cameras
+    statuses = get_camera_status_provider().statuses([c["name"] for c in cameras])
+    for data in cameras:
+        data.update(statuses[data["name"]])
     return cameras
 
+@router.get("/")
+async def get_cameras():
+    """
+    List all cameras from cameras.yaml files with service status and
+    liveness (health, frame_age_sec, segment_age_sec, per-unit services).
+    """
+    return await run_blocking(_list_cameras, pool="listing")
+
+# Declared before /{camera_name} so "mosaic" is not taken as a camera name
+@router.get("/mosaic")
+async def get_camera_mosaic(request: Request,
+                            width: int = Query(320, ge=80, le=1280),
+                            columns: Optional[int] = Query(None, ge=1, le=8)):
+    """
+    All enabled cameras' latest frames tiled into one JPEG (width = tile width).
+    Poll with If-None-Match: 304 until any camera has a new frame.
+    X-Mosaic-Cameras / X-Mosaic-Columns describe the tile order.
+    """
+    mosaic = await run_blocking(get_mosaic_builder().get, width, columns, pool="media")
+    if mosaic is None:
+        return Response(status_code=404)
+
+    headers = {
+        "ETag": mosaic.etag,
+        "Cache-Control": "no-cache",
+        "X-Mosaic-Cameras": ",".join(mosaic.cameras),
+        "X-Mosaic-Columns": str(mosaic.columns),
+    }
+    if request.headers.get("if-none-match") == mosaic.etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=mosaic.data, media_type="image/jpeg", headers=headers)
+
+def _camera_config_with_status(camera_name: str):
+    data = config_loader.load_camera_config(camera_name)
+    if not data:
+        return {"error": "Camera not found or empty configuration"}
+    data.update(get_camera_status_provider().status(camera_name))
+    return data
+
 @router.get("/{camera_name}")
 async def get_camera_config(camera_name: str):
     """
     Get specific camera configuration including status.
     """
     try:
-        data = config_loader.load_camera_config(camera_name)
-        if not data:
-             return {"error": "Camera not found or empty configuration"}
-        data["status"] = get_camera_status(camera_name)
-        return data
+        return await run_blocking(_camera_config_with_status, camera_name, pool="system")
     except Exception as e:
         return {"error": str(e)}
 
@@ -75,16 +100,11 @@ async def get_camera_latest(camera_name: str):
         
     return FileResponse(img_path, media_type="image/jpeg")
 
-@router.post("/{camera_name}/config")
-async def update_camera_config(camera_name: str, config: dict):
-    """
-    Update specific camera configuration.
-    Note: In a real system, we should validate the schema.
-    """
+def _update_camera_config(camera_name: str, config: dict):
     file_path = os.path.join(config_loader.NVR_CONFIG_CAM_DIR, f"{camera_name}.yaml")
     if not os.path.exists(file_path):
         return {"error": "Camera not found"}
-        
+
     try:
         # NOTE: load_camera_config merges secrets. For editing, we might want to edit only public?
         # But the original code was loading from file_path directly.
@@ -99,28 +119,24 @@ async def update_camera_config(camera_name: str, config: dict):
         if "connection" in config:
             data["connection"] = config["connection"]
 
-        with open(file_path, "w") as stream:
-            yaml.safe_dump(data, stream, default_flow_style=False)
-            
-        # Optional: trigger service restart if needed? 
-        # For motion detector, it needs a restart to pick up new values.
-        # Hardcore way: subprocess.run(["sudo", "systemctl", "restart", f"motion_detector@{camera_name}"])
-        
+        # Atomic replace: detectors and other readers never see a partial file
+        config_loader.write_camera_config(camera_name, data)
+
+        # Running motion detectors pick up the new motion settings (and mask)
+        # within a few seconds without a restart; see CameraRunner.maybe_reload.
         return {"message": "Configuration updated successfully"}
     except Exception as e:
         return {"error": str(e)}
 
-@router.post("/{camera_name}/restart")
-async def restart_camera_services(camera_name: str):
+@router.post("/{camera_name}/config")
+async def update_camera_config(camera_name: str, config: dict):
     """
-    Restart services related to a specific camera.
+    Update specific camera configuration.
+    Note: In a real system, we should validate the schema.
     """
-    services = [
-        f"ffmpeg_nvr@{camera_name}.service",
-        f"motion_detector@{camera_name}.service",
-        f"motion_event_handler@{camera_name}.service"
-    ]
-    
+    return await run_blocking(_update_camera_config, camera_name, config, pool="files")
+
+def _restart_services(services):
     results = {}
     for svc in services:
         try:
@@ -132,9 +148,21 @@ async def restart_camera_services(camera_name: str):
             results[svc] = f"failed: {e.stderr.decode().strip()}"
         except Exception as e:
             results[svc] = f"error: {str(e)}"
-            
+
     return results
 
+@router.post("/{camera_name}/restart")
+async def restart_camera_services(camera_name: str):
+    """
+    Restart services related to a specific camera.
+    """
+    services = [
+        f"ffmpeg_nvr@{camera_name}.service",
+        f"motion_detector@{camera_name}.service",
+        f"motion_event_handler@{camera_name}.service"
+    ]
+    return await run_blocking(_restart_services, services, pool="system")
+
 @router.get("/{camera_name}/mask")
 async def get_camera_mask(camera_name: str):
     """
@@ -153,13 +181,19 @@ async def upload_camera_mask(camera_name: str, file: UploadFile = File(...)):
     Saved to the mask directory.
     """
     mask_dir = NVR_CONFIG_MASK_DIR
-    os.makedirs(mask_dir, exist_ok=True)
-    
     file_path = os.path.join(mask_dir, f"{camera_name}.png")
-    
-    try:
-        with open(file_path, "wb") as buffer:
+
+    def save():
+        os.makedirs(mask_dir, exist_ok=True)
+        # Written next to the target and renamed, so a running detector
+        # reloading the mask never reads a partial PNG
+        tmp_path = f"{file_path}.tmp"
+        with open(tmp_path, "wb") as buffer:
             shutil.copyfileobj(file.file, buffer)
+        os.replace(tmp_path, file_path)
+
+    try:
+        await run_blocking(save, pool="files")
         return {"message": f"Mask uploaded for {camera_name}"}
     except Exception as e:
         return {"error": str(e)}
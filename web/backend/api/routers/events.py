@@ -1,18 +1,21 @@
-from fastapi import APIRouter, Response, Query
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, Request, Response, Query
+from fastapi.responses import FileResponse, JSONResponse
 import os
-import glob
 import shutil
 import json
 import logging
-from typing import List, Optional, Dict, Any
+from typing import List, Literal, Optional, Dict, Any
 from datetime import datetime, timedelta
 import bisect
 import functools
 import subprocess
 
 from common import config_loader
-from common.video_utils import parse_recording_timestamp, get_video_duration
+from common.event_index import get_event_index
+from common.event_thumbs import get_thumb_cache, thumb_frames
+from common.frame_pack import is_packed, list_frames, read_frame
+from common.segment_index import get_segment_index
+from api.blocking import run_blocking
 
 from common.config_loader import EVENTS_DIR_BASE, RECORDS_DIR_BASE
 
@@ -23,225 +26,325 @@ logger = logging.getLogger(__name__)
 
 
 def find_video_for_event(camera: str, event_time: datetime) -> tuple[Optional[str], int]:
-    cam_records_dir = os.path.join(RECORDS_DIR_BASE, camera)
-    
-    if not os.path.exists(cam_records_dir):
-        logger.warning(f"Records dir not found: {cam_records_dir}")
-        return None, 0
-
-    # Get all record files
-    files = sorted(glob.glob(os.path.join(cam_records_dir, "*.mkv")))
-    if not files:
-        logger.warning(f"No recordings found in {cam_records_dir}")
-        return None, 0
-    
-    # Extract timestamps
-    timestamps = []
-    valid_files = []
-    for f in files:
-        ts = parse_recording_timestamp(f)
-        if ts:
-            timestamps.append(ts)
-            valid_files.append(f)
-            
-    if not timestamps:
-        logger.warning(f"No valid timestamps parsed in {cam_records_dir}")
-        return None, 0
-
     # Ensure event_time is naive for comparison if file timestamps are naive
     # Assumption: Filenames are in local time, stored as naive by strptime.
     if event_time.tzinfo is not None:
         event_time = event_time.replace(tzinfo=None)
 
     # Find the latest recording strictly before or equal to event_time
-    # bisect_right returns insertion point after the timestamp.
-    # index-1 is the candidate.
-    idx = bisect.bisect_right(timestamps, event_time)
-    
-    if idx == 0:
-        logger.warning(f"Event time {event_time} is before all recordings. First rec: {timestamps[0]}")
+    # (bisect over the cached per-camera segment index)
+    index = get_segment_index(camera)
+    segment = index.find(event_time)
+
+    if segment is None:
+        first = index.first_start()
+        if first is None:
+            logger.warning(f"No recordings found for {camera}")
+        else:
+            logger.warning(f"Event time {event_time} is before all recordings. First rec: {first}")
         return None, 0 # All recordings are newer than event
-        
-    candidate_idx = idx - 1
-    candidate_file = valid_files[candidate_idx]
-    candidate_ts = timestamps[candidate_idx]
-    
+
     # Calculate offset
-    offset = (event_time - candidate_ts).total_seconds()
+    offset = (event_time - segment.start).total_seconds()
     
     # Check if the event is actually within the file duration (plus some safety margin)
-    # 1. First check wall-clock duration via mtime (fast)
-    try:
-        mtime = os.path.getmtime(candidate_file)
-        file_end_ts_naive = datetime.fromtimestamp(mtime).replace(tzinfo=None)
-        
+    # 1. First check wall-clock duration via mtime (fast, cached for closed segments)
+    if segment.end is not None:
         # Give a small safety margin (e.g. 5 seconds) to account for write delays
-        if event_time > (file_end_ts_naive + timedelta(seconds=5)):
-             logger.warning(f"Event {event_time} is after candidate file wall-clock end {file_end_ts_naive} (gap detected)")
-             return None, 0
-             
-        # 2. Check actual media duration (involves ffprobe)
-        media_duration = get_video_duration(candidate_file)
-        if media_duration > 0:
-            # If offset exceeds media duration, we still allow it if it's within the wall-clock window (mtime).
-            # This handles cases where frames are dropped due to network instability (ESP32-CAM).
-            # stream.py will handle this by forcing the framerate during playback.
-            if offset > media_duration:
-                logger.info(f"Event {event_time} offset {offset} exceeds media duration {media_duration} for {candidate_file}, but is within wall-clock window. Allowing.")
-            
-    except Exception as e:
-        logger.error(f"Error checking file duration for {candidate_file}: {e}")
+        if event_time > (segment.end + timedelta(seconds=5)):
+            logger.warning(f"Event {event_time} is after candidate file wall-clock end {segment.end} (gap detected)")
+            return None, 0
+
+    # 2. Check actual media duration
+    # If offset exceeds media duration, we still allow it if it's within the wall-clock window (mtime).
+    # This handles cases where frames are dropped due to network instability (ESP32-CAM).
+    # stream.py will handle this by forcing the framerate during playback.
+    # The duration comes from the probe cache only; closed segments are probed in the background.
+    media_duration = index.duration(segment)
+    if media_duration and offset > media_duration:
+        logger.info(f"Event {event_time} offset {offset} exceeds media duration {media_duration} for {segment.name}, but is within wall-clock window. Allowing.")
     
-    logger.info(f"Found video {os.path.basename(candidate_file)} for event {event_time} with offset {offset}")
-    return os.path.basename(candidate_file), int(max(0, offset))
+    logger.info(f"Found video {segment.name} for event {event_time} with offset {offset}")
+    return segment.name, int(max(0, offset))
+
+
+def _list_events(camera, date, start_time, end_time, since, until, cursor, limit):
+    # Metadata comes from the event index instead of walking
+    # base_dir/camera/YYYY/MM/event_id/event.json on every request.
+    events_list, next_cursor = get_event_index().query_page(
+        camera=camera,
+        date=date.replace("-", "") if date else None,
+        start_time=start_time.replace(":", "") if start_time else None,
+        end_time=end_time.replace(":", "") if end_time else None,
+        since=since,
+        until=until,
+        cursor=cursor,
+        limit=limit,
+    )
+
+    for meta in events_list:
+        # Calculate Video File and Offset
+        if "timestamp" in meta:
+            try:
+                ts = datetime.fromisoformat(meta["timestamp"])
+                vfile, offset = find_video_for_event(meta["camera"], ts)
+                meta["video_file"] = vfile
+                meta["start_offset"] = offset
+            except Exception:
+                meta["video_file"] = None
+                meta["start_offset"] = 0
 
+    return events_list, next_cursor
+
+def _parse_datetime(value: Optional[str]) -> Optional[float]:
+    # ISO 8601 date or date-time; without an offset it is local time
+    if not value:
+        return None
+    return datetime.fromisoformat(value).timestamp()
 
 @router.get("/")
 async def list_events(
-    camera: Optional[str] = None,
+    response: Response,
+    camera: Optional[List[str]] = Query(None), # repeat for several cameras
     date: Optional[str] = None, # YYYYMMDD or YYYY-MM-DD
     start_time: Optional[str] = None, # HHMMSS or HH:MM:SS
     end_time: Optional[str] = None,   # HHMMSS or HH:MM:SS
-    limit: int = 60
+    since: Optional[str] = None,  # ISO date / date-time, inclusive (any span of days)
+    until: Optional[str] = None,  # ISO date / date-time, exclusive
+    cursor: Optional[str] = None, # X-Next-Cursor of the previous page
+    limit: int = Query(60, ge=1, le=1000),
 ):
-    base_dir = EVENTS_DIR_BASE
-    events_list = []
-    
-    # To optimize, we traverse carefully.
-    # Structure: base_dir/camera/YYYY/MM/event_id/event.json
-    
-    # Filter cameras
-    cameras_to_scan = [camera] if camera else [d for d in os.listdir(base_dir) if os.path.isdir(os.path.join(base_dir, d))]
-    
-    for cam in cameras_to_scan:
-        cam_dir = os.path.join(base_dir, cam)
-        if not os.path.exists(cam_dir):
-            continue
-            
-        # Year
-        years = sorted([y for y in os.listdir(cam_dir) if y.isdigit()], reverse=True)
-        
-        for year in years:
-            year_dir = os.path.join(cam_dir, year)
-            
-            # Month
-            months = sorted([m for m in os.listdir(year_dir) if m.isdigit()], reverse=True)
-            
-            for month in months:
-                month_dir = os.path.join(year_dir, month)
-                
-                # Event IDs (which act as directories)
-                # event_id is like YYYYMMDD_HHMMSS
-                event_ids = sorted([e for e in os.listdir(month_dir) if os.path.isdir(os.path.join(month_dir, e))], reverse=True)
-                
-                for eid in event_ids:
-                    # Check limit
-                    if len(events_list) >= limit:
-                        break
-                        
-                    # Date Filtering (Optimize by skipping based on event_id prefix)
-                    # event_id format: YYYYMMDD_HHMMSS
-                    if len(eid) >= 15:
-                        ev_date_str = eid[:8] # YYYYMMDD
-                        ev_time_str = eid[9:15] # HHMMSS
-                        
-                        if date:
-                            search_date = date.replace("-", "")
-                            if ev_date_str != search_date:
-                                continue
-                                
-                        if start_time and end_time:
-                            st = start_time.replace(":", "")
-                            et = end_time.replace(":", "")
-                            # Basic string compare for HHMMSS works
-                            if not (st <= ev_time_str <= et):
-                                continue
-
-                    # Load event.json
-                    json_path = os.path.join(month_dir, eid, "event.json")
-                    if os.path.exists(json_path):
-                        try:
-                            with open(json_path, "r") as f:
-                                meta = json.load(f)
-                                
-                            # Enrich with derived data
-                            meta["event_id"] = eid
-                            meta["year"] = year
-                            meta["month"] = month
-                            
-                            # Calculate Video File and Offset
-                            if "timestamp" in meta:
-                                try:
-                                    ts = datetime.fromisoformat(meta["timestamp"])
-                                    vfile, offset = find_video_for_event(meta["camera"], ts)
-                                    meta["video_file"] = vfile
-                                    meta["start_offset"] = offset
-                                except Exception:
-                                    meta["video_file"] = None
-                                    meta["start_offset"] = 0
-                            
-                            events_list.append(meta)
-                        except Exception as e:
-                            logger.error(f"Error loading {json_path}: {e}")
-                            
-                if len(events_list) >= limit:
-                    break
-            if len(events_list) >= limit:
-                break
-        if len(events_list) >= limit:
-            break
-            
+    """
+    Events newest first, merged across the given cameras. When more events
+    match, the X-Next-Cursor header holds the cursor of the next page
+    (pass it back with the same filters).
+    """
+    try:
+        since_ts, until_ts = _parse_datetime(since), _parse_datetime(until)
+    except ValueError:
+        return JSONResponse({"error": "since / until must be ISO 8601 dates or date-times"}, status_code=400)
+    try:
+        events_list, next_cursor = await run_blocking(
+            _list_events, camera, date, start_time, end_time, since_ts, until_ts, cursor, limit, pool="listing")
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return events_list
 
-@router.delete("/{camera}/{year}/{month}/{event_id}")
-async def delete_event(camera: str, year: str, month: str, event_id: str):
-    base_dir = EVENTS_DIR_BASE
-    event_dir = os.path.join(base_dir, camera, year, month, event_id)
+# Activity timeline (/events/timeline): bucket lengths; "day" buckets follow
+# local midnights, so they are 23 / 25 hours long on DST changes.
+TIMELINE_BUCKET_SEC = {"minute": 60, "hour": 3600}
+# A week of minutes per camera at most
+MAX_TIMELINE_BUCKETS = 7 * 24 * 60
+
+def _timeline(camera: Optional[str], first_day: datetime, days: int, resolution: str):
+    start = first_day.timestamp()
+    end = (first_day + timedelta(days=days)).timestamp()
+    if resolution == "day":
+        edges = [(first_day + timedelta(days=i)).timestamp() for i in range(days)]
+    else:
+        edges = list(range(int(start), int(end), TIMELINE_BUCKET_SEC[resolution]))
+    if len(edges) > MAX_TIMELINE_BUCKETS:
+        return None
+
+    cameras: Dict[str, Dict[str, list]] = {}
+    if camera:
+        cameras[camera] = {"events": [0] * len(edges), "motion_sec": [0.0] * len(edges)}
+    for row in get_event_index().activity(start, end, camera):
+        series = cameras.get(row["camera"])
+        if series is None:
+            series = cameras[row["camera"]] = {"events": [0] * len(edges), "motion_sec": [0.0] * len(edges)}
+        i = bisect.bisect_right(edges, row["minute"]) - 1
+        series["events"][i] += row["events"]
+        series["motion_sec"][i] += row["motion_sec"]
+
+    for series in cameras.values():
+        series["motion_sec"] = [round(v) for v in series["motion_sec"]]
+    return {
+        "start": first_day.astimezone().isoformat(timespec="seconds"),
+        "days": days,
+        "resolution": resolution,
+        "bucket_sec": TIMELINE_BUCKET_SEC.get(resolution),
+        "buckets": len(edges),
+        "cameras": dict(sorted(cameras.items())),
+    }
+
+@router.get("/timeline")
+async def get_timeline(
+    camera: Optional[str] = None,
+    date: Optional[str] = Query(None, pattern=r"^\d{4}-?\d{2}-?\d{2}$"), # first day, YYYYMMDD or YYYY-MM-DD
+    days: int = Query(1, ge=1, le=31),
+    month: Optional[str] = Query(None, pattern=r"^\d{4}-?\d{2}$"),    # YYYYMM or YYYY-MM (instead of date / days)
+    resolution: Optional[Literal["minute", "hour", "day"]] = None,
+):
+    """
+    Event counts and motion seconds per time bucket and camera from the
+    precomputed activity aggregates (no event is read). Defaults to today;
+    resolution defaults to minute for one day, hour for up to a week and
+    day beyond that.
+    """
+    try:
+        if month:
+            first_day = datetime.strptime(month.replace("-", ""), "%Y%m")
+            next_month = (first_day + timedelta(days=32)).replace(day=1)
+            days = (next_month - first_day).days
+        elif date:
+            first_day = datetime.strptime(date.replace("-", ""), "%Y%m%d")
+        else:
+            first_day = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    except ValueError:
+        return JSONResponse({"error": "invalid date"}, status_code=400)
+    if resolution is None:
+        resolution = "minute" if days == 1 else "hour" if days <= 7 else "day"
+
+    result = await run_blocking(_timeline, camera, first_day, days, resolution, pool="listing")
+    if result is None:
+        return JSONResponse({"error": f"more than {MAX_TIMELINE_BUCKETS} buckets, use a coarser resolution"},
+                            status_code=400)
+    return result
+
+def _delete_event(camera: str, year: str, month: str, event_id: str):
+    index = get_event_index()
+    meta = index.get(camera, event_id)
+    if meta:
+        year, month = meta["year"], meta["month"]
+
+    event_dir = os.path.join(EVENTS_DIR_BASE, camera, year, month, event_id)
     
     if os.path.exists(event_dir):
         try:
             shutil.rmtree(event_dir)
+            index.delete(camera, event_id)
+            get_thumb_cache().forget(camera, event_id)
             return {"message": f"Event {event_id} deleted"}
         except Exception as e:
             return {"error": str(e)}
+
+    # Drop stale index entries whose directory is already gone
+    if meta:
+        index.delete(camera, event_id)
     return Response(status_code=404)
 
+@router.delete("/{camera}/{year}/{month}/{event_id}")
+async def delete_event(camera: str, year: str, month: str, event_id: str):
+    return await run_blocking(_delete_event, camera, year, month, event_id, pool="files")
+
 @router.get("/{camera}/{year}/{month}/{event_id}/frames")
 async def list_event_frames(camera: str, year: str, month: str, event_id: str):
     base_dir = EVENTS_DIR_BASE
     event_dir = os.path.join(base_dir, camera, year, month, event_id)
-    
-    if not os.path.exists(event_dir):
-        return []
-        
-    # List .jpg files
-    frames = sorted([f for f in os.listdir(event_dir) if f.lower().endswith(".jpg")])
-    return frames
+
+    # List .jpg files (loose files or the frames.pack index); [] if the event is gone
+    def frames():
+        return list_frames(event_dir) if os.path.exists(event_dir) else []
+
+    return await run_blocking(frames, pool="listing")
+
+def _file_response(request: Request, path: str, stat_result: os.stat_result,
+                   media_type: str, headers: Optional[Dict[str, str]] = None) -> Response:
+    """
+    FileResponse with ETag / Last-Modified, or 304 if the client's
+    If-None-Match still matches.
+    """
+    response = FileResponse(path, media_type=media_type, headers=headers, stat_result=stat_result)
+    if request.headers.get("if-none-match") == response.headers["etag"]:
+        validators = {k: response.headers[k] for k in ("etag", "last-modified", "cache-control")
+                      if k in response.headers}
+        return Response(status_code=304, headers=validators)
+    return response
+
+# A finished event's thumbnail never changes. While the event is still
+# recording the thumbnail is re-rendered at the end, and a contact sheet
+# grows, so those are always revalidated.
+THUMB_CACHE_CONTROL = "private, max-age=86400"
 
 @router.get("/{camera}/{year}/{month}/{event_id}/thumbnail")
-async def get_event_thumbnail(camera: str, year: str, month: str, event_id: str):
+async def get_event_thumbnail(request: Request, camera: str, year: str, month: str, event_id: str,
+                              width: Optional[int] = Query(None, ge=32, le=1920)):
     base_dir = EVENTS_DIR_BASE
     event_dir = os.path.join(base_dir, camera, year, month, event_id)
-    
-    # Try 0002.jpg first (as 0001 is often pre-motion), then 0001.jpg, then any available jpg
-    thumb_path = os.path.join(event_dir, "0002.jpg")
-    if not os.path.exists(thumb_path):
-        thumb_path = os.path.join(event_dir, "0001.jpg")
-        if not os.path.exists(thumb_path):
-            frames = sorted(glob.glob(os.path.join(event_dir, "*.jpg")))
-            if frames:
-                thumb_path = frames[0]
-            else:
-                return Response(status_code=404)
-            
-    return FileResponse(thumb_path, media_type="image/jpeg")
+
+    # Small pre-rendered (or lazily rendered) thumbnail from the disk cache
+    cache = get_thumb_cache()
+
+    def render():
+        meta = get_event_index().get(camera, event_id)
+        finished = bool(meta and meta.get("timestamp_end"))
+        thumb_path = cache.thumbnail(event_dir, width)
+        return thumb_path, (os.stat(thumb_path) if thumb_path else None), finished
+
+    try:
+        thumb_path, st, finished = await run_blocking(render, pool="media")
+    except Exception as e:
+        logger.error(f"Failed to render thumbnail for {event_id}: {e}")
+        thumb_path = None
+    if thumb_path:
+        return _file_response(request, thumb_path, st, cache.media_type, headers={
+            "Cache-Control": THUMB_CACHE_CONTROL if finished else "no-cache",
+        })
+
+    # Fallback (no cv2): the trigger frame from event.json (earlier frames are
+    # pre-roll), then the legacy 0002.jpg / 0001.jpg, then any available jpg
+    def original_frame():
+        for name in thumb_frames(event_dir):
+            data = read_frame(event_dir, name)
+            if data is not None:
+                return data
+        frames = list_frames(event_dir)
+        return read_frame(event_dir, frames[0]) if frames else None
+
+    data = await run_blocking(original_frame, pool="files")
+    if data is None:
+        return Response(status_code=404)
+    return Response(content=data, media_type="image/jpeg")
+
+@router.get("/{camera}/{year}/{month}/{event_id}/sheet")
+async def get_event_contact_sheet(camera: str, year: str, month: str, event_id: str,
+                                  columns: Optional[int] = Query(None, ge=1, le=50),
+                                  width: Optional[int] = Query(None, ge=32, le=640)):
+    """
+    All frames of the event tiled into one image (row-major, in the order of
+    /frames), so the frame strip needs a single request.
+    """
+    base_dir = EVENTS_DIR_BASE
+    event_dir = os.path.join(base_dir, camera, year, month, event_id)
+
+    cache = get_thumb_cache()
+    try:
+        sheet = await run_blocking(cache.contact_sheet, event_dir, columns, width, pool="media")
+    except Exception as e:
+        logger.error(f"Failed to render contact sheet for {event_id}: {e}")
+        sheet = None
+    if sheet is None:
+        return Response(status_code=404)
+
+    sheet_path, frames, columns = sheet
+    return FileResponse(sheet_path, media_type=cache.media_type, headers={
+        "Cache-Control": "no-cache",
+        "X-Sheet-Frames": str(frames),
+        "X-Sheet-Columns": str(columns),
+    })
 
 @router.get("/{camera}/{year}/{month}/{event_id}/frame/{frame}")
-async def get_event_frame(camera: str, year: str, month: str, event_id: str, frame: str):
+async def get_event_frame(request: Request, camera: str, year: str, month: str, event_id: str, frame: str):
     base_dir = EVENTS_DIR_BASE
-    frame_path = os.path.join(base_dir, camera, year, month, event_id, frame)
-    
-    if not os.path.exists(frame_path):
+    event_dir = os.path.join(base_dir, camera, year, month, event_id)
+
+    # Loose frames are sent as files (ETag / Last-Modified, 304, streamed);
+    # packed events are served with a single pread of the frame's range
+    def locate():
+        if is_packed(event_dir):
+            return None, None, read_frame(event_dir, frame)
+        frame_path = os.path.join(event_dir, os.path.basename(frame))
+        if not os.path.isfile(frame_path):
+            return None, None, None
+        return frame_path, os.stat(frame_path), None
+
+    frame_path, st, data = await run_blocking(locate, pool="files")
+    if frame_path is not None:
+        return _file_response(request, frame_path, st, "image/jpeg")
+    if data is None:
         return Response(status_code=404)
-            
-    return FileResponse(frame_path, media_type="image/jpeg")
+
+    return Response(content=data, media_type="image/jpeg")
@@ -1,32 +1,111 @@
 from fastapi import APIRouter, Response
-from fastapi.responses import StreamingResponse
+from fastapi.responses import FileResponse, StreamingResponse
 from typing import Any
 import subprocess
 import os
 import logging
 from common import config_loader
+from common.media_jobs import INTERACTIVE, Job, JobQueueTimeout, get_job_scheduler
+from common.remux_cache import get_remux_cache
+from common.segment_index import get_segment_index
+from api.live import BOUNDARY, get_live_hub
+from api.blocking import run_blocking
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
-from common.config_loader import RECORDS_DIR_BASE, NVR_CONFIG_DIR, load_camera_config
+from common.config_loader import RECORDS_DIR_BASE, NVR_CONFIG_DIR, MEDIA_JOBS_QUEUE_TIMEOUT, load_camera_config
 
 # Removed redundant get_records_dir_base and helper functions
 
+
+class JobStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse that holds a media job slot for as long as the
+    response is being sent (including when the client disconnects early).
+    """
+    def __init__(self, content: Any, job: Job, **kwargs):
+        super().__init__(content, **kwargs)
+        self.job = job
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            get_job_scheduler().release(self.job)
+
 @router.get("/live/{camera_name}")
 async def stream_live(camera_name: str):
-    return {"message": "Live streaming via HLS/DASH planned for future development. Use Dashboard for low-fps preview."}
+    """
+    Live view as multipart/x-mixed-replace MJPEG (usable directly as <img src>).
+    All clients of a camera share one reader of latest.jpg.
+    """
+    if not os.path.exists(os.path.join(config_loader.NVR_CONFIG_CAM_DIR, f"{camera_name}.yaml")):
+        return Response(status_code=404)
+
+    return StreamingResponse(
+        get_live_hub().stream(camera_name),
+        media_type=f"multipart/x-mixed-replace; boundary={BOUNDARY}",
+        headers={
+            "Cache-Control": "no-cache, no-store",
+            # Nginx must pass frames through as they arrive
+            "X-Accel-Buffering": "no",
+        },
+    )
+
+@router.get("/live")
+async def live_stats():
+    """
+    Connected live clients, frames broadcast and frames dropped per camera.
+    """
+    return get_live_hub().stats()
 
 @router.get("/playback/{camera_name}/{filename}")
 async def stream_recording(camera_name: str, filename: str, ss: float = 0):
     """
-    Stream a specific MKV file as MP4 (fragmented) on the fly.
+    Serve a recording as MP4.
+
+    Closed segments are remuxed once into the remux cache and served as a
+    plain file with byte-range support; the player seeks with a #t= media
+    fragment and `ss` is not needed. The segment still being written is
+    streamed as fragmented MP4 on the fly, starting at `ss` with its
+    timestamps shifted so that player time matches the segment offset.
     """
     file_path = os.path.join(RECORDS_DIR_BASE, camera_name, filename)
-    
-    if not os.path.exists(file_path):
+
+    def lookup():
+        if not os.path.exists(file_path):
+            return False, False, None
+        segment = get_segment_index(camera_name).get(filename)
+        if segment is None or not segment.closed:
+            return True, False, None
+        return True, True, get_remux_cache().get(camera_name, file_path)
+
+    def prepare():
+        # Live pipes hold slots for as long as they play: give up after
+        # the queue timeout instead of waiting behind them indefinitely
+        cache = get_remux_cache()
+        if cache.can_copy(file_path, timeout=MEDIA_JOBS_QUEUE_TIMEOUT):
+            # Stream copy takes well under a second; wait for it
+            return cache.remux(camera_name, file_path, timeout=MEDIA_JOBS_QUEUE_TIMEOUT)
+        # Needs a transcode: build it in the background, stream this time
+        cache.submit(camera_name, file_path)
+        return None
+
+    exists, closed, cached = await run_blocking(lookup, pool="media")
+    if exists and closed and cached is None:
+        # Waiting for an ffmpeg slot must not tie up the media pool
+        # (thumbnails, contact sheets, mosaic)
+        try:
+            cached = await run_blocking(prepare, pool="jobs")
+        except JobQueueTimeout as e:
+            logger.warning(str(e))
+            return Response(status_code=503, headers={"Retry-After": "5"})
+    if not exists:
         logger.warning(f"File not found: {file_path}")
         return Response(status_code=404)
+    if cached:
+        return FileResponse(cached, media_type="video/mp4")
 
     # Load camera config to check type
     camera_config_path = os.path.join(NVR_CONFIG_DIR, "cameras", f"{camera_name}.yaml")
@@ -47,6 +126,7 @@ async def stream_recording(camera_name: str, filename: str, ss: float = 0):
     if is_esp32cam:
         # User requested seeking functionality but with a small margin (start early).
         # We apply -ss if offset is meaningful.
+        effective_ss = 0
         if ss > 0:
             # Shift back by 5 seconds for safety, but not before the start of the file.
             effective_ss = max(0, ss - 5)
@@ -54,16 +134,30 @@ async def stream_recording(camera_name: str, filename: str, ss: float = 0):
             
         ffmpeg_cmd.extend(["-i", file_path, "-c:v", "copy"])
     else:
+        effective_ss = ss
         if ss > 0:
             ffmpeg_cmd.extend(["-ss", str(ss)])
         ffmpeg_cmd.extend(["-i", file_path, "-c:v", "libx264", "-preset", "ultrafast", "-tune", "zerolatency"])
 
+    # Keep the segment's own timeline so the player's #t= fragment lines up
+    if effective_ss > 0:
+        ffmpeg_cmd.extend(["-output_ts_offset", str(effective_ss)])
+
     ffmpeg_cmd.extend([
         "-an", # Drop audio for now
         "-movflags", "frag_keyframe+empty_moov+default_base_moof",
         "-f", "mp4",
         "pipe:1"
     ])
+
+    # Every live pipe counts against the ffmpeg concurrency limit
+    scheduler = get_job_scheduler()
+    try:
+        job = await run_blocking(scheduler.acquire, "ffmpeg-stream", f"{camera_name}/{filename}",
+                                 INTERACTIVE, MEDIA_JOBS_QUEUE_TIMEOUT, pool="jobs")
+    except JobQueueTimeout as e:
+        logger.warning(str(e))
+        return Response(status_code=503, headers={"Retry-After": "5"})
     
     async def iter_file():
         import asyncio
@@ -91,11 +185,13 @@ async def stream_recording(camera_name: str, filename: str, ss: float = 0):
                     pass
             logger.debug(f"FFmpeg process {process.pid} cleaned up.")
 
-    return StreamingResponse(
-        iter_file(), 
+    return JobStreamingResponse(
+        iter_file(),
+        job,
         media_type="video/mp4",
         headers={
-            "Accept-Ranges": "bytes",
+            # A live pipe cannot serve byte ranges
+            "Accept-Ranges": "none",
             "Content-Type": "video/mp4"
         }
     )
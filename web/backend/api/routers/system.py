@@ -1,15 +1,24 @@
 from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
 import shutil
 import subprocess
 import os
+import json
 import logging
 from typing import Any
 from common import config_loader
+from common.media_jobs import get_job_scheduler
+from api import blocking
+from api.blocking import run_blocking
+from api.metrics import prometheus_text
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
-from common.config_loader import RECORDS_DIR_BASE
+from common.config_loader import RECORDS_DIR_BASE, MOTION_TMP_BASE
+
+# Written by core/retention.py after every deletion batch
+RETENTION_STATE_FILE = os.path.join(MOTION_TMP_BASE, "retention.json")
 
 # Removed local get_config_value
 
@@ -22,7 +31,7 @@ async def get_system_status():
     storage_path = RECORDS_DIR_BASE
 
     try:
-        total, used, free = shutil.disk_usage(storage_path)
+        total, used, free = await run_blocking(shutil.disk_usage, storage_path, pool="system")
     except Exception as e:
         # Fallback if path doesn't exist
         logger.error(f"Failed to check disk usage for {storage_path}: {e}")
@@ -42,5 +51,42 @@ async def get_system_status():
 
     return {
         "disk": disk_info,
-        "services": services
+        "services": services,
+        "retention": await run_blocking(_read_retention_state, pool="files"),
     }
+
+def _read_retention_state():
+    """
+    Per-camera usage and recent deletions from the retention service
+    (None if it has not run).
+    """
+    try:
+        with open(RETENTION_STATE_FILE, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+@router.get("/jobs")
+async def get_media_jobs():
+    """
+    ffmpeg / ffprobe job scheduler state: running and queued jobs,
+    queue length and wait times.
+    """
+    return get_job_scheduler().stats()
+
+@router.get("/threads")
+async def get_thread_pools():
+    """
+    Worker thread pools for blocking work: limit, running and queued
+    calls per pool (see api/blocking.py).
+    """
+    return blocking.stats()
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """
+    Prometheus metrics: detector stage timings and frame counts, event
+    handler lag, API latency, ffmpeg jobs and thread pools.
+    """
+    text = await run_blocking(prometheus_text, blocking.stats(), pool="files")
+    return PlainTextResponse(text, media_type="text/plain; version=0.0.4")
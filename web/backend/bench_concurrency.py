@@ -0,0 +1,116 @@
+"""
+Snapshot latency under heavy API load.
+
+Measures GET /cameras/<cam>/latest latency on its own, then again while
+--heavy clients keep hammering slow listing endpoints (event list, event
+frames, camera list). With blocking work off the event loop the two
+distributions should be close.
+
+    python3 bench_concurrency.py --base http://127.0.0.1:8000 --camera frontdoor
+    python3 bench_concurrency.py --base http://nvr.local/nvr/api --heavy 16 --duration 20
+"""
+import time
+import json
+import argparse
+import threading
+import statistics
+import urllib.request
+from typing import List, Optional
+
+
+def fetch(url: str, timeout: float = 30.0) -> bytes:
+    with urllib.request.urlopen(url, timeout=timeout) as res:
+        return res.read()
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, int(round(pct / 100 * (len(ordered) - 1)))))
+    return ordered[idx]
+
+
+def summarize(label: str, samples: List[float], errors: int):
+    if not samples:
+        print(f"{label:<12} no successful requests ({errors} errors)")
+        return
+    ms = [s * 1000 for s in samples]
+    print(f"{label:<12} n={len(ms):<5} p50={statistics.median(ms):7.1f}ms "
+          f"p95={percentile(ms, 95):7.1f}ms p99={percentile(ms, 99):7.1f}ms "
+          f"max={max(ms):7.1f}ms errors={errors}")
+
+
+def measure_snapshots(url: str, duration: float, interval: float):
+    samples, errors = [], 0
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        t0 = time.perf_counter()
+        try:
+            fetch(url)
+            samples.append(time.perf_counter() - t0)
+        except Exception:
+            errors += 1
+        time.sleep(interval)
+    return samples, errors
+
+
+def heavy_urls(base: str, camera: str, limit: int) -> List[str]:
+    urls = [f"{base}/events/?limit={limit}", f"{base}/cameras/"]
+    try:
+        events = json.loads(fetch(f"{base}/events/?camera={camera}&limit=20"))
+    except Exception:
+        events = []
+    for ev in events:
+        if all(k in ev for k in ("year", "month", "event_id")):
+            urls.append(f"{base}/events/{ev['camera']}/{ev['year']}/{ev['month']}/{ev['event_id']}/frames")
+    return urls
+
+
+def heavy_client(urls: List[str], stop: threading.Event, counter: List[int], offset: int):
+    i = offset
+    while not stop.is_set():
+        try:
+            fetch(urls[i % len(urls)])
+            counter[0] += 1
+        except Exception:
+            counter[1] += 1
+        i += 1
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Snapshot latency with and without heavy listing load")
+    parser.add_argument("--base", default="http://127.0.0.1:8000", help="API base URL")
+    parser.add_argument("--camera", default="frontdoor")
+    parser.add_argument("--heavy", type=int, default=8, help="concurrent heavy clients")
+    parser.add_argument("--limit", type=int, default=500, help="event list size for heavy requests")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per phase")
+    parser.add_argument("--interval", type=float, default=0.05, help="pause between snapshot requests")
+    args = parser.parse_args(argv)
+
+    base = args.base.rstrip("/")
+    snapshot_url = f"{base}/cameras/{args.camera}/latest"
+    fetch(snapshot_url)  # warm-up; fails early if the server is not reachable
+
+    print(f"Phase 1: snapshots only ({args.duration:.0f}s)")
+    idle = measure_snapshots(snapshot_url, args.duration, args.interval)
+
+    urls = heavy_urls(base, args.camera, args.limit)
+    print(f"Phase 2: snapshots with {args.heavy} heavy clients over {len(urls)} URLs ({args.duration:.0f}s)")
+    stop = threading.Event()
+    counter = [0, 0]
+    threads = [threading.Thread(target=heavy_client, args=(urls, stop, counter, i), daemon=True)
+               for i in range(args.heavy)]
+    for t in threads:
+        t.start()
+    loaded = measure_snapshots(snapshot_url, args.duration, args.interval)
+    stop.set()
+    for t in threads:
+        t.join(timeout=30)
+
+    print()
+    summarize("idle", *idle)
+    summarize("under load", *loaded)
+    print(f"heavy requests completed: {counter[0]} ({counter[0] / args.duration:.1f}/s), errors: {counter[1]}")
+
+
+if __name__ == "__main__":
+    main()
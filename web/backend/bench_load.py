@@ -0,0 +1,418 @@
+"""
+API latency as the amount of stored data grows.
+
+  generate  build a synthetic NVR tree under --root: config (install_paths,
+            main.yaml, camera YAMLs), months of events with frames and
+            event.json, continuous stub MKV segments with their durations
+            already in the probe cache, and latest.jpg per camera
+  run       load the FastAPI app in-process against that tree (through
+            NVR_INSTALL_PATHS, ffprobe stubbed) and drive it with
+            concurrent clients; reports throughput and p50/p99 per route
+  sweep     generate trees of increasing size and run the load on each in
+            a fresh process
+
+    python3 bench_load.py sweep --root /var/tmp/nvr-synth --days 1,7,30,90 --cameras 4
+    python3 bench_load.py generate --root /var/tmp/nvr-synth/big --cameras 8 --days 60
+    python3 bench_load.py run --root /var/tmp/nvr-synth/big --clients 16 --duration 20
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import statistics
+import subprocess
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+import yaml
+
+REPO_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+if REPO_DIR not in sys.path:
+    sys.path.insert(0, REPO_DIR)
+
+SEGMENT_SEC = 300
+# Stub segments are sparse files of this size (no disk space is used)
+SEGMENT_BYTES = 60 * 2**20
+# Share of segments missing (camera or network outages)
+SEGMENT_GAP_RATIO = 0.005
+
+# Weighted request mix of the web UI
+ROUTES = {
+    "cameras": 1,           # GET /cameras/
+    "events_latest": 3,     # GET /events/ (dashboard, all cameras)
+    "events_day": 3,        # GET /events/?camera=&date=
+    "events_window": 2,     # GET /events/?camera=&date=&start_time=&end_time=
+    "event_frames": 2,      # GET /events/<cam>/<y>/<m>/<id>/frames
+    "snapshot": 1,          # GET /cameras/<cam>/latest (control: independent of data size)
+}
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, int(round(pct / 100 * (len(ordered) - 1)))))
+    return ordered[idx]
+
+
+def _tiny_jpeg() -> bytes:
+    import cv2
+    import numpy as np
+    img = np.full((180, 320, 3), 90, np.uint8)
+    cv2.putText(img, "bench", (60, 100), cv2.FONT_HERSHEY_SIMPLEX, 1.5, (255, 255, 255), 2)
+    return cv2.imencode(".jpg", img)[1].tobytes()
+
+
+# ---------------------------------------------------------
+# Synthetic storage tree
+# ---------------------------------------------------------
+def write_config(root: str, cameras: List[str]):
+    etc = os.path.join(root, "etc")
+    for d in ("cameras", "masks", "secrets/cameras"):
+        os.makedirs(os.path.join(etc, d), exist_ok=True)
+
+    with open(os.path.join(REPO_DIR, "config", "main.yaml"), "r") as f:
+        main_cfg = yaml.safe_load(f)
+    common = main_cfg["common"]
+    common["records_dir_base"] = os.path.join(root, "records")
+    common["events_dir_base"] = os.path.join(root, "events")
+    common["motion_tmp_base"] = os.path.join(root, "shm")
+    common.setdefault("retention", {})["enabled"] = False
+    with open(os.path.join(etc, "main.yaml"), "w") as f:
+        yaml.safe_dump(main_cfg, f, allow_unicode=True)
+
+    with open(os.path.join(REPO_DIR, "config", "cameras", "frontdoor.yaml"), "r") as f:
+        cam_template = yaml.safe_load(f)
+    for cam in cameras:
+        with open(os.path.join(etc, "cameras", f"{cam}.yaml"), "w") as f:
+            yaml.safe_dump({**cam_template, "name": cam, "display_name": cam}, f, allow_unicode=True)
+
+    paths = {
+        "user": os.environ.get("USER", "nvr"),
+        "group": os.environ.get("USER", "nvr"),
+        "base_dir": REPO_DIR,
+        "core_dir": os.path.join(REPO_DIR, "core"),
+        "common_dir": os.path.join(REPO_DIR, "common"),
+        "lib_dir": os.path.join(root, "lib"),
+        "config_main_file": os.path.join(etc, "main.yaml"),
+        "config_main_secret_file": os.path.join(etc, "secrets", "main.yaml"),
+        "config_cam_dir": os.path.join(etc, "cameras"),
+        "config_cam_secret_dir": os.path.join(etc, "secrets", "cameras"),
+        "config_mask_dir": os.path.join(etc, "masks"),
+    }
+    with open(os.path.join(etc, "install_paths"), "w") as f:
+        yaml.safe_dump(paths, f)
+
+
+def write_records(root: str, cam: str, start: datetime, end: datetime, rng: random.Random) -> int:
+    """
+    Continuous SEGMENT_SEC segments (YYYYMMDD_HHMMSS.mkv, mtime = wall-clock
+    end) with their durations seeded into the probe cache, as the
+    background prober leaves them in production.
+    """
+    from common.video_utils import MediaCache
+
+    cam_dir = os.path.join(root, "records", cam)
+    os.makedirs(cam_dir, exist_ok=True)
+    cache = MediaCache(os.path.join(root, "records", "media_cache.sqlite3"))
+    conn = cache._connect()
+    conn.execute("BEGIN")
+    count = 0
+    t = start
+    while t < end:
+        if rng.random() >= SEGMENT_GAP_RATIO:
+            path = os.path.join(cam_dir, t.strftime("%Y%m%d_%H%M%S") + ".mkv")
+            with open(path, "wb") as f:
+                f.truncate(SEGMENT_BYTES)
+            seg_end = (t + timedelta(seconds=SEGMENT_SEC)).timestamp()
+            os.utime(path, (seg_end, seg_end))
+            st = os.stat(path)
+            meta = {"duration": SEGMENT_SEC - rng.uniform(0, 2), "codec": "h264", "width": 1280, "height": 720}
+            cache.put(path, meta, (st.st_size, st.st_mtime_ns))
+            count += 1
+        t += timedelta(seconds=SEGMENT_SEC)
+    conn.execute("COMMIT")
+    return count
+
+
+def write_events(root: str, cam: str, start: datetime, days: int, per_day: int, frames: int,
+                 jpeg: bytes, rng: random.Random) -> int:
+    """
+    Events spread over each day (busier in daytime), with loose JPEG
+    frames and an event.json in the event handler's format.
+    """
+    count = 0
+    for day in range(days):
+        day_start = start + timedelta(days=day)
+        n = max(0, int(rng.gauss(per_day, per_day ** 0.5)))
+        seconds = sorted(int(rng.triangular(0, 86400, 50400)) for _ in range(n))
+        seen = set()
+        for sec in seconds:
+            ts = (day_start + timedelta(seconds=sec)).astimezone()
+            event_id = ts.strftime("%Y%m%d_%H%M%S")
+            if event_id in seen:
+                continue
+            seen.add(event_id)
+            duration = rng.randint(3, 60)
+            event_dir = os.path.join(root, "events", cam, ts.strftime("%Y"), ts.strftime("%m"), event_id)
+            os.makedirs(event_dir, exist_ok=True)
+            names = [f"{i:04d}.jpg" for i in range(1, frames + 1)]
+            for name in names:
+                with open(os.path.join(event_dir, name), "wb") as f:
+                    f.write(jpeg)
+            meta = {
+                "timestamp": ts.isoformat(timespec="seconds"),
+                "timestamp_end": (ts + timedelta(seconds=duration)).isoformat(timespec="seconds"),
+                "duration_sec": duration,
+                "camera": cam,
+                "event_timeout": 10,
+                "daynight": "day" if 6 <= ts.hour < 18 else "night",
+                "brightness_min": None,
+                "brightness_max": None,
+                "jpeg_count": len(names),
+                "first_frame": names[0] if names else None,
+                "last_frame": names[-1] if names else None,
+                "total_size_bytes": len(jpeg) * len(names),
+                "ai_tags": [],
+                "ai_objects": [],
+                "ai_confidence": [],
+            }
+            with open(os.path.join(event_dir, "event.json"), "w") as f:
+                json.dump(meta, f, ensure_ascii=False, indent=2)
+            count += 1
+    return count
+
+
+def generate(root: str, cameras: int, days: int, events_per_day: int, frames: int, seed: int) -> Dict[str, Any]:
+    rng = random.Random(seed)
+    names = [f"cam{i:02d}" for i in range(1, cameras + 1)]
+    end = datetime.now().replace(minute=0, second=0, microsecond=0)
+    start = (end - timedelta(days=days)).replace(hour=0)
+    jpeg = _tiny_jpeg()
+
+    t0 = time.monotonic()
+    write_config(root, names)
+    stats = {"cameras": cameras, "days": days, "segments": 0, "events": 0}
+    for cam in names:
+        shm = os.path.join(root, "shm", cam)
+        os.makedirs(shm, exist_ok=True)
+        with open(os.path.join(shm, "latest.jpg"), "wb") as f:
+            f.write(jpeg)
+        stats["segments"] += write_records(root, cam, start, end, rng)
+        stats["events"] += write_events(root, cam, start, days, events_per_day, frames, jpeg, rng)
+    stats["generate_sec"] = round(time.monotonic() - t0, 1)
+    with open(os.path.join(root, "bench_tree.json"), "w") as f:
+        json.dump(stats, f, indent=2)
+    return stats
+
+
+# ---------------------------------------------------------
+# In-process load driver
+# ---------------------------------------------------------
+def _stub_ffprobe():
+    # Segments are sparse stubs: answer probes without starting ffprobe
+    from common import video_utils
+    video_utils.probe_video = lambda path: {"duration": float(SEGMENT_SEC), "codec": "h264",
+                                            "width": 1280, "height": 720}
+
+
+class LoadDriver:
+    def __init__(self, client, cameras: List[str], events: List[Dict[str, Any]], days: List[str], seed: int):
+        self.client = client
+        self.cameras = cameras
+        self.events = events
+        self.days = days
+        self.rng = random.Random(seed)
+        self.samples: Dict[str, List[float]] = {name: [] for name in ROUTES}
+        self.errors: Dict[str, int] = {name: 0 for name in ROUTES}
+        self.recording = False
+
+    def _url(self, route: str) -> str:
+        rng = self.rng
+        cam = rng.choice(self.cameras)
+        if route == "cameras":
+            return "/cameras/"
+        if route == "events_latest":
+            return "/events/?limit=60"
+        if route == "events_day":
+            return f"/events/?camera={cam}&date={rng.choice(self.days)}&limit=200"
+        if route == "events_window":
+            hour = rng.randint(0, 22)
+            return (f"/events/?camera={cam}&date={rng.choice(self.days)}"
+                    f"&start_time={hour:02d}0000&end_time={hour + 1:02d}0000&limit=200")
+        if route == "event_frames":
+            ev = rng.choice(self.events)
+            return f"/events/{ev['camera']}/{ev['year']}/{ev['month']}/{ev['event_id']}/frames"
+        return f"/cameras/{cam}/latest"
+
+    async def client_loop(self, stop: asyncio.Event):
+        names, weights = list(ROUTES), list(ROUTES.values())
+        while not stop.is_set():
+            route = self.rng.choices(names, weights)[0]
+            url = self._url(route)
+            t0 = time.perf_counter()
+            try:
+                res = await self.client.get(url)
+                ok = res.status_code < 500
+            except Exception:
+                ok = False
+            if self.recording:
+                if ok:
+                    self.samples[route].append(time.perf_counter() - t0)
+                else:
+                    self.errors[route] += 1
+
+
+async def _drive(args) -> Dict[str, Any]:
+    import httpx
+    import main
+    from common.event_index import get_event_index
+
+    # Build the event index before startup so the app does not rebuild it concurrently
+    index = get_event_index()
+    t0 = time.monotonic()
+    if index.get_info("rebuilt_at") is None:
+        index.rebuild(main.EVENTS_DIR_BASE)
+    rebuild_sec = round(time.monotonic() - t0, 2)
+
+    app = main.app
+    async with app.router.lifespan_context(app):
+        cameras = sorted(os.listdir(main.RECORDS_DIR_BASE))
+        cameras = [c for c in cameras if os.path.isdir(os.path.join(main.RECORDS_DIR_BASE, c))
+                   and not c.startswith(".")]
+        events = await asyncio.to_thread(index.query, limit=5000)
+        days = sorted({ev["event_id"][:8] for ev in events}) or [datetime.now().strftime("%Y%m%d")]
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+            driver = LoadDriver(client, cameras, events, days, args.seed)
+            stop = asyncio.Event()
+            tasks = [asyncio.create_task(driver.client_loop(stop)) for _ in range(args.clients)]
+            await asyncio.sleep(args.warmup)
+            driver.recording = True
+            started = time.monotonic()
+            await asyncio.sleep(args.duration)
+            driver.recording = False
+            elapsed = time.monotonic() - started
+            stop.set()
+            await asyncio.gather(*tasks)
+
+    routes = {}
+    for route, samples in driver.samples.items():
+        ms = [s * 1000 for s in samples]
+        routes[route] = {
+            "n": len(ms),
+            "rps": round(len(ms) / elapsed, 1),
+            "p50_ms": round(statistics.median(ms), 1) if ms else None,
+            "p99_ms": round(percentile(ms, 99), 1) if ms else None,
+            "errors": driver.errors[route],
+        }
+    total = sum(r["n"] for r in routes.values())
+    return {"events_indexed": index.count(), "index_rebuild_sec": rebuild_sec,
+            "throughput_rps": round(total / elapsed, 1), "routes": routes}
+
+
+def run(args) -> Dict[str, Any]:
+    os.environ["NVR_INSTALL_PATHS"] = os.path.join(os.path.abspath(args.root), "etc", "install_paths")
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    _stub_ffprobe()
+    import logging
+    logging.disable(logging.WARNING)    # per-request lookup logs would dominate the profile
+    result = asyncio.run(_drive(args))
+    try:
+        with open(os.path.join(args.root, "bench_tree.json"), "r") as f:
+            result["tree"] = json.load(f)
+    except OSError:
+        result["tree"] = {}
+    return result
+
+
+def print_run(result: Dict[str, Any]):
+    tree = result.get("tree", {})
+    print(f"tree: {tree.get('cameras')} cameras, {tree.get('days')} days, {tree.get('events')} events, "
+          f"{tree.get('segments')} segments; index rebuild {result['index_rebuild_sec']}s")
+    print(f"{'route':<14} {'n':>6} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>6}")
+    for route, r in result["routes"].items():
+        print(f"{route:<14} {r['n']:>6} {r['rps']:>8.1f} {r['p50_ms'] or 0:>8.1f} {r['p99_ms'] or 0:>8.1f} {r['errors']:>6}")
+    print(f"total {result['throughput_rps']} req/s")
+
+
+def sweep(args):
+    results = []
+    for days in [int(d) for d in args.days.split(",")]:
+        root = os.path.join(args.root, f"{args.cameras}cam_{days}d")
+        if not os.path.exists(os.path.join(root, "bench_tree.json")):
+            print(f"Generating {root} ...")
+            stats = generate(root, args.cameras, days, args.events_per_day, args.frames, args.seed)
+            print(f"  {stats['events']} events, {stats['segments']} segments in {stats['generate_sec']}s")
+        cmd = [sys.executable, os.path.abspath(__file__), "run", "--root", root, "--json",
+               "--clients", str(args.clients), "--duration", str(args.duration),
+               "--warmup", str(args.warmup), "--seed", str(args.seed)]
+        print(f"Running load on {root} ...")
+        out = subprocess.run(cmd, check=True, capture_output=True, text=True).stdout
+        results.append(json.loads(out.strip().splitlines()[-1]))
+
+    print()
+    header = f"{'route':<14}" + "".join(f"{str(r['tree'].get('days')) + 'd p50/p99 ms':>20}{'req/s':>8}" for r in results)
+    print(header)
+    for route in ROUTES:
+        line = f"{route:<14}"
+        for r in results:
+            s = r["routes"][route]
+            line += f"{(s['p50_ms'] or 0):>12.1f}/{(s['p99_ms'] or 0):<7.1f}{s['rps']:>8.1f}"
+        print(line)
+    print(f"{'events':<14}" + "".join(f"{r['tree'].get('events', 0):>20}{'':>8}" for r in results))
+    print(f"{'segments':<14}" + "".join(f"{r['tree'].get('segments', 0):>20}{'':>8}" for r in results))
+    print(f"{'total req/s':<14}" + "".join(f"{r['throughput_rps']:>20}{'':>8}" for r in results))
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Synthetic NVR storage and in-process API load test")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    def tree_args(p):
+        p.add_argument("--cameras", type=int, default=4)
+        p.add_argument("--events-per-day", type=int, default=50, help="per camera")
+        p.add_argument("--frames", type=int, default=3, help="JPEG frames per event")
+
+    def load_args(p):
+        p.add_argument("--clients", type=int, default=8, help="concurrent clients")
+        p.add_argument("--duration", type=float, default=10.0, help="measured seconds")
+        p.add_argument("--warmup", type=float, default=2.0, help="unmeasured seconds first")
+
+    p = sub.add_parser("generate", help="build a synthetic tree")
+    p.add_argument("--root", required=True)
+    p.add_argument("--days", type=int, default=30)
+    p.add_argument("--seed", type=int, default=1)
+    tree_args(p)
+
+    p = sub.add_parser("run", help="drive the API against a generated tree")
+    p.add_argument("--root", required=True)
+    p.add_argument("--json", action="store_true", help="print the result as one JSON line")
+    p.add_argument("--seed", type=int, default=1)
+    load_args(p)
+
+    p = sub.add_parser("sweep", help="generate growing trees and run the load on each")
+    p.add_argument("--root", required=True, help="parent directory of the generated trees")
+    p.add_argument("--days", default="1,7,30", help="comma-separated tree sizes in days")
+    p.add_argument("--seed", type=int, default=1)
+    tree_args(p)
+    load_args(p)
+
+    args = parser.parse_args(argv)
+    if args.command == "generate":
+        stats = generate(args.root, args.cameras, args.days, args.events_per_day, args.frames, args.seed)
+        print(json.dumps(stats))
+    elif args.command == "run":
+        result = run(args)
+        if args.json:
+            print(json.dumps(result))
+        else:
+            print_run(result)
+    else:
+        sweep(args)
+
+
+if __name__ == "__main__":
+    main()
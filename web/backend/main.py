@@ -1,5 +1,8 @@
 import logging
 import os
+import threading
+import time
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from api.routers import cameras, events, system, stream
@@ -11,9 +14,51 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-from common.config_loader import NVR_BASE_DIR, NVR_CONFIG_DIR
+from common.config_loader import NVR_BASE_DIR, NVR_CONFIG_DIR, EVENTS_DIR_BASE, RECORDS_DIR_BASE
+from common.event_index import get_event_index
+from common.segment_index import get_segment_index
+from api.blocking import configure_default_threads
+from api.metrics import LatencyMiddleware
+
+# How often the records directories are checked for finalized segments
+SEGMENT_WATCH_INTERVAL = 10
+
+def _build_event_index_if_missing():
+    """
+    Build the event index from the event tree the first time the API starts.
+    Afterwards the event handlers keep it up to date incrementally.
+    """
+    index = get_event_index()
+    try:
+        if index.get_info("rebuilt_at") is None:
+            logger.info("Event index not built yet. Rebuilding from event tree...")
+            index.rebuild(EVENTS_DIR_BASE)
+    except Exception as e:
+        logger.error(f"Failed to build event index: {e}")
+
+def _watch_recordings():
+    """
+    Keep the segment indexes fresh so finalized segments are probed in the
+    background (duration cache) before any request asks for them.
+    """
+    while True:
+        try:
+            for cam in os.listdir(RECORDS_DIR_BASE):
+                if os.path.isdir(os.path.join(RECORDS_DIR_BASE, cam)):
+                    get_segment_index(cam).refresh()
+        except Exception as e:
+            logger.error(f"Segment watch failed: {e}")
+        time.sleep(SEGMENT_WATCH_INTERVAL)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    configure_default_threads()
+    threading.Thread(target=_build_event_index_if_missing, daemon=True).start()
+    threading.Thread(target=_watch_recordings, daemon=True).start()
+    yield
 
 app = FastAPI(
+    lifespan=lifespan,
     title="NVR Web API",
     description="API for Home NVR System",
     version="1.0.0",
@@ -38,6 +83,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Request latency histograms (GET /system/metrics)
+app.add_middleware(LatencyMiddleware)
+
 # Include Routers
 app.include_router(system.router, prefix="/system", tags=["System"])
 app.include_router(cameras.router, prefix="/cameras", tags=["Cameras"])
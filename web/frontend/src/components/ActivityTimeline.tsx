@@ -0,0 +1,82 @@
+import { useEffect, useState } from 'react';
+
+interface ActivityTimelineProps {
+    date: string; // YYYY-MM-DD, '' = today
+    camera?: string;
+    minutesPerBar?: number;
+    onSelect?: (startTime: string, endTime: string) => void; // HH:MM (end inclusive)
+}
+
+interface CameraActivity {
+    events: number[];
+    motion_sec: number[];
+}
+
+interface Timeline {
+    bucket_sec: number;
+    buckets: number;
+    cameras: Record<string, CameraActivity>;
+}
+
+const pad = (n: number) => String(n).padStart(2, '0');
+const hhmm = (minutes: number) => `${pad(Math.floor(minutes / 60))}:${pad(minutes % 60)}`;
+
+// Motion seconds of one day as a bar strip, from the precomputed activity
+// aggregates (one small request instead of listing every event).
+// Clicking a bar selects its time range.
+export function ActivityTimeline({ date, camera, minutesPerBar = 10, onSelect }: ActivityTimelineProps) {
+    const [timeline, setTimeline] = useState<Timeline | null>(null);
+
+    useEffect(() => {
+        let cancelled = false;
+        const params = new URLSearchParams({ resolution: 'minute' });
+        if (date) params.append('date', date.replace(/-/g, ''));
+        if (camera) params.append('camera', camera);
+        fetch(`/nvr/api/events/timeline?${params.toString()}`)
+            .then(res => res.json())
+            .then(data => { if (!cancelled) setTimeline(data); })
+            .catch(err => console.error("Failed to fetch timeline", err));
+        return () => { cancelled = true; };
+    }, [date, camera]);
+
+    if (!timeline) return null;
+
+    // Sum all cameras, then group minutes into bars
+    const bars: { motion: number; events: number }[] = [];
+    for (let i = 0; i < timeline.buckets; i++) {
+        const bar = Math.floor(i / minutesPerBar);
+        if (!bars[bar]) bars[bar] = { motion: 0, events: 0 };
+        for (const series of Object.values(timeline.cameras)) {
+            bars[bar].motion += series.motion_sec[i];
+            bars[bar].events += series.events[i];
+        }
+    }
+    const peak = Math.max(1, ...bars.map(b => b.motion));
+
+    return (
+        <div className="bg-gray-900/50 p-3 rounded-lg border border-gray-800">
+            <div className="flex items-end h-12 gap-px">
+                {bars.map((bar, i) => {
+                    const start = i * minutesPerBar;
+                    const end = Math.min(start + minutesPerBar, timeline.buckets) - 1;
+                    return (
+                        <div
+                            key={i}
+                            onClick={() => { if (bar.events > 0) onSelect?.(hhmm(start), hhmm(end)); }}
+                            title={`${hhmm(start)} - ${hhmm(end + 1)}: ${bar.events} events, ${bar.motion}s motion`}
+                            className={`flex-1 h-full flex items-end ${bar.events > 0 ? 'cursor-pointer group' : ''}`}
+                        >
+                            <div
+                                className="w-full bg-blue-500/70 group-hover:bg-blue-400 rounded-t-sm"
+                                style={{ height: bar.motion > 0 ? `${Math.max(8, (bar.motion / peak) * 100)}%` : bar.events > 0 ? '8%' : '0' }}
+                            />
+                        </div>
+                    );
+                })}
+            </div>
+            <div className="flex justify-between text-[10px] text-gray-600 font-mono mt-1">
+                {[0, 6, 12, 18, 24].map(h => <span key={h}>{pad(h)}:00</span>)}
+            </div>
+        </div>
+    );
+}
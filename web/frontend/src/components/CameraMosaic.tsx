@@ -0,0 +1,87 @@
+import { useState, useEffect, useRef } from 'react';
+
+interface CameraMosaicProps {
+    tileWidth?: number;
+    refreshInterval?: number;
+    onSelect?: (cameraName: string) => void;
+}
+
+interface MosaicLayout {
+    cameras: string[];
+    columns: number;
+}
+
+// All enabled cameras in one server-composed image. Polls with
+// If-None-Match (the browser revalidates the ETag), so an unchanged
+// mosaic costs a 304 instead of one image per camera.
+export function CameraMosaic({ tileWidth = 320, refreshInterval = 1000, onSelect }: CameraMosaicProps) {
+    const [imageUrl, setImageUrl] = useState<string | null>(null);
+    const [layout, setLayout] = useState<MosaicLayout | null>(null);
+    const [error, setError] = useState(false);
+    const etagRef = useRef<string | null>(null);
+
+    useEffect(() => {
+        let cancelled = false;
+        let objectUrl: string | null = null;
+
+        const poll = async () => {
+            try {
+                const res = await fetch(`/nvr/api/cameras/mosaic?width=${tileWidth}`, { cache: 'no-cache' });
+                if (!res.ok) throw new Error(`HTTP ${res.status}`);
+                const etag = res.headers.get('ETag');
+                if (cancelled || (etag && etag === etagRef.current)) return;
+                const blob = await res.blob();
+                if (cancelled) return;
+                etagRef.current = etag;
+                if (objectUrl) URL.revokeObjectURL(objectUrl);
+                objectUrl = URL.createObjectURL(blob);
+                setImageUrl(objectUrl);
+                setLayout({
+                    cameras: (res.headers.get('X-Mosaic-Cameras') || '').split(',').filter(Boolean),
+                    columns: Number(res.headers.get('X-Mosaic-Columns')) || 1,
+                });
+                setError(false);
+            } catch (err) {
+                if (!cancelled) setError(true);
+            }
+        };
+
+        poll();
+        const timer = setInterval(poll, refreshInterval);
+        return () => {
+            cancelled = true;
+            clearInterval(timer);
+            if (objectUrl) URL.revokeObjectURL(objectUrl);
+            etagRef.current = null;
+        };
+    }, [tileWidth, refreshInterval]);
+
+    const handleClick = (e: React.MouseEvent<HTMLImageElement>) => {
+        if (!layout || !onSelect) return;
+        const rect = e.currentTarget.getBoundingClientRect();
+        const rows = Math.ceil(layout.cameras.length / layout.columns);
+        const col = Math.floor(((e.clientX - rect.left) / rect.width) * layout.columns);
+        const row = Math.floor(((e.clientY - rect.top) / rect.height) * rows);
+        const camera = layout.cameras[row * layout.columns + col];
+        if (camera) onSelect(camera);
+    };
+
+    return (
+        <div className="relative bg-black rounded-lg overflow-hidden border border-gray-700">
+            {error && !imageUrl ? (
+                <div className="aspect-video flex items-center justify-center text-gray-500 bg-gray-900">
+                    Mosaic not available
+                </div>
+            ) : imageUrl ? (
+                <img
+                    src={imageUrl}
+                    alt="All cameras"
+                    className={`w-full h-auto ${onSelect ? 'cursor-pointer' : ''}`}
+                    onClick={handleClick}
+                />
+            ) : (
+                <div className="aspect-video bg-gray-900 animate-pulse"></div>
+            )}
+        </div>
+    );
+}
@@ -8,17 +8,27 @@ interface CameraPreviewProps {
 export function CameraPreview({ cameraName, refreshInterval = 1000 }: CameraPreviewProps) {
     const [timestamp, setTimestamp] = useState(Date.now());
     const [error, setError] = useState(false);
+    // MJPEG live stream first; fall back to polling latest.jpg if it fails
+    const [useStream, setUseStream] = useState(true);
 
     useEffect(() => {
+        setUseStream(true);
+        setError(false);
+    }, [cameraName]);
+
+    useEffect(() => {
+        if (useStream) return;
         const timer = setInterval(() => {
             setTimestamp(Date.now());
             setError(false);
         }, refreshInterval);
 
         return () => clearInterval(timer);
-    }, [refreshInterval, cameraName]);
+    }, [refreshInterval, cameraName, useStream]);
 
-    const imageUrl = `/nvr/api/cameras/${cameraName}/latest?t=${timestamp}`;
+    const imageUrl = useStream
+        ? `/nvr/api/stream/live/${cameraName}`
+        : `/nvr/api/cameras/${cameraName}/latest?t=${timestamp}`;
 
     return (
         <div className="relative aspect-video bg-black rounded-lg overflow-hidden group border border-gray-700">
@@ -31,7 +41,7 @@ export function CameraPreview({ cameraName, refreshInterval = 1000 }: CameraPrev
                     src={imageUrl}
                     alt={`Live view of ${cameraName}`}
                     className="w-full h-full object-contain"
-                    onError={() => setError(true)}
+                    onError={() => (useStream ? setUseStream(false) : setError(true))}
                 />
             )}
             <div className="absolute top-2 left-2 bg-black/50 px-2 py-1 rounded text-xs text-white backdrop-blur-sm">
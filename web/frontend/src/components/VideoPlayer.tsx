@@ -11,8 +11,10 @@ export function VideoPlayer({ cameraName, filename, startOffset = 0, onClose }:
     const videoRef = useRef<HTMLVideoElement>(null);
     const [playTime, setPlayTime] = useState(0);
 
-    // URL to the streaming endpoint with optional start offset
-    const videoUrl = `/nvr/api/stream/playback/${cameraName}/${filename}${startOffset > 0 ? `?ss=${startOffset}` : ''}`;
+    // URL to the streaming endpoint with optional start offset.
+    // Cached recordings are served whole and seek via the #t= fragment;
+    // the segment still being recorded is streamed from ?ss= on the same timeline.
+    const videoUrl = `/nvr/api/stream/playback/${cameraName}/${filename}${startOffset > 0 ? `?ss=${startOffset}#t=${startOffset}` : ''}`;
 
     // Parse start time from filename (YYYYMMDD_HHMMSS.mkv)
     const getStartTime = () => {
@@ -26,7 +28,8 @@ export function VideoPlayer({ cameraName, filename, startOffset = 0, onClose }:
 
     const formatTimecode = (seconds: number) => {
         if (!startTime) return "";
-        const current = new Date(startTime.getTime() + (seconds + startOffset) * 1000);
+        // currentTime is already relative to the start of the segment
+        const current = new Date(startTime.getTime() + seconds * 1000);
         return current.toLocaleString('ja-JP', {
             year: 'numeric',
             month: '2-digit',
@@ -1,11 +1,15 @@
 import { useEffect, useState } from 'react';
 import { Layout } from '../layouts/Layout';
 import { CameraPreview } from '../components/CameraPreview';
+import { CameraMosaic } from '../components/CameraMosaic';
 
 interface Camera {
     name: string;
     enabled: boolean;
     status: string;
+    health?: 'running' | 'stalled' | 'stopped' | 'unknown';
+    frame_age_sec?: number | null;
+    segment_age_sec?: number | null;
     [key: string]: any;
 }
 
@@ -23,6 +27,7 @@ export function Dashboard() {
     const [status, setStatus] = useState<SystemStatus | null>(null);
     const [cameras, setCameras] = useState<Camera[]>([]);
     const [selectedCamera, setSelectedCamera] = useState<string | null>(null);
+    const [showAll, setShowAll] = useState(false);
 
     useEffect(() => {
         const fetchData = () => {
@@ -93,18 +98,26 @@ export function Dashboard() {
                             {cameras.map(cam => (
                                 <button
                                     key={cam.name}
-                                    onClick={() => setSelectedCamera(cam.name)}
+                                    onClick={() => {
+                                        setSelectedCamera(cam.name);
+                                        setShowAll(false);
+                                    }}
                                     className={`w-full text-left p-3 rounded-lg border transition-all flex items-center justify-between ${selectedCamera === cam.name
                                         ? 'bg-blue-600/20 border-blue-500 text-blue-100'
                                         : 'bg-gray-900/50 border-gray-700 text-gray-400 hover:border-gray-500'
                                         }`}
                                 >
                                     <div className="flex items-center space-x-2">
-                                        <span className={`w-2 h-2 rounded-full ${cam.status === 'active' ? 'bg-green-500' : 'bg-gray-600'}`}></span>
+                                        <span className={`w-2 h-2 rounded-full ${cam.status !== 'active' ? 'bg-gray-600' : cam.health === 'stalled' ? 'bg-yellow-500' : 'bg-green-500'}`}></span>
                                         <span className="font-medium">{cam.name}</span>
                                     </div>
-                                    {cam.status !== 'active' && (
+                                    {cam.status !== 'active' ? (
                                         <span className="text-[10px] uppercase font-mono bg-gray-700 px-1.5 py-0.5 rounded text-gray-400">offline</span>
+                                    ) : cam.health === 'stalled' && (
+                                        <span
+                                            className="text-[10px] uppercase font-mono bg-yellow-900/50 px-1.5 py-0.5 rounded text-yellow-300"
+                                            title={`Last frame ${cam.frame_age_sec ?? '-'}s ago, last segment write ${cam.segment_age_sec ?? '-'}s ago`}
+                                        >stalled</span>
                                     )}
                                 </button>
                             ))}
@@ -120,14 +133,30 @@ export function Dashboard() {
                     <div className="bg-gray-800 rounded-xl p-6 border border-gray-700 shadow-sm min-h-[400px]">
                         <div className="flex items-center justify-between mb-4">
                             <h2 className="text-lg font-semibold text-gray-200">Live Preview</h2>
-                            {selectedCamera && (
-                                <div className="text-sm text-gray-400 flex items-center space-x-2">
+                            <div className="text-sm text-gray-400 flex items-center space-x-3">
+                                {selectedCamera && !showAll && (
                                     <span>Camera: <b className="text-gray-200">{selectedCamera}</b></span>
-                                </div>
-                            )}
+                                )}
+                                <button
+                                    onClick={() => setShowAll(!showAll)}
+                                    className={`px-3 py-1 rounded border text-xs transition ${showAll
+                                        ? 'bg-blue-600/20 border-blue-500 text-blue-100'
+                                        : 'bg-gray-900/50 border-gray-700 text-gray-400 hover:border-gray-500'
+                                        }`}
+                                >
+                                    All Cameras
+                                </button>
+                            </div>
                         </div>
 
-                        {selectedCamera ? (
+                        {showAll ? (
+                            <CameraMosaic
+                                onSelect={(name) => {
+                                    setSelectedCamera(name);
+                                    setShowAll(false);
+                                }}
+                            />
+                        ) : selectedCamera ? (
                             <CameraPreview cameraName={selectedCamera} />
                         ) : (
                             <div className="aspect-video bg-gray-900 rounded-lg flex items-center justify-center text-gray-600 italic border border-dashed border-gray-700">
@@ -137,8 +166,8 @@ export function Dashboard() {
 
                         <div className="mt-4 p-4 bg-blue-900/10 border border-blue-900/20 rounded-lg">
                             <p className="text-xs text-blue-300/80 leading-relaxed">
-                                <b>Live View:</b> Images are automatically refreshed every 1 second.
-                                If the camera is listed as "offline", ensure the ffmpeg service is running.
+                                <b>Live View:</b> A single camera is streamed live; "All Cameras" shows one combined image refreshed every second.
+                                If the camera is listed as "offline", ensure the ffmpeg service is running. "Stalled" means the service is running but no new frames or recordings are being written.
                             </p>
                         </div>
                     </div>
@@ -1,6 +1,7 @@
 import { useEffect, useState } from 'react';
 import { Layout } from '../layouts/Layout';
 import { VideoPlayer } from '../components/VideoPlayer';
+import { ActivityTimeline } from '../components/ActivityTimeline';
 
 interface Event {
     event_id: string;
@@ -15,6 +16,13 @@ interface Event {
     start_offset: number;
 }
 
+// Contact sheet: every frame of an event tiled into one image (row-major)
+interface ContactSheet {
+    url: string;
+    frames: number;
+    columns: number;
+}
+
 export function Events() {
     const [events, setEvents] = useState<Event[]>([]);
     const [loading, setLoading] = useState(true);
@@ -26,19 +34,43 @@ export function Events() {
     const [filterEndTime, setFilterEndTime] = useState<string>(''); // HH:MM
     const [eventFrames, setEventFrames] = useState<string[]>([]);
     const [enlargedImage, setEnlargedImage] = useState<string | null>(null);
+    const [contactSheet, setContactSheet] = useState<ContactSheet | null>(null);
 
-    const fetchEvents = () => {
+    // Query of the list shown (without cursor) and the cursor of its next page
+    const [listQuery, setListQuery] = useState<string>('');
+    const [nextCursor, setNextCursor] = useState<string | null>(null);
+    const [loadingMore, setLoadingMore] = useState(false);
+
+    // times: a range picked on the timeline (state updates are not visible yet)
+    const fetchEvents = (times?: { date: string; start: string; end: string }) => {
         setLoading(true);
+        const date = times ? times.date : filterDate;
+        const startTime = times ? times.start : filterStartTime;
+        const endTime = times ? times.end : filterEndTime;
         const params = new URLSearchParams();
         if (filterCamera) params.append('camera', filterCamera);
-        if (filterDate) params.append('date', filterDate.replace(/-/g, ''));
-        if (filterStartTime) params.append('start_time', filterStartTime.replace(/:/g, '') + '00');
-        if (filterEndTime) params.append('end_time', filterEndTime.replace(/:/g, '') + '59');
+        if (date) {
+            // Local date-time range; an end before the start runs into the next day
+            const since = new Date(`${date}T${startTime || '00:00'}:00`);
+            const until = new Date(`${date}T${endTime || '23:59'}:00`);
+            if (until < since) until.setDate(until.getDate() + 1);
+            until.setMinutes(until.getMinutes() + 1);
+            params.append('since', since.toISOString());
+            params.append('until', until.toISOString());
+        } else {
+            if (startTime) params.append('start_time', startTime.replace(/:/g, '') + '00');
+            if (endTime) params.append('end_time', endTime.replace(/:/g, '') + '59');
+        }
         params.append('limit', '60');
+        const query = params.toString();
 
-        fetch(`/nvr/api/events/?${params.toString()}`)
-            .then(res => res.json())
+        fetch(`/nvr/api/events/?${query}`)
+            .then(res => {
+                setNextCursor(res.headers.get('X-Next-Cursor'));
+                return res.json();
+            })
             .then(data => {
+                setListQuery(query);
                 setEvents(data);
                 setLoading(false);
             })
@@ -48,6 +80,27 @@ export function Events() {
             });
     };
 
+    // Next page of the same query (keyset cursor: as cheap as the first page)
+    const loadMore = () => {
+        if (!nextCursor) return;
+        setLoadingMore(true);
+        const params = new URLSearchParams(listQuery);
+        params.append('cursor', nextCursor);
+        fetch(`/nvr/api/events/?${params.toString()}`)
+            .then(res => {
+                setNextCursor(res.headers.get('X-Next-Cursor'));
+                return res.json();
+            })
+            .then(data => {
+                setEvents(prev => [...prev, ...data]);
+                setLoadingMore(false);
+            })
+            .catch(err => {
+                console.error("Failed to fetch more events", err);
+                setLoadingMore(false);
+            });
+    };
+
     useEffect(() => {
         fetchEvents();
 
@@ -61,15 +114,51 @@ export function Events() {
     }, []);
 
     const fetchEventFrames = (ev: Event) => {
-        fetch(`/nvr/api/events/${ev.camera}/${ev.year}/${ev.month}/${ev.event_id}/frames`)
-            .then(res => res.json())
-            .then(setEventFrames)
+        const base = `/nvr/api/events/${ev.camera}/${ev.year}/${ev.month}/${ev.event_id}`;
+        // The frame list and its contact sheet share the same /frames order
+        Promise.all([
+            fetch(`${base}/frames`).then(res => res.json()),
+            fetch(`${base}/sheet`)
+                .then(async res => {
+                    if (!res.ok) return null;
+                    const frames = Number(res.headers.get('X-Sheet-Frames'));
+                    const columns = Number(res.headers.get('X-Sheet-Columns'));
+                    const blob = await res.blob();
+                    return { url: URL.createObjectURL(blob), frames, columns };
+                })
+                .catch(() => null), // Fall back to one request per frame
+        ])
+            .then(([frames, sheet]) => {
+                setEventFrames(frames);
+                setContactSheet(sheet);
+            })
             .catch(err => console.error("Failed to fetch frames", err));
     };
 
+    // Release the previous sheet's object URL when it is replaced
+    useEffect(() => {
+        return () => {
+            if (contactSheet) URL.revokeObjectURL(contactSheet.url);
+        };
+    }, [contactSheet]);
+
+    const sheetTileStyle = (index: number): React.CSSProperties | null => {
+        if (!contactSheet || index >= contactSheet.frames) return null;
+        const { url, frames, columns } = contactSheet;
+        const rows = Math.ceil(frames / columns);
+        const col = index % columns;
+        const row = Math.floor(index / columns);
+        return {
+            backgroundImage: `url(${url})`,
+            backgroundSize: `${columns * 100}% ${rows * 100}%`,
+            backgroundPosition: `${columns > 1 ? (col / (columns - 1)) * 100 : 0}% ${rows > 1 ? (row / (rows - 1)) * 100 : 0}%`,
+        };
+    };
+
     const handleEventSelect = (ev: Event) => {
         setSelectedEvent(ev);
         setEventFrames([]); // Clear old frames
+        setContactSheet(null);
         setEnlargedImage(null);
         fetchEventFrames(ev);
     };
@@ -144,7 +233,7 @@ export function Events() {
                         </div>
 
                         <button
-                            onClick={fetchEvents}
+                            onClick={() => fetchEvents()}
                             className="bg-blue-600 hover:bg-blue-500 text-white px-4 py-1.5 rounded text-sm font-medium transition shadow-lg shadow-blue-900/20"
                         >
                             Apply Filters
@@ -170,6 +259,20 @@ export function Events() {
                     </div>
                 </div>
 
+                <ActivityTimeline
+                    date={filterDate}
+                    camera={filterCamera}
+                    onSelect={(start, end) => {
+                        // The timeline shows today when no date is set
+                        const now = new Date();
+                        const date = filterDate || `${now.getFullYear()}-${String(now.getMonth() + 1).padStart(2, '0')}-${String(now.getDate()).padStart(2, '0')}`;
+                        setFilterDate(date);
+                        setFilterStartTime(start);
+                        setFilterEndTime(end);
+                        fetchEvents({ date, start, end });
+                    }}
+                />
+
                 {loading ? (
                     <div className="grid grid-cols-1 md:grid-cols-2 lg:grid-cols-3 xl:grid-cols-4 gap-4">
                         {[...Array(8)].map((_, i) => (
@@ -184,7 +287,7 @@ export function Events() {
                     <div className="grid grid-cols-1 md:grid-cols-2 lg:grid-cols-3 xl:grid-cols-4 gap-4">
                         {events.map((ev) => (
                             <div
-                                key={ev.event_id}
+                                key={`${ev.camera}/${ev.event_id}`}
                                 onClick={() => handleEventSelect(ev)}
                                 className={`bg-gray-800 rounded-lg overflow-hidden border border-gray-700 transition-all group relative hover:border-blue-500 cursor-pointer`}
                             >
@@ -242,6 +345,18 @@ export function Events() {
                         ))}
                     </div>
                 )}
+
+                {!loading && nextCursor && (
+                    <div className="flex justify-center">
+                        <button
+                            onClick={loadMore}
+                            disabled={loadingMore}
+                            className="bg-gray-800 hover:bg-gray-700 disabled:opacity-50 px-6 py-2 rounded border border-gray-700 text-sm text-gray-300 hover:text-white transition"
+                        >
+                            {loadingMore ? 'Loading...' : 'Load more'}
+                        </button>
+                    </div>
+                )}
             </div>
 
             {/* Event Detail Modal */}
@@ -310,20 +425,32 @@ export function Events() {
                                     <span className="text-[10px] bg-gray-800 px-2 py-0.5 rounded text-gray-500">{eventFrames.length} total</span>
                                 </h4>
                                 <div className="grid grid-cols-3 sm:grid-cols-4 md:grid-cols-5 lg:grid-cols-6 gap-3">
-                                    {eventFrames.map((frame) => (
-                                        <div
-                                            key={frame}
-                                            onClick={() => setEnlargedImage(frame)}
-                                            className={`aspect-video bg-gray-800 rounded-md overflow-hidden border-2 cursor-pointer transition-all hover:scale-105 ${enlargedImage === frame ? 'border-blue-500 shadow-lg shadow-blue-900/40' : 'border-transparent hover:border-gray-600'}`}
-                                        >
-                                            <img
-                                                src={`/nvr/api/events/${selectedEvent.camera}/${selectedEvent.year}/${selectedEvent.month}/${selectedEvent.event_id}/frame/${frame}`}
-                                                alt={frame}
-                                                className="w-full h-full object-cover"
-                                                loading="lazy"
-                                            />
-                                        </div>
-                                    ))}
+                                    {eventFrames.map((frame, index) => {
+                                        const tileStyle = sheetTileStyle(index);
+                                        return (
+                                            <div
+                                                key={frame}
+                                                onClick={() => setEnlargedImage(frame)}
+                                                className={`aspect-video bg-gray-800 rounded-md overflow-hidden border-2 cursor-pointer transition-all hover:scale-105 ${enlargedImage === frame ? 'border-blue-500 shadow-lg shadow-blue-900/40' : 'border-transparent hover:border-gray-600'}`}
+                                            >
+                                                {tileStyle ? (
+                                                    <div
+                                                        role="img"
+                                                        aria-label={frame}
+                                                        className="w-full h-full"
+                                                        style={tileStyle}
+                                                    />
+                                                ) : (
+                                                    <img
+                                                        src={`/nvr/api/events/${selectedEvent.camera}/${selectedEvent.year}/${selectedEvent.month}/${selectedEvent.event_id}/frame/${frame}`}
+                                                        alt={frame}
+                                                        className="w-full h-full object-cover"
+                                                        loading="lazy"
+                                                    />
+                                                )}
+                                            </div>
+                                        );
+                                    })}
                                     {eventFrames.length === 0 && (
                                         <div className="col-span-full h-24 flex items-center justify-center text-gray-700 bg-gray-900/30 rounded-lg border border-dashed border-gray-800 italic text-sm">
                                             Loading frames...